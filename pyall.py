@@ -8,13 +8,18 @@
 # See readme.md for more details
 
 import ctypes
-import math
+import mmap
 import pprint
 import struct
 import os.path
+import tempfile
 import time
+import zipfile
+from collections import defaultdict
+from collections import deque
 from datetime import datetime
 from datetime import timedelta
+import numpy as np
 
 def main():
 	#open the ALL file for reading by creating a new ALLReader class and passin in the filename to open.
@@ -125,29 +130,58 @@ class ALLReader:
 	ALLPacketHeader_fmt = '=LBBHLL'
 	ALLPacketHeader_len = struct.calcsize(ALLPacketHeader_fmt)
 	ALLPacketHeader_unpack = struct.Struct(ALLPacketHeader_fmt).unpack_from
-
-	def __init__(self, ALLfileName):
+	# the datagram shells also keep the counter and serial number which follow the common header in every datagram
+	ALLDatagramHeader_fmt = '=LBBHLLHH'
+	ALLDatagramHeader_len = struct.calcsize(ALLDatagramHeader_fmt)
+	ALLDatagramHeader_unpack = struct.Struct(ALLDatagramHeader_fmt).unpack_from
+	# the index also records the counter which follows the common header in every datagram
+	ALLIndexHeader_fmt = '=LBBHLLH'
+	ALLIndexHeader_len = struct.calcsize(ALLIndexHeader_fmt)
+	ALLIndexHeader_unpack = struct.Struct(ALLIndexHeader_fmt).unpack_from
+	ALLIndex_dtype = np.dtype([('offset', '<i8'), ('numberOfBytes', '<u4'), ('typeOfDatagram', 'u1'), ('EMModel', '<u2'), ('RecordDate', '<u4'), ('RecordTime', '<u4'), ('Counter', '<u2')])
+	# the attitude time series from loadAttitude().  time is a unix timestamp, the angles are in degrees and heave is in metres
+	Attitude_dtype = np.dtype([('time', '<f8'), ('status', '<u2'), ('roll', '<f8'), ('pitch', '<f8'), ('heave', '<f8'), ('heading', '<f8')])
+	# the navigation table from loadNavigationTable().  time is a unix timestamp, the positions are in decimal degrees and the speed in m/s
+	Navigation_dtype = np.dtype([('time', '<f8'), ('latitude', '<f8'), ('longitude', '<f8'), ('quality', '<f8'), ('speedOverGround', '<f8'), ('courseOverGround', '<f8'), ('heading', '<f8')])
+
+	def __init__(self, ALLfileName, memoryMap=False, verifyChecksums=False):
 		if not os.path.isfile(ALLfileName):
 			print ("file not found:", ALLfileName)
 		self.fileName = ALLfileName
-		self.fileptr = open(ALLfileName, 'rb')
 		self.fileSize = os.path.getsize(ALLfileName)
+		# a memory mapped file lets us hand out datagrams as memoryview slices, so there are no seeks or copies per datagram.  you cannot map an empty file
+		self.memoryMap = memoryMap and self.fileSize > 0
+		if self.memoryMap:
+			self.fileptr = cMemoryMappedFile(ALLfileName)
+		else:
+			self.fileptr = open(ALLfileName, 'rb')
 		self.recordDate = ""
 		self.recordTime = ""
 		self.recordCounter=0
+		self.indexFileName = ALLfileName + ".idx.npz"
+		self.index = None
+		self.attitudeFileName = ALLfileName + ".att.npz"
+		self.attitude = {}
+		self.navigationFileName = ALLfileName + ".nav.npz"
+		self.navigation = None
+		# when verifying, readDatagram checks the ETX and checksum of every datagram and remembers the (offset, typeOfDatagram) of any which are corrupt
+		self.verifyChecksums = verifyChecksums
+		self.corruptDatagrams = []
 
 	def __str__(self):
 		return pprint.pformat(vars(self))
 
 	def currentRecordDateTime(self):
 		'''return a python date object from the current datagram objects raw date and time fields '''
-		date_object = datetime.strptime(str(self.recordDate), '%Y%m%d') + timedelta(0,self.recordTime)
-		return date_object
+		return to_DateTime(self.recordDate, self.recordTime)
+
+	def currentRecordTimestamp(self):
+		'''return the unix timestamp of the current datagram'''
+		return recordTimestamp(self.recordDate, self.recordTime)
 
 	def to_DateTime(self, recordDate, recordTime):
 		'''return a python date object from a split date and time record'''
-		date_object = datetime.strptime(str(recordDate), '%Y%m%d') + timedelta(0,recordTime)
-		return date_object
+		return to_DateTime(recordDate, recordTime)
 
 	# def to_timestamp(self, dateObject):
 	#	 '''return a unix timestamp from a python date object'''
@@ -174,8 +208,14 @@ class ALLReader:
 		'''read the common header for any datagram'''
 		try:
 			curr = self.fileptr.tell()
-			data = self.fileptr.read(self.ALLPacketHeader_len)
-			s = self.ALLPacketHeader_unpack(data)
+			if self.memoryMap:
+				# slice the header straight from the mapped file, so we do not need to move the file pointer
+				data = self.fileptr.mappedFile[curr:curr + self.ALLDatagramHeader_len]
+			else:
+				data = self.fileptr.read(self.ALLDatagramHeader_len)
+			s = self.ALLDatagramHeader_unpack(data)
+			# the datagram shell keeps the header bytes, so it can answer questions about the header without decoding
+			self.rawHeader = data
 
 			numberOfBytes= s[0]
 			STX			 = s[1]
@@ -187,7 +227,8 @@ class ALLReader:
 			self.recordTime = RecordTime
 
 			# now reset file pointer
-			self.fileptr.seek(curr, 0)
+			if not self.memoryMap:
+				self.fileptr.seek(curr, 0)
 
 			# we need to add 4 bytes as the message does not contain the 4 bytes used to hold the size of the message
 			# trap corrupt datagrams at the end of a file.  We see this in EM2040 systems.
@@ -198,10 +239,14 @@ class ALLReader:
 
 			return numberOfBytes + 4, STX, typeOfDatagram, EMModel, RecordDate, RecordTime
 		except struct.error:
+			self.rawHeader = None
 			return 0,0,0,0,0,0
 
 	def readDatagramBytes(self, offset, byteCount):
 		'''read the entire raw bytes for the datagram without changing the file pointer.  this is used for file conditioning'''
+		if self.memoryMap:
+			# a zero copy slice of the mapped file.  it can be written straight to the output file
+			return self.fileptr.view(offset, byteCount)
 		curr = self.fileptr.tell()
 		self.fileptr.seek(offset, 0)# move the file pointer to the start of the record so we can read from disc
 		data = self.fileptr.read(byteCount)
@@ -209,80 +254,205 @@ class ALLReader:
 		return data
 
 	def getRecordCount(self):
-		'''read through the entire file as fast as possible to get a count of all records.  useful for progress bars so user can see what is happening'''
-		count = 0
-		start = 0
-		end = 0
-		self.rewind()
-		numberOfBytes, STX, typeOfDatagram, EMModel, RecordDate, RecordTime = self.readDatagramHeader()
-		start = to_timestamp(to_DateTime(RecordDate, RecordTime))
-		self.rewind()
-		while self.moreData():
+		'''get a count of all records and the first and last timestamps.  useful for progress bars so user can see what is happening.  this comes straight from the datagram index'''
+		index = self.loadIndex()
+		if len(index) == 0:
+			return 0, 0, 0
+		return len(index), float(self.indexTimestamps[0]), float(self.indexTimestamps[-1])
+
+###############################################################################
+	def buildIndex(self):
+		'''read through the entire file as fast as possible, recording the offset, size, type, model, date, time and counter of every datagram'''
+		curr = self.fileptr.tell()
+		records = []
+		offset = 0
+		while offset + self.ALLPacketHeader_len <= self.fileSize:
+			if self.memoryMap:
+				data = self.fileptr.view(offset, self.ALLIndexHeader_len)
+			else:
+				self.fileptr.seek(offset, 0)
+				data = self.fileptr.read(self.ALLIndexHeader_len)
+			if len(data) < self.ALLIndexHeader_len:
+				data = bytes(data) + bytes(self.ALLIndexHeader_len - len(data))
+			numberOfBytes, STX, typeOfDatagram, EMModel, RecordDate, RecordTime, Counter = self.ALLIndexHeader_unpack(data)
+			# we need to add 4 bytes as the message does not contain the 4 bytes used to hold the size of the message. trap corrupt datagrams at the end of a file.
+			numberOfBytes = min(numberOfBytes + 4, self.fileSize - offset)
+			records.append((offset, numberOfBytes, typeOfDatagram, EMModel, RecordDate, RecordTime, Counter))
+			offset += numberOfBytes
+		self.fileptr.seek(curr, 0)
+		return np.array(records, dtype=self.ALLIndex_dtype)
+
+	def loadIndex(self):
+		'''load the datagram index from the .idx.npz sidecar file.  If the sidecar is missing or out of date with the .all file, build it and save it for next time'''
+		if self.index is not None:
+			return self.index
+		cache = loadCache(self.indexFileName, self.fileName)
+		if cache is not None and 'index' in cache:
+			self.index = cache['index']
+		else:
+			self.index = self.buildIndex()
+			saveCache(self.indexFileName, self.fileName, index=self.index)
+		self.indexTimestamps = to_timestamps(self.index['RecordDate'], self.index['RecordTime'] / 1000.0)
+		# datagrams are not strictly in time order, so use the running maximum for time based searches
+		self.indexSearchTimestamps = np.maximum.accumulate(self.indexTimestamps) if len(self.index) > 0 else self.indexTimestamps
+		return self.index
+
+	def readDatagramAt(self, position):
+		'''read the datagram at a position in the index without changing the file pointer'''
+		index = self.loadIndex()
+		curr = self.fileptr.tell()
+		self.fileptr.seek(int(index['offset'][position]), 0)
+		typeOfDatagram, datagram = self.readDatagram()
+		self.fileptr.seek(curr, 0)
+		return typeOfDatagram, datagram
+
+	def firstRecord(self):
+		'''return the first datagram in the file using the index'''
+		return self.readDatagramAt(0)
+
+	def lastRecord(self):
+		'''return the last datagram in the file using the index'''
+		return self.readDatagramAt(-1)
+
+	def seekTime(self, timestamp):
+		'''move the file pointer to the first datagram at or after the unix timestamp so the next readDatagram() starts from there.  returns the position in the index'''
+		index = self.loadIndex()
+		position = int(np.searchsorted(self.indexSearchTimestamps, timestamp, side='left'))
+		if position < len(index):
+			self.fileptr.seek(int(index['offset'][position]), 0)
+		else:
+			self.fileptr.seek(self.fileSize, 0)
+		return position
+
+	def datagramsOfType(self, types):
+		'''iterate through only the datagrams of the requested types, e.g. 'AhP', using the index to jump straight to them.  yields the same typeOfDatagram, datagram pair as readDatagram()'''
+		index = self.loadIndex()
+		selected = index['offset'][np.isin(index['typeOfDatagram'], typeCodes(types))]
+		for offset in selected:
+			self.fileptr.seek(int(offset), 0)
+			yield self.readDatagram()
+
+	def keptRuns(self, exclude=""):
+		'''return the start offsets and byte counts of each run of consecutive datagrams which are not one of the excluded types, e.g. 'nYNC0'.  This comes straight from the index, so no datagram is read'''
+		index = self.loadIndex()
+		kept = ~np.isin(index['typeOfDatagram'], typeCodes(exclude))
+		# a run starts where a kept datagram follows an excluded one and finishes where an excluded one follows a kept one
+		edges = np.diff(np.concatenate(([False], kept, [False])).astype(np.int8))
+		starts = np.flatnonzero(edges == 1)
+		last = np.flatnonzero(edges == -1) - 1
+		offsets = index['offset'][starts]
+		byteCounts = index['offset'][last] + index['numberOfBytes'][last] - offsets
+		return offsets, byteCounts
+
+	def iter(self, types=None, start=None, end=None, stop=None):
+		'''stream through the file from the current position, yielding only the datagrams of the requested types, e.g. 'AhP', which are between the optional start and end unix timestamps.  Datagrams we do not want are skipped using just the common header, so no datagram object is made for them.  The datagrams are not decoded, so call read() on the ones you need.  If stop is given, we finish at that byte offset rather than the end of the file'''
+		wanted = None if types is None else set(types)
+		if wanted is not None and len(wanted) == 0:
+			# nothing is wanted, so there is no need to walk the file
+			return
+		midnights = {}
+		while self.moreData() > 0 and (stop is None or self.fileptr.tell() < stop):
+			curr = self.fileptr.tell()
 			numberOfBytes, STX, typeOfDatagram, EMModel, RecordDate, RecordTime = self.readDatagramHeader()
-			self.fileptr.seek(numberOfBytes, 1)
-			count += 1
-		self.rewind()
-		end = to_timestamp(to_DateTime(RecordDate, RecordTime))
-		return count, start, end
+			if numberOfBytes == 0:
+				break
+			selected = wanted is None or typeOfDatagram in wanted
+			if selected and (start is not None or end is not None):
+				# only work out the timestamp once the type matches.  every record in a day shares the same midnight
+				if RecordDate not in midnights:
+					midnights[RecordDate] = float(to_timestamps([RecordDate], [0])[0])
+				timestamp = midnights[RecordDate] + RecordTime
+				selected = (start is None or timestamp >= start) and (end is None or timestamp <= end)
+			if selected:
+				yield self.readDatagram()
+			# the caller may have moved the file pointer while decoding, so always step to the next datagram from here
+			self.fileptr.seek(curr + numberOfBytes, 0)
+
+	def iterRange(self, startOffset, stopOffset, types=None):
+		'''stream through the datagrams which start in the byte range startOffset:stopOffset.  see iter() and chunkRanges()'''
+		self.fileptr.seek(startOffset, 0)
+		return self.iter(types, stop=stopOffset)
+
+	def iterPings(self, types='DXNfYO', lookAhead=16):
+		'''stream through the file from the current position, yielding a cAssembledPing for each ping with the datagrams of the requested types, e.g. 'NY'.  We only wait for the types which are in the file.  see cPingAssembler'''
+		index = self.loadIndex()
+		inFile = set(chr(c) for c in np.unique(index['typeOfDatagram']))
+		assembler = cPingAssembler(set(types) & inFile, lookAhead)
+		for typeOfDatagram, datagram in self.iter(types):
+			for ping in assembler.add(typeOfDatagram, datagram):
+				yield ping
+		for ping in assembler.flush():
+			yield ping
+
+	def datagramsBefore(self, types, offset, count):
+		'''return up to count of the last datagrams of the requested types, e.g. 'N', which start before the byte offset, in file order and without changing the file pointer'''
+		index = self.loadIndex()
+		positions = np.flatnonzero(np.isin(index['typeOfDatagram'], typeCodes(types)) & (index['offset'] < offset))
+		return [self.readDatagramAt(int(position)) for position in positions[-count:]] if count > 0 else []
+
+	def lastDatagramBefore(self, types, offset):
+		'''return the last datagram of the requested types, e.g. 'N', which starts before the byte offset, without changing the file pointer.  Returns None, None if there is not one.  Handy when a chunk of the file needs the state from earlier in the file'''
+		index = self.loadIndex()
+		positions = np.flatnonzero(np.isin(index['typeOfDatagram'], typeCodes(types)) & (index['offset'] < offset))
+		if len(positions) == 0:
+			return None, None
+		return self.readDatagramAt(int(positions[-1]))
+
+###############################################################################
+	def findDatagramStart(self, offset, window=1048576):
+		'''resync onto the first whole datagram which starts at or after the byte offset, without changing the file pointer.  A datagram starts where the length field, the STX byte and the ETX byte 3 bytes from the end all line up, and the next datagram (if there is one) starts with an STX too'''
+		curr = self.fileptr.tell()
+		while offset < self.fileSize:
+			self.fileptr.seek(offset, 0)
+			data = bytes(self.fileptr.read(window + self.ALLPacketHeader_len))
+			candidates = np.flatnonzero(np.frombuffer(data, dtype=np.uint8)[4:] == 2)
+			for p in candidates:
+				start = offset + int(p)
+				numberOfBytes = struct.unpack_from('<L', data, int(p))[0]
+				end = start + numberOfBytes + 4
+				if numberOfBytes < self.ALLPacketHeader_len or end > self.fileSize:
+					continue
+				if self.readDatagramBytes(end - 3, 1)[0] != 3:
+					continue
+				if end + 5 <= self.fileSize and self.readDatagramBytes(end + 4, 1)[0] != 2:
+					continue
+				self.fileptr.seek(curr, 0)
+				return start
+			offset += window
+		self.fileptr.seek(curr, 0)
+		return self.fileSize
+
+	def chunkRanges(self, count):
+		'''cut the file into count byte ranges, each starting on a datagram boundary, so the ranges can be decoded independently, e.g. in parallel.  returns a list of (startOffset, stopOffset) in file order'''
+		starts = [0]
+		for i in range(1, count):
+			start = self.findDatagramStart(max(self.fileSize * i // count, starts[-1]))
+			if start > starts[-1] and start < self.fileSize:
+				starts.append(start)
+		return list(zip(starts, starts[1:] + [self.fileSize]))
 
 	def readDatagram(self):
 		'''read the datagram header.  This permits us to skip datagrams we do not support'''
 		numberOfBytes, STX, typeOfDatagram, EMModel, RecordDate, RecordTime = self.readDatagramHeader()
 		self.recordCounter += 1
 
-		if typeOfDatagram == '3': # 3_EXTRA PARAMETERS DECIMAL 51
-			dg = E_EXTRA(self.fileptr, numberOfBytes)
-			return dg.typeOfDatagram, dg
-		if typeOfDatagram == 'A': # A ATTITUDE
-			dg = A_ATTITUDE(self.fileptr, numberOfBytes)
-			return dg.typeOfDatagram, dg
-		if typeOfDatagram == 'C': # C Clock
-			dg = C_CLOCK(self.fileptr, numberOfBytes)
-			return dg.typeOfDatagram, dg
-		if typeOfDatagram == 'D': # D DEPTH
-			dg = D_DEPTH(self.fileptr, numberOfBytes)
-			return dg.typeOfDatagram, dg
-		if typeOfDatagram == 'f': # f Raw Range
-			dg = f_RAWRANGE(self.fileptr, numberOfBytes)
-			return dg.typeOfDatagram, dg
-		if typeOfDatagram == 'h': # h Height, not to be confused with H_Heading!
-			dg = h_HEIGHT(self.fileptr, numberOfBytes)
-			return dg.typeOfDatagram, dg
-		if typeOfDatagram == 'I': # I Installation (Start)
-			dg = I_INSTALLATION(self.fileptr, numberOfBytes)
-			return dg.typeOfDatagram, dg
-		if typeOfDatagram == 'i': # i Installation (Stop)
-			dg = I_INSTALLATION(self.fileptr, numberOfBytes)
-			dg.typeOfDatagram = 'i' #override with the install stop code
-			return dg.typeOfDatagram, dg
-		if typeOfDatagram == 'n': # n ATTITUDE
-			dg = n_ATTITUDE(self.fileptr, numberOfBytes)
-			return dg.typeOfDatagram, dg
-		if typeOfDatagram == 'N': # N Angle and Travel Time
-			dg = N_TRAVELTIME(self.fileptr, numberOfBytes)
-			return dg.typeOfDatagram, dg
-		if typeOfDatagram == 'O': # O_QUALITYFACTOR
-			dg = O_QUALITYFACTOR(self.fileptr, numberOfBytes)
-			return dg.typeOfDatagram, dg
-		if typeOfDatagram == 'R': # R_RUNTIME
-			dg = R_RUNTIME(self.fileptr, numberOfBytes)
-			return dg.typeOfDatagram, dg
-		if typeOfDatagram == 'P': # P Position
-			dg = P_POSITION(self.fileptr, numberOfBytes)
-			return dg.typeOfDatagram, dg
-		if typeOfDatagram == 'U': # U Sound Velocity
-			dg = U_SVP(self.fileptr, numberOfBytes)
-			return dg.typeOfDatagram, dg
-		if typeOfDatagram == 'X': # X Depth
-			dg = X_DEPTH(self.fileptr, numberOfBytes)
-			return dg.typeOfDatagram, dg
-		if typeOfDatagram == 'Y': # Y_SeabedImage
-			dg = Y_SEABEDIMAGE(self.fileptr, numberOfBytes)
-			return dg.typeOfDatagram, dg
-		else:
+		# look up the class for this datagram type.  see registerDatagram
+		datagramClass = datagramClasses.get(typeOfDatagram)
+		if datagramClass is None:
 			dg = UNKNOWN_RECORD(self.fileptr, numberOfBytes, typeOfDatagram)
-			return dg.typeOfDatagram, dg
-			# self.fileptr.seek(numberOfBytes, 1)
+		else:
+			dg = datagramClass(self.fileptr, numberOfBytes)
+		dg.rawHeader = self.rawHeader
+		if self.verifyChecksums:
+			self.verifyDatagram(dg)
+		return dg.typeOfDatagram, dg
+
+	def verifyDatagram(self, datagram):
+		'''check the ETX and checksum of a datagram.  A corrupt datagram is added to corruptDatagrams.  returns True if the datagram is good'''
+		if verifyChecksum(self.readDatagramBytes(datagram.offset, datagram.numberOfBytes)):
+			return True
+		self.corruptDatagrams.append((datagram.offset, datagram.typeOfDatagram))
+		return False
 ###############################################################################
 	def loadInstallationRecords(self):
 		'''loads all the installation into lists'''
@@ -290,9 +460,7 @@ class ALLReader:
 		installStop = None
 		initialMode = None
 		datagram = None
-		self.rewind()
-		while self.moreData():
-			typeOfDatagram, datagram = self.readDatagram()
+		for typeOfDatagram, datagram in self.datagramsOfType('IiR'):
 			if (typeOfDatagram == 'I'):
 				installStart = self.readDatagramBytes(datagram.offset, datagram.numberOfBytes)
 				datagram.read()
@@ -308,40 +476,132 @@ class ALLReader:
 ###############################################################################
 	def loadCenterFrequency(self):
 		'''determine the central frequency of the first record in the file'''
-		self.rewind()
-		while self.moreData():
-			typeOfDatagram, datagram = self.readDatagram()
+		centerFrequency = 0
+		for typeOfDatagram, datagram in self.datagramsOfType('N'):
 			if (typeOfDatagram == 'N'):
-				datagram.read()
+				datagram.readFields('CentreFrequency')
 				centerFrequency = datagram.CentreFrequency[0]
 				break
 		self.rewind()
 		return centerFrequency
 ###############################################################################
 	def loadNavigation(self, firstRecordOnly=False):
-		'''loads all the navigation into lists'''
-		navigation = []
-		selectedPositioningSystem = None
-		self.rewind()
-		while self.moreData():
-			typeOfDatagram, datagram = self.readDatagram()
-			if (typeOfDatagram == 'P'):
-				datagram.read()
-				recDate = self.currentRecordDateTime()
-				if (selectedPositioningSystem == None):
-					selectedPositioningSystem = datagram.Descriptor
-				if (selectedPositioningSystem == datagram.Descriptor):
-					# for python 2.7
-					navigation.append([to_timestamp(recDate), datagram.Latitude, datagram.Longitude])
-					# for python 3.4
-					# navigation.append([recDate.timestamp(), datagram.Latitude, datagram.Longitude])
-
-					if firstRecordOnly: #we only want the first record, so reset the file pointer and quit
-						self.rewind()
-						return navigation
-		self.rewind()
+		'''loads the navigation from the first positioning system in the file into a list of timestamp, latitude, longitude.  see loadNavigationTable()'''
+		navigation = self.navigationOf()
+		navigation = np.column_stack((navigation['time'], navigation['latitude'], navigation['longitude'])).tolist()
+		if firstRecordOnly:
+			return navigation[:1]
 		return navigation
 
+	def loadNavigationTable(self):
+		'''return the navigation from the 'P' position datagrams as a dictionary of Navigation_dtype arrays, one for each positioning system descriptor in the order the systems first appear in the file.  Everything we need is at a fixed offset ahead of the NMEA string, so we only read those bytes and no datagram is decoded.  The table is kept for the life of the reader and cached in the .nav.npz sidecar, so the file is only scanned once'''
+		if self.navigation is not None:
+			return self.navigation
+		cache = loadCache(self.navigationFileName, self.fileName)
+		if cache is not None and 'descriptors' in cache:
+			self.navigation = {int(descriptor): cache['P%d' % descriptor] for descriptor in cache['descriptors']}
+			return self.navigation
+
+		index = self.loadIndex()
+		header_len = P_POSITION.header_dtype.itemsize
+		positions = np.flatnonzero((index['typeOfDatagram'] == ord('P')) & (index['numberOfBytes'] >= header_len))
+		data = b"".join([self.readDatagramBytes(int(offset), header_len) for offset in index['offset'][positions]])
+		records = np.frombuffer(data, dtype=P_POSITION.header_dtype)
+
+		navigation = np.zeros(len(records), dtype=self.Navigation_dtype)
+		navigation['time'] = recordTimestamps(records['RecordDate'], records['Time'] / 1000.0)
+		navigation['latitude'] = records['Latitude'] / float(20000000)
+		navigation['longitude'] = records['Longitude'] / float(10000000)
+		navigation['quality'] = records['Quality'] / float(100)
+		navigation['speedOverGround'] = records['SpeedOverGround'] / float(100)
+		navigation['courseOverGround'] = records['CourseOverGround'] / float(100)
+		navigation['heading'] = records['Heading'] / float(100)
+
+		descriptors, firstSeen = np.unique(records['Descriptor'], return_index=True)
+		descriptors = descriptors[np.argsort(firstSeen)]
+		self.navigation = {}
+		for descriptor in descriptors:
+			# keep each system in time order so we can binary search it
+			system = navigation[records['Descriptor'] == descriptor]
+			self.navigation[int(descriptor)] = system[np.argsort(system['time'], kind='stable')]
+		saveCache(self.navigationFileName, self.fileName, descriptors=descriptors, **{'P%d' % descriptor: system for descriptor, system in self.navigation.items()})
+		return self.navigation
+
+	def navigationOf(self, descriptor=None):
+		'''return the Navigation_dtype array for a positioning system descriptor.  If no descriptor is given we use the first system in the file.  Returns an empty array if there is no such navigation'''
+		navigation = self.loadNavigationTable()
+		if descriptor is None:
+			descriptor = next(iter(navigation), None)
+		if descriptor not in navigation:
+			return np.zeros(0, dtype=self.Navigation_dtype)
+		return navigation[descriptor]
+
+	def positionAt(self, timestamp, descriptor=None):
+		'''return the latitude and longitude at a unix timestamp, interpolated between the fixes either side of it, using the positioning system with the descriptor (or the first system in the file).  Before the first or after the last fix we return that fix.  Returns None if there is no navigation.  This is a binary search of the navigation table so it is cheap to call for every datagram'''
+		navigation = self.navigationOf(descriptor)
+		if len(navigation) == 0:
+			return None
+		after = int(np.searchsorted(navigation['time'], timestamp, side='right'))
+		if after == 0:
+			return float(navigation['latitude'][0]), float(navigation['longitude'][0])
+		if after == len(navigation):
+			return float(navigation['latitude'][-1]), float(navigation['longitude'][-1])
+		before = navigation[after - 1]
+		after = navigation[after]
+		span = after['time'] - before['time']
+		ratio = 0.0 if span <= 0 else (timestamp - before['time']) / span
+		return float(before['latitude'] + (after['latitude'] - before['latitude']) * ratio), float(before['longitude'] + (after['longitude'] - before['longitude']) * ratio)
+
+	def loadAttitude(self, types='A', startOffset=None, stopOffset=None):
+		'''return the records of the 'A' and/or 'n' attitude datagrams as one Attitude_dtype array.  Each datagram body is converted in one go with np.frombuffer, so no datagram is decoded.  The records are in file order, or time order when both types are asked for.  The whole file is cached in the .att.npz sidecar, so the next run does not read the datagrams at all.  If startOffset and stopOffset are given, we only use the datagrams which start in that byte range and nothing is cached'''
+		index = self.loadIndex()
+		if startOffset is not None:
+			inRange = (index['offset'] >= startOffset) & (index['offset'] < stopOffset)
+			attitude = [self.readAttitude(typeOfDatagram, np.flatnonzero(inRange & (index['typeOfDatagram'] == ord(typeOfDatagram)))) for typeOfDatagram in types]
+		else:
+			missing = [typeOfDatagram for typeOfDatagram in types if typeOfDatagram not in self.attitude]
+			if len(missing) > 0:
+				cache = loadCache(self.attitudeFileName, self.fileName)
+				if cache is None:
+					cache = {}
+				for typeOfDatagram in missing:
+					if typeOfDatagram in cache:
+						self.attitude[typeOfDatagram] = cache[typeOfDatagram]
+					else:
+						self.attitude[typeOfDatagram] = self.readAttitude(typeOfDatagram, np.flatnonzero(index['typeOfDatagram'] == ord(typeOfDatagram)))
+				if any(typeOfDatagram not in cache for typeOfDatagram in missing):
+					# keep whatever the sidecar already holds for the other type
+					arrays = {typeOfDatagram: cache[typeOfDatagram] for typeOfDatagram in 'An' if typeOfDatagram in cache}
+					arrays.update(self.attitude)
+					saveCache(self.attitudeFileName, self.fileName, **arrays)
+			attitude = [self.attitude[typeOfDatagram] for typeOfDatagram in types]
+		if len(attitude) == 1:
+			return attitude[0]
+		attitude = np.concatenate(attitude)
+		return attitude[np.argsort(attitude['time'], kind='stable')]
+
+	def readAttitude(self, typeOfDatagram, positions):
+		'''convert the records of the 'A' or 'n' datagrams at the positions in the index into an Attitude_dtype array.  see loadAttitude()'''
+		index = self.loadIndex()
+		records = []
+		for position in positions:
+			data = self.readDatagramBytes(int(index['offset'][position]), int(index['numberOfBytes'][position]))
+			records.append(attitudeRecords(typeOfDatagram, data))
+		counts = [len(r) for r in records]
+		records = np.concatenate(records) if len(records) > 0 else np.zeros(0, dtype=A_ATTITUDE.rec_dtype)
+
+		attitude = np.zeros(len(records), dtype=self.Attitude_dtype)
+		# each record time is an offset in milliseconds from the time in the datagram header.  add them up like A_ATTITUDE.decode() does
+		recordTimes = np.repeat(index['RecordTime'][positions] / 1000.0, counts) + records['timeMillisecs'] / 1000.0
+		attitude['time'] = recordTimestamps(np.repeat(index['RecordDate'][positions], counts), recordTimes)
+		if 'sensorStatus' in records.dtype.names:
+			attitude['status'] = records['sensorStatus']
+		attitude['roll'] = records['roll'] / 100.0
+		attitude['pitch'] = records['pitch'] / 100.0
+		attitude['heave'] = records['heave'] / 100.0
+		attitude['heading'] = records['heading'] / 100.0
+		return attitude
+
 	def getDatagramName(typeOfDatagram):
 		'''Convert the datagram type from the code to a user readable string.  Handy for displaying to the user'''
 		#Multibeam Data
@@ -397,9 +657,9 @@ class ALLReader:
 			return "I_Installation_Start"
 		if (typeOfDatagram == 'i'):
 			return "i_Installation_Stop"
-		if (typeOfDatagram == R):
+		if (typeOfDatagram == 'R'):
 			return "R_Runtime"
-		if (typeOfDatagram == J):
+		if (typeOfDatagram == 'J'):
 			return "J_TransducerTilt"
 		if (typeOfDatagram == '3'):
 			return "3_ExtraParameters"
@@ -411,7 +671,240 @@ class ALLReader:
 			return "1_PU_Status"
 		if (typeOfDatagram == 'B'):
 			return "B_BIST_Result"
+		return typeOfDatagram + "_Unknown"
+
+
+###############################################################################
+class ALLWriter:
+	'''class to write a Kongsberg .all file.  Datagrams are queued as they are, so memoryview slices straight from a memory mapped ALLReader are never copied, and then written in large blocks using gathered writes.  The file is opened without the default python buffer, as the block queue does that job'''
+	# os.writev will only take so many buffers in one call
+	maxBuffersPerWrite = 1024
 
+	def __init__(self, ALLfileName, blockSize=4194304):
+		self.fileName = ALLfileName
+		self.fileptr = open(ALLfileName, 'wb', buffering=0)
+		self.blockSize = blockSize
+		self.pending = []
+		self.pendingBytes = 0
+		self.bytesWritten = 0
+		self.datagramCount = defaultdict(int)
+		self.datagramBytes = defaultdict(int)
+		self.kernelCopy = hasattr(os, 'copy_file_range') or hasattr(os, 'sendfile')
+
+	def write(self, datagram):
+		'''queue a complete datagram for writing.  It can be bytes, a bytearray or a memoryview of bytes.  The datagram must not be changed until it has been flushed'''
+		byteCount = len(datagram)
+		if byteCount < 6:
+			return 0
+		typeOfDatagram = datagram[5]
+		self.datagramCount[typeOfDatagram] += 1
+		self.datagramBytes[typeOfDatagram] += byteCount
+		self.pending.append(datagram)
+		self.pendingBytes += byteCount
+		if self.pendingBytes >= self.blockSize:
+			# write whole blocks, so the writes stay aligned to the block size.  the remainder waits for the next block
+			self.writeBuffers(self.pendingBytes - (self.pendingBytes % self.blockSize))
+		return byteCount
+
+	def flush(self):
+		'''write everything queued so far'''
+		self.writeBuffers(self.pendingBytes)
+
+	def writeBuffers(self, byteCount):
+		'''write byteCount bytes from the front of the queue in as few system calls as possible'''
+		while byteCount > 0:
+			buffers = []
+			total = 0
+			for buffer in self.pending[:self.maxBuffersPerWrite]:
+				if total + len(buffer) > byteCount:
+					buffer = memoryview(buffer)[:byteCount - total]
+				buffers.append(buffer)
+				total += len(buffer)
+				if total == byteCount:
+					break
+			if hasattr(os, 'writev'):
+				written = os.writev(self.fileptr.fileno(), buffers)
+			else:
+				written = self.fileptr.write(b"".join(buffers))
+			self.consume(written)
+			byteCount -= written
+
+	def consume(self, byteCount):
+		'''drop byteCount written bytes from the front of the queue'''
+		self.pendingBytes -= byteCount
+		self.bytesWritten += byteCount
+		done = 0
+		while byteCount > 0:
+			buffer = self.pending[done]
+			if len(buffer) > byteCount:
+				self.pending[done] = memoryview(buffer)[byteCount:]
+				break
+			byteCount -= len(buffer)
+			done += 1
+		del self.pending[:done]
+
+	def copyDatagrams(self, reader, exclude=""):
+		'''copy every datagram apart from the excluded types, e.g. 'nYNC0', from an ALLReader without decoding them.  Each run of consecutive datagrams we keep is copied in one go.  returns the number of bytes copied'''
+		index = reader.loadIndex()
+		kept = index[~np.isin(index['typeOfDatagram'], typeCodes(exclude))]
+		counts = np.bincount(kept['typeOfDatagram'], minlength=256)
+		byteCounts = np.bincount(kept['typeOfDatagram'], weights=kept['numberOfBytes'], minlength=256)
+		for typeOfDatagram in np.flatnonzero(counts):
+			self.datagramCount[int(typeOfDatagram)] += int(counts[typeOfDatagram])
+			self.datagramBytes[int(typeOfDatagram)] += int(byteCounts[typeOfDatagram])
+
+		copied = 0
+		offsets, byteCounts = reader.keptRuns(exclude)
+		for offset, byteCount in zip(offsets.tolist(), byteCounts.tolist()):
+			copied += self.copyRange(reader, offset, byteCount)
+		return copied
+
+	def copyRange(self, reader, offset, byteCount):
+		'''append byteCount bytes from offset in the reader's file.  Where the OS supports it the copy is done in the kernel with copy_file_range or sendfile, so the bytes never come into python.  Otherwise we read and write a block at a time.  returns the number of bytes copied'''
+		self.flush()
+		source = reader.fileptr.fileno()
+		target = self.fileptr.fileno()
+		remaining = byteCount
+		while remaining > 0:
+			copied = 0
+			if self.kernelCopy:
+				try:
+					if hasattr(os, 'copy_file_range'):
+						copied = os.copy_file_range(source, target, remaining, offset)
+					else:
+						copied = os.sendfile(target, source, offset, remaining)
+				except OSError:
+					# some platforms and file systems will not copy between regular files, so do it ourselves from now on
+					self.kernelCopy = False
+			if copied == 0:
+				data = reader.readDatagramBytes(offset, min(remaining, self.blockSize))
+				if len(data) == 0:
+					break
+				copied = self.fileptr.write(data)
+			offset += copied
+			remaining -= copied
+			self.bytesWritten += copied
+		return byteCount - remaining
+
+	def tell(self):
+		'''the size of the file once everything queued has been written'''
+		return self.bytesWritten + self.pendingBytes
+
+	def close(self):
+		'''write everything queued and close the file'''
+		if not self.fileptr.closed:
+			self.flush()
+			self.fileptr.close()
+
+	def __del__(self):
+		# like a regular file, do not lose what we have queued if the caller never closes us
+		try:
+			self.close()
+		except (AttributeError, OSError, ValueError):
+			pass
+
+	def report(self):
+		'''return a summary of the datagrams and bytes written for each datagram type'''
+		s = "Datagrams written to %s: %d datagrams, %d bytes\n" % (self.fileName, sum(self.datagramCount.values()), self.tell())
+		for typeOfDatagram in sorted(self.datagramCount):
+			s += "  %-24s %10d datagrams %14d bytes\n" % (ALLReader.getDatagramName(chr(typeOfDatagram)), self.datagramCount[typeOfDatagram], self.datagramBytes[typeOfDatagram])
+		return s
+
+###############################################################################
+class cMemoryMappedFile:
+	'''a read only file like object over a memory mapped file.  seek and tell are simple arithmetic, and read returns a memoryview slice of the mapped file rather than a copy, so the datagram decoders run without any system calls'''
+	def __init__(self, fileName):
+		self.fileName = fileName
+		self.fileptr = open(fileName, 'rb')
+		self.mappedFile = mmap.mmap(self.fileptr.fileno(), 0, access=mmap.ACCESS_READ)
+		self.buffer = memoryview(self.mappedFile)
+		self.size = len(self.buffer)
+		self.position = 0
+
+	def tell(self):
+		return self.position
+
+	def seek(self, offset, whence=0):
+		if whence == 0:
+			self.position = offset
+		elif whence == 1:
+			self.position += offset
+		else:
+			self.position = self.size + offset
+		return self.position
+
+	def read(self, byteCount=-1):
+		'''return the next byteCount bytes as a memoryview and advance the file pointer'''
+		start = self.position
+		if byteCount < 0:
+			end = self.size
+		else:
+			end = min(start + byteCount, self.size)
+		self.position = max(start, end)
+		return self.buffer[start:end]
+
+	def view(self, offset, byteCount):
+		'''return a memoryview of the bytes at offset without changing the file pointer'''
+		return self.buffer[offset:offset + byteCount]
+
+	def fileno(self):
+		return self.fileptr.fileno()
+
+	def close(self):
+		self.buffer.release()
+		try:
+			self.mappedFile.close()
+		except BufferError:
+			# a caller still holds a view of a datagram.  the mapping is released when the last view is garbage collected
+			pass
+		self.fileptr.close()
+
+###############################################################################
+class cAssembledPing:
+	'''the datagrams which make up one ping from one head, e.g. the X depths, N raw ranges and Y seabed image.  The datagrams are shells, so decode the ones you need and the beam fields come back as numpy arrays, e.g. ping.datagrams['N'].readFields('BeamPointingAngle')'''
+	def __init__(self, counter, serialNumber):
+		self.counter = counter
+		self.serialNumber = serialNumber
+		self.datagrams = {}
+
+###############################################################################
+class cPingAssembler:
+	'''join the datagrams of each ping using the ping counter and serial number, so the datagrams of dual head and dual swath systems stay lined up.  Feed it datagrams in file order with add().  A ping is handed back once it has all the types we want, or once lookAhead newer pings have started, so the memory used stays the same however long the file is.  Pings are handed back in the order they started'''
+	def __init__(self, types, lookAhead=16):
+		self.types = set(types)
+		self.lookAhead = lookAhead
+		self.pending = deque()
+		self.openPings = {}
+
+	def add(self, typeOfDatagram, datagram):
+		'''add a datagram to its ping.  returns a list of the pings which are now finished'''
+		key = datagram.pingKey()
+		ping = self.openPings.get(key)
+		if ping is None or typeOfDatagram in ping.datagrams:
+			# a new ping, or the counter has wrapped around to one we have already seen
+			ping = cAssembledPing(key[0], key[1])
+			self.openPings[key] = ping
+			self.pending.append(ping)
+		ping.datagrams[typeOfDatagram] = datagram
+
+		finished = []
+		while len(self.pending) > 0 and (len(self.pending) > self.lookAhead or self.types.issubset(self.pending[0].datagrams)):
+			finished.append(self.finish())
+		return finished
+
+	def flush(self):
+		'''return all the pings we are still waiting on, e.g. at the end of the file'''
+		finished = []
+		while len(self.pending) > 0:
+			finished.append(self.finish())
+		return finished
+
+	def finish(self):
+		ping = self.pending.popleft()
+		key = (ping.counter, ping.serialNumber)
+		if self.openPings.get(key) is ping:
+			del self.openPings[key]
+		return ping
 
 ###############################################################################
 class cBeam:
@@ -427,21 +920,21 @@ class cBeam:
 
 ###############################################################################
 class A_ATTITUDE_ENCODER:
+	# the attitude record, '=HHhhhH'.  A single sensor system descriptor byte follows the last record
+	rec_dtype = np.dtype([('timeMillisecs', '<u2'), ('sensorStatus', '<u2'), ('roll', '<i2'), ('pitch', '<i2'), ('heave', '<i2'), ('heading', '<u2')])
+
 	def __init__(self):
 		self.data = 0
 
 	def encode(self, recordsToAdd, counter):
-		'''Encode a list of attitude records where the format is timestamp, roll, pitch, heave heading'''
+		'''Encode a list or 2D numpy array of attitude records where the format is timestamp, roll, pitch, heave heading.  All the records are encoded in one go'''
 		if (len(recordsToAdd) == 0):
 			return
 
-		fullDatagram = bytearray()
-
 		header_fmt = '=LBBHLLHHH'
 		header_len = struct.calcsize(header_fmt)
 
-		rec_fmt = "HHhhhHB"
-		rec_len = struct.calcsize(rec_fmt)
+		rec_len = self.rec_dtype.itemsize
 
 		footer_fmt = '=BH'
 		footer_len = struct.calcsize(footer_fmt)
@@ -454,36 +947,29 @@ class A_ATTITUDE_ENCODER:
 		serialNumber = 999
 		numEntries = len(recordsToAdd)
 
-		fullDatagramByteCount = header_len + (rec_len*len(recordsToAdd)) + footer_len
+		fullDatagramByteCount = header_len + (rec_len*len(recordsToAdd)) + 1 + footer_len
+		# we know the size up front, so pack everything straight into the one buffer
+		fullDatagram = bytearray(fullDatagramByteCount)
 
-		firstRecordTimestamp = float(recordsToAdd[0][0]) #we need to know the first record timestamp as all observations are milliseconds from that time
-		firstRecordDate = from_timestamp(firstRecordTimestamp)
-
-		recordDate = int(dateToKongsbergDate(firstRecordDate))
-		recordTime = int(dateToSecondsSinceMidnight(firstRecordDate)*1000)
+		records = np.asarray(recordsToAdd, dtype=np.float64)
+		firstRecordTimestamp = float(records[0, 0]) #we need to know the first record timestamp as all observations are milliseconds from that time
+		recordDate, recordTime = to_KongsbergDateTime(firstRecordTimestamp)
 		# we need to deduct 4 bytes as the field does not account for the 4-byte message length data which precedes the message
 		try:
-			header = struct.pack(header_fmt, fullDatagramByteCount-4, STX, typeOfDatagram, model, recordDate, recordTime, counter, serialNumber, numEntries)
+			struct.pack_into(header_fmt, fullDatagram, 0, fullDatagramByteCount-4, STX, typeOfDatagram, model, recordDate, recordTime, counter, serialNumber, numEntries)
 		except:
 			print ("error encoding attitude")
 			# header = struct.pack(header_fmt, fullDatagramByteCount-4, STX, typeOfDatagram, model, recordDate, recordTime, counter, serialNumber, numEntries)
 
-		fullDatagram = fullDatagram + header
-
-		# now pack avery record from the list
-		for record in recordsToAdd:
-			timeMillisecs = round((float(record[0]) - firstRecordTimestamp) * 1000) # compute the millisecond offset of the record from the first record in the datagram
-			sensorStatus = 0
-			roll	= float(record[1])
-			pitch= float(record[2])
-			heave= float(record[3])
-			heading = float(record[4])
-			try:
-				bodyRecord = struct.pack(rec_fmt, timeMillisecs, sensorStatus, int(roll*100), int(pitch*100), int(heave*100), int(heading*100), systemDescriptor)
-			except:
-				print ("error encoding attitude")
-				bodyRecord = struct.pack(rec_fmt, timeMillisecs, sensorStatus, int(roll*100), int(pitch*100), int(heave*100), int(heading*100), systemDescriptor)
-			fullDatagram = fullDatagram + bodyRecord
+		# now pack every record from the list as whole columns.  Assigning the scaled floats to the integer fields truncates them in the same way as int()
+		body = np.frombuffer(fullDatagram, dtype=self.rec_dtype, count=numEntries, offset=header_len)
+		body['timeMillisecs']		= np.round((records[:, 0] - firstRecordTimestamp) * 1000) # compute the millisecond offset of the record from the first record in the datagram
+		body['sensorStatus']		= 0
+		body['roll']				= records[:, 1] * 100
+		body['pitch']				= records[:, 2] * 100
+		body['heave']				= records[:, 3] * 100
+		body['heading']				= records[:, 4] * 100
+		struct.pack_into('=B', fullDatagram, header_len + body.nbytes, systemDescriptor)
 
 		# now do the footer
 		# systemDescriptor = set_bit(systemDescriptor, 1) #set roll is DISABLED
@@ -491,10 +977,7 @@ class A_ATTITUDE_ENCODER:
 		# systemDescriptor = set_bit(systemDescriptor, 3) #set heave is DISABLED
 		# systemDescriptor = set_bit(systemDescriptor, 4) #set SENSOR as system 2
 		# systemDescriptor = 30
-		ETX = 3
-		checksum = sum(fullDatagram[5:]) % 65536
-		footer = struct.pack('=BH', ETX, checksum)
-		fullDatagram = fullDatagram + footer
+		packFooter(fullDatagram)
 
 		# TEST THE CRC CODE pkpk
 		# c = CRC16()
@@ -503,7 +986,121 @@ class A_ATTITUDE_ENCODER:
 		return fullDatagram
 
 ###############################################################################
-class A_ATTITUDE:
+# every datagram class starts life as a lightweight shell holding where the record is in the file.  Keep those in slots, with no per instance __dict__, so the shells are cheap to make.  The decoded fields from read() go into a separate body object
+datagramSlots = ('typeOfDatagram', 'offset', 'numberOfBytes', 'fileptr', 'data', 'rawHeader', 'body')
+shellFields = datagramSlots[:-1]
+
+class cDecodedBody:
+	'''the decoded fields of a datagram.  The body is an instance of an unslotted subclass of the datagram class, so decode() sets the fields in its __dict__ just as it would on a plain object, and can call the other methods of its class'''
+	def __getattr__(self, name):
+		raise AttributeError(name)
+
+def onBody(method):
+	'''decorate the datagram methods which work on the decoded fields, such as encode(), so they run on the body rather than looking up each field through the shell'''
+	def runOnBody(self, *args):
+		return method(self.decodedBody(), *args)
+	runOnBody.__name__ = method.__name__
+	runOnBody.__doc__ = method.__doc__
+	return runOnBody
+
+# the body class for each datagram class, made the first time we decode one
+bodyClasses = {}
+
+def bodyClass(datagramClass):
+	'''return the class we decode the body of a datagramClass into.  see cDecodedBody'''
+	body = bodyClasses.get(datagramClass)
+	if body is None:
+		body = type(datagramClass.__name__ + "_BODY", (cDecodedBody, datagramClass), {})
+		bodyClasses[datagramClass] = body
+	return body
+
+
+class cDatagram:
+	'''the lazy behaviour shared by the datagram classes.  The common header fields come from the header the reader has already unpacked, so filtering on time never touches the body.  Any other field decodes the body the first time it is asked for.  Each class decodes its body in decode(), and read() makes sure that only happens once'''
+	__slots__ = ()
+	# the names each class gives the model, date, time, counter and serial number fields of the common header
+	headerFields = ('EMModel', 'RecordDate', 'Time', 'Counter', 'SerialNumber')
+	# the other fields decode() sets.  Asking the shell for anything else is an AttributeError straight away, rather than decoding the body to find out
+	bodyFields = ()
+	rawHeader_unpack = struct.Struct('=HLLHH').unpack_from
+	# how many times read() found the datagram already decoded, e.g. when -wobble, -beamqc and -extractnadir all look at the same ping
+	decodesAvoided = 0
+
+	def read(self):
+		'''decode the body, unless we already have'''
+		body = getattr(self, 'body', None)
+		if body is not None and body.bodyDecoded:
+			cDatagram.decodesAvoided += 1
+			return
+		body = self.newBody()
+		body.decode()
+		body.bodyDecoded = True
+		self.keepBody(body)
+
+	def decodedBody(self):
+		'''return the body with the decoded fields, decoding it first if we have not already'''
+		if isinstance(self, cDecodedBody):
+			return self
+		body = getattr(self, 'body', None)
+		if body is None or not body.bodyDecoded:
+			# decode without moving the file pointer, like __getattr__
+			curr = self.fileptr.tell()
+			self.read()
+			self.fileptr.seek(curr, 0)
+		return self.body
+
+	def newBody(self):
+		'''return an empty body for the decoded fields, holding a copy of the shell fields decode() needs, such as the offset and fileptr'''
+		body = object.__new__(bodyClass(type(self)))
+		for name in shellFields:
+			setattr(body, name, getattr(self, name, None))
+		body.bodyDecoded = False
+		return body
+
+	def keepBody(self, body):
+		'''hang on to the decoded body.  decode() can also set the shell fields, e.g. the data, so copy those back'''
+		for name in shellFields:
+			setattr(self, name, getattr(body, name))
+		self.body = body
+
+	def pingKey(self):
+		'''the ping counter and serial number from the header.  together they identify the ping a datagram belongs to'''
+		values = self.rawHeader_unpack(self.rawHeader, 6)
+		return values[3], values[4]
+
+	def invalidate(self):
+		'''forget the decoded fields, e.g. after changing them to encode(), so the next read() decodes the datagram from the file again'''
+		body = getattr(self, 'body', None)
+		if body is not None:
+			# delete the fields themselves too, in case someone still holds the body
+			vars(body).clear()
+		self.body = None
+
+	def __getattr__(self, name):
+		# python only calls this for a slot which is not set yet, or a field which is not in the shell, i.e. a header or body field
+		if name in self.headerFields:
+			rawHeader = getattr(self, 'rawHeader', None)
+			if rawHeader is not None:
+				position = self.headerFields.index(name)
+				value = self.rawHeader_unpack(rawHeader, 6)[position]
+				return value / 1000.0 if position == 2 else value
+		elif name not in self.bodyFields:
+			raise AttributeError(name)
+		body = getattr(self, 'body', None)
+		# readFields() may already have decoded the field we want
+		if body is not None and not body.bodyDecoded and name in body.__dict__:
+			return body.__dict__[name]
+		# decode without moving the file pointer, so we can be lazy in the middle of reading the file
+		return getattr(self.decodedBody(), name)
+
+###############################################################################
+class A_ATTITUDE(cDatagram):
+	__slots__ = datagramSlots
+	bodyFields = ('STX', 'NumberEntries', 'Attitude', 'systemDescriptor', 'ETX', 'checksum')
+	# the attitude record, '=HHhhhH', which follows the 22 byte header
+	rec_dtype = np.dtype([('timeMillisecs', '<u2'), ('sensorStatus', '<u2'), ('roll', '<i2'), ('pitch', '<i2'), ('heave', '<i2'), ('heading', '<u2')])
+	header_len = 22
+
 	def __init__(self, fileptr, numberOfBytes):
 		self.typeOfDatagram = 'A'
 		self.offset = fileptr.tell()
@@ -512,7 +1109,7 @@ class A_ATTITUDE:
 		self.fileptr.seek(numberOfBytes, 1)
 		self.data = ""
 
-	def read(self):
+	def decode(self):
 		self.fileptr.seek(self.offset, 0)
 		rec_fmt = '=LBBHLLHHH'
 		rec_len = struct.calcsize(rec_fmt)
@@ -555,7 +1152,10 @@ class A_ATTITUDE:
 		self.checksum		= s[2]
 
 ###############################################################################
-class C_CLOCK:
+class C_CLOCK(cDatagram):
+	__slots__ = datagramSlots
+	headerFields = ('EMModel', 'RecordDate', 'time', 'ClockCounter', 'SerialNumber')
+	bodyFields = ('STX', 'ExternalDate', 'ExternalTime', 'PPS', 'ETX', 'checksum')
 	def __init__(self, fileptr, numberOfBytes):
 		self.typeOfDatagram = 'C'
 		self.offset = fileptr.tell()
@@ -564,7 +1164,7 @@ class C_CLOCK:
 		self.fileptr.seek(numberOfBytes, 1)
 		self.data = ""
 
-	def read(self):
+	def decode(self):
 		self.fileptr.seek(self.offset, 0)
 		rec_fmt = '=LBBHLLHHLLBBH'
 		rec_len = struct.calcsize(rec_fmt)
@@ -597,7 +1197,14 @@ class C_CLOCK:
 		return s
 
 ###############################################################################
-class D_DEPTH:
+class D_DEPTH(cDatagram):
+	__slots__ = datagramSlots
+	bodyFields = ('STX', 'Heading', 'SoundSpeedAtTransducer', 'TransducerDepth', 'MaxBeams', 'NBeams', 'ZResolution', 'XYResolution', 'SampleFrequency', 'Depth', 'AcrossTrackDistance', 'AlongTrackDistance', 'BeamDepressionAngle', 'BeamAzimuthAngle', 'Range', 'QualityFactor', 'LengthOfDetectionWindow', 'Reflectivity', 'BeamNumber', 'RangeMultiplier', 'ETX', 'checksum')
+	# the variable part of the record is '=H3h2H2BbB' per beam for the older models and '=4h2H2BbB' from the EM710 onwards
+	beam_fields = ['Depth', 'AcrossTrackDistance', 'AlongTrackDistance', 'BeamDepressionAngle', 'BeamAzimuthAngle', 'Range', 'QualityFactor', 'LengthOfDetectionWindow', 'Reflectivity', 'BeamNumber']
+	beam_dtype_pre700 = np.dtype(list(zip(beam_fields, ['<u2', '<i2', '<i2', '<i2', '<u2', '<u2', 'u1', 'u1', 'i1', 'u1'])))
+	beam_dtype = np.dtype(list(zip(beam_fields, ['<i2', '<i2', '<i2', '<i2', '<u2', '<u2', 'u1', 'u1', 'i1', 'u1'])))
+
 	def __init__(self, fileptr, numberOfBytes):
 		self.typeOfDatagram = 'D'
 		self.offset = fileptr.tell()
@@ -606,7 +1213,13 @@ class D_DEPTH:
 		self.fileptr.seek(numberOfBytes, 1)
 		self.data = ""
 
-	def read(self):
+	def beamDtype(self):
+		'''the per beam record layout changes with the EM model'''
+		if self.EMModel < 700:
+			return self.beam_dtype_pre700
+		return self.beam_dtype
+
+	def decode(self):
 		self.fileptr.seek(self.offset, 0)
 		rec_fmt = '=LBBHLLHHHHHBBBBH'
 		rec_len = struct.calcsize(rec_fmt)
@@ -630,48 +1243,20 @@ class D_DEPTH:
 		self.XYResolution		= float (s[14] / float (100))
 		self.SampleFrequency	  = s[15]
 
-		self.Depth						= [0 for i in range(self.NBeams)]
-		self.AcrossTrackDistance		  = [0 for i in range(self.NBeams)]
-		self.AlongTrackDistance		= [0 for i in range(self.NBeams)]
-		self.BeamDepressionAngle		  = [0 for i in range(self.NBeams)]
-		self.BeamAzimuthAngle			 = [0 for i in range(self.NBeams)]
-		self.Range						= [0 for i in range(self.NBeams)]
-		self.QualityFactor				= [0 for i in range(self.NBeams)]
-		self.LengthOfDetectionWindow	  = [0 for i in range(self.NBeams)]
-		self.Reflectivity				 = [0 for i in range(self.NBeams)]
-		self.BeamNumber				= [0 for i in range(self.NBeams)]
-
-		# now read the variable part of the Record
-		if self.EMModel < 700 :
-			rec_fmt = '=H3h2H2BbB'
-		else:
-			rec_fmt = '=4h2H2BbB'
-		rec_len = struct.calcsize(rec_fmt)
-		rec_unpack = struct.Struct(rec_fmt).unpack
-
-		i = 0
-		while i < self.NBeams:
-			data = self.fileptr.read(rec_len)
-			s = rec_unpack(data)
-			self.Depth[i]					= float (s[0] / float (100))
-			self.AcrossTrackDistance[i]		= float (s[1] / float (100))
-			self.AlongTrackDistance[i]		= float (s[2] / float (100))
-			self.BeamDepressionAngle[i]		= float (s[3] / float (100))
-			self.BeamAzimuthAngle[i]		= float (s[4] / float (100))
-			self.Range[i]					= float (s[5] / float (100))
-			self.QualityFactor[i]			= s[6]
-			self.LengthOfDetectionWindow[i]	= s[7]
-			self.Reflectivity[i]			= float (s[8] / float (100))
-			self.BeamNumber[i]				= s[9]
-
-			# now do some sanity checks.  We have examples where the Depth and Across track values are NaN
-			if (math.isnan(self.Depth[i])):
-				self.Depth[i] = 0
-			if (math.isnan(self.AcrossTrackDistance[i])):
-				self.AcrossTrackDistance[i] = 0
-			if (math.isnan(self.AlongTrackDistance[i])):
-				self.AlongTrackDistance[i] = 0
-			i = i + 1
+		# now read the variable part of the Record in one go and decode every beam as numpy arrays.  The record layout depends on the model
+		beam_dtype = self.beamDtype()
+		data = self.fileptr.read(beam_dtype.itemsize * self.NBeams)
+		beams = np.frombuffer(data, dtype=beam_dtype, count=self.NBeams)
+		self.Depth						= beams['Depth'] / 100
+		self.AcrossTrackDistance		  = beams['AcrossTrackDistance'] / 100
+		self.AlongTrackDistance		= beams['AlongTrackDistance'] / 100
+		self.BeamDepressionAngle		  = beams['BeamDepressionAngle'] / 100
+		self.BeamAzimuthAngle			 = beams['BeamAzimuthAngle'] / 100
+		self.Range						= beams['Range'] / 100
+		self.QualityFactor				= beams['QualityFactor'].copy()
+		self.LengthOfDetectionWindow	  = beams['LengthOfDetectionWindow'].copy()
+		self.Reflectivity				 = beams['Reflectivity'] / 100
+		self.BeamNumber				= beams['BeamNumber'].copy()
 
 		rec_fmt = '=bBH'
 		rec_len = struct.calcsize(rec_fmt)
@@ -684,28 +1269,25 @@ class D_DEPTH:
 		self.checksum		= s[2]
 
 ###############################################################################
+	@onBody
 	def encode(self):
 		'''Encode a Depth D datagram record'''
 		header_fmt = '=LBBHLLHHHHHBBBBH'
 		header_len = struct.calcsize(header_fmt)
 
-		fullDatagram = bytearray()
-
 		# now read the variable part of the Record
-		if self.EMModel < 700 :
-			rec_fmt = '=H3h2H2BbB'
-		else:
-			rec_fmt = '=4h2H2BbB'
-		rec_len = struct.calcsize(rec_fmt)
+		beam_dtype = self.beamDtype()
+		rec_len = beam_dtype.itemsize
 
 		footer_fmt = '=BBH'
 		footer_len = struct.calcsize(footer_fmt)
 
 		fullDatagramByteCount = header_len + (rec_len*self.NBeams) + footer_len
+		fullDatagram = bytearray(fullDatagramByteCount)
 
 		# pack the header
-		recordTime = int(dateToSecondsSinceMidnight(from_timestamp(self.Time))*1000)
-		header = struct.pack(header_fmt,
+		recordTime = to_KongsbergDateTime(self.Time)[1]
+		struct.pack_into(header_fmt, fullDatagram, 0,
 			fullDatagramByteCount-4,
 			self.STX,
 			ord(self.typeOfDatagram),
@@ -722,47 +1304,40 @@ class D_DEPTH:
 			int(self.ZResolution * 100),
 			int(self.XYResolution * 100),
 			int(self.SampleFrequency))
-		fullDatagram = fullDatagram + header
-		header_fmt = '=LBBHLLHHHHHBBBBH'
 
-		# pack the beam summary info
-		for i in range (self.NBeams):
-			bodyRecord = struct.pack(rec_fmt,
-				int(self.Depth[i] * 100),
-				int(self.AcrossTrackDistance[i] * 100),
-				int(self.AlongTrackDistance[i] * 100),
-				int(self.BeamDepressionAngle[i] * 100),
-				int(self.BeamAzimuthAngle[i] * 100),
-				int(self.Range[i] * 100),
-				self.QualityFactor[i],
-				self.LengthOfDetectionWindow[i],
-				int(self.Reflectivity[i] * 100),
-				self.BeamNumber[i])
-			fullDatagram = fullDatagram + bodyRecord
-
-		tmp = struct.pack('=b', self.RangeMultiplier)
-		fullDatagram = fullDatagram + tmp
+		# pack the beam summary info as whole arrays straight into the datagram.  Assigning the scaled floats to the integer fields truncates them in the same way as int()
+		beams = np.frombuffer(fullDatagram, dtype=beam_dtype, count=self.NBeams, offset=header_len)
+		beams['Depth']					= np.asarray(self.Depth[:self.NBeams]) * 100
+		beams['AcrossTrackDistance']	= np.asarray(self.AcrossTrackDistance[:self.NBeams]) * 100
+		beams['AlongTrackDistance']		= np.asarray(self.AlongTrackDistance[:self.NBeams]) * 100
+		beams['BeamDepressionAngle']	= np.asarray(self.BeamDepressionAngle[:self.NBeams]) * 100
+		beams['BeamAzimuthAngle']		= np.asarray(self.BeamAzimuthAngle[:self.NBeams]) * 100
+		beams['Range']					= np.asarray(self.Range[:self.NBeams]) * 100
+		beams['QualityFactor']			= self.QualityFactor[:self.NBeams]
+		beams['LengthOfDetectionWindow']= self.LengthOfDetectionWindow[:self.NBeams]
+		beams['Reflectivity']			= np.asarray(self.Reflectivity[:self.NBeams]) * 100
+		beams['BeamNumber']				= self.BeamNumber[:self.NBeams]
 
 		# now pack the footer
 		# systemDescriptor = 1
-		ETX = 3
-		checksum = sum(fullDatagram[5:]) % 65536
-		footer = struct.pack('=BH', ETX, checksum)
-		fullDatagram = fullDatagram + footer
+		struct.pack_into('=b', fullDatagram, fullDatagramByteCount - footer_len, self.RangeMultiplier)
+		packFooter(fullDatagram)
 
 		return fullDatagram
 
 ###############################################################################
-class E_EXTRA:
+class E_EXTRA(cDatagram):
+	__slots__ = datagramSlots
+	bodyFields = ('STX', 'ContentIdentifier', 'ETX', 'checksum')
 	def __init__(self, fileptr, numberOfBytes):
 		self.typeOfDatagram = '3'
 		self.offset = fileptr.tell()
 		self.numberOfBytes = numberOfBytes
 		self.fileptr = fileptr
 		self.fileptr.seek(numberOfBytes, 1)
-		self.ExtraData = ""
+		self.data = ""
 
-	def read(self):
+	def decode(self):
 		self.fileptr.seek(self.offset, 0)
 		rec_fmt = '=LBBHLLHHH'
 		rec_len = struct.calcsize(rec_fmt)
@@ -786,7 +1361,7 @@ class E_EXTRA:
 			bytesToRead = self.numberOfBytes - rec_len  - 4 # 'sBH'
 
 		# now read the block of data whatever it may contain
-		self.data = self.fileptr.read(bytesToRead)
+		self.data = bytes(self.fileptr.read(bytesToRead))
 
 		# # now spare byte only if necessary
 		# if self.numberOfBytes % 2 != 0:
@@ -799,7 +1374,13 @@ class E_EXTRA:
 		self.ETX, self.checksum = readFooter(self.numberOfBytes, self.fileptr)
 
 ###############################################################################
-class f_RAWRANGE:
+class f_RAWRANGE(cDatagram):
+	__slots__ = datagramSlots
+	headerFields = ('EMModel', 'RecordDate', 'Time', 'PingCounter', 'SerialNumber')
+	bodyFields = ('STX', 'NumTransmitSector', 'NumReceiveBeams', 'SampleFrequency', 'ROVDepth', 'SoundSpeedAtTransducer', 'MaxBeams', 'Spare1', 'Spare2', 'TiltAngle', 'FocusRange', 'SignalLength', 'SectorTransmitDelay', 'CentreFrequency', 'MeanAbsorption', 'SignalWaveformID', 'TransmitSectorNumberTX', 'SignalBandwidth', 'BeamPointingAngle', 'TransmitSectorNumber', 'DetectionInfo', 'DetectionWindow', 'QualityFactor', 'DCorr', 'TwoWayTravelTime', 'Reflectivity', 'RealtimeCleaningInformation', 'Spare', 'BeamNumber', 'ETX', 'checksum')
+	# the transmit sector and receive beam records as they are encoded
+	sector_dtype = np.dtype([('TiltAngle', '<i2'), ('FocusRange', '<u2'), ('SignalLength', '<u4'), ('SectorTransmitDelay', '<u4'), ('CentreFrequency', '<u4'), ('SignalBandwidth', '<u2'), ('SignalWaveformID', 'u1'), ('TransmitSectorNumberTX', 'u1')])
+	rx_dtype = np.dtype([('BeamPointingAngle', '<i2'), ('TwoWayTravelTime', '<u2'), ('TransmitSectorNumber', 'u1'), ('Reflectivity', 'i1'), ('QualityFactor', 'u1'), ('DetectionWindow', 'u1'), ('BeamNumber', '<i2'), ('Spare', '<u2'), ('systemDescriptor', 'u1')])
 	def __init__(self, fileptr, numberOfBytes):
 		self.typeOfDatagram = 'f'
 		self.offset = fileptr.tell()
@@ -808,7 +1389,7 @@ class f_RAWRANGE:
 		self.fileptr.seek(numberOfBytes, 1)
 		self.data = ""
 
-	def read(self):
+	def decode(self):
 		self.fileptr.seek(self.offset, 0)
 		rec_fmt = '=LBBHLLHH HHLl4H'
 		rec_len = struct.calcsize(rec_fmt)
@@ -900,6 +1481,7 @@ class f_RAWRANGE:
 		self.checksum			= s[2]
 
 ###############################################################################
+	@onBody
 	def encode(self):
 		'''Encode a Depth f datagram record'''
 		systemDescriptor = 1
@@ -907,24 +1489,21 @@ class f_RAWRANGE:
 		header_fmt = '=LBBHLLHH HHLl4H'
 		header_len = struct.calcsize(header_fmt)
 
-		fullDatagram = bytearray()
+		# # now read the variable part of the Transmit Record, '=hHLLLHBB'
+		rec_len = self.sector_dtype.itemsize
 
-		# # now read the variable part of the Transmit Record
-		rec_fmt = '=hHLLLHBB'
-		rec_len = struct.calcsize(rec_fmt)
-
-		# now read the variable part of the recieve record
-		rx_rec_fmt = '=hHBbBBhHB'
-		rx_rec_len = struct.calcsize(rx_rec_fmt)
+		# now read the variable part of the recieve record, '=hHBbBBhHB'
+		rx_rec_len = self.rx_dtype.itemsize
 
 		footer_fmt = '=BH'
 		footer_len = struct.calcsize(footer_fmt)
 
 		fullDatagramByteCount = header_len + (rec_len*self.NumTransmitSector) + (rx_rec_len*self.NumReceiveBeams) + footer_len
+		fullDatagram = bytearray(fullDatagramByteCount)
 
 		# pack the header
-		recordTime = int(dateToSecondsSinceMidnight(from_timestamp(self.Time))*1000)
-		header = struct.pack(header_fmt,
+		recordTime = to_KongsbergDateTime(self.Time)[1]
+		struct.pack_into(header_fmt, fullDatagram, 0,
 			fullDatagramByteCount-4,
 			self.STX,
 			ord(self.typeOfDatagram),
@@ -941,44 +1520,39 @@ class f_RAWRANGE:
 			self.MaxBeams,
 			self.Spare1,
 			self.Spare2)
-		fullDatagram = fullDatagram + header
-
-		for i in range (self.NumTransmitSector):
-			sectorRecord = struct.pack(rec_fmt,
-				int(self.TiltAngle[i] * 100),
-				int(self.FocusRange[i] * 10),
-				self.SignalLength[i],
-				self.SectorTransmitDelay[i],
-				self.CentreFrequency[i],
-				self.SignalBandwidth[i],
-				self.SignalWaveformID[i],
-				self.TransmitSectorNumberTX[i])
-			fullDatagram = fullDatagram + sectorRecord
+
+		# fill the sectors and beams as whole arrays straight into the datagram.  Assigning the scaled floats to the integer fields truncates them in the same way as int()
+		sectors = np.frombuffer(fullDatagram, dtype=self.sector_dtype, count=self.NumTransmitSector, offset=header_len)
+		sectors['TiltAngle']				= np.asarray(self.TiltAngle, dtype=np.float64) * 100
+		sectors['FocusRange']				= np.asarray(self.FocusRange, dtype=np.float64) * 10
+		sectors['SignalLength']				= self.SignalLength
+		sectors['SectorTransmitDelay']		= self.SectorTransmitDelay
+		sectors['CentreFrequency']			= self.CentreFrequency
+		sectors['SignalBandwidth']			= self.SignalBandwidth
+		sectors['SignalWaveformID']			= self.SignalWaveformID
+		sectors['TransmitSectorNumberTX']	= self.TransmitSectorNumberTX
 
 		# pack the beam summary info
-		for i in range (self.NumReceiveBeams):
-			bodyRecord = struct.pack(rx_rec_fmt,
-				int(self.BeamPointingAngle[i] * 100.0),
-				int(self.TwoWayTravelTime[i] * (4 * self.SampleFrequency)),
-				self.TransmitSectorNumber[i],
-				int(self.Reflectivity[i] * 2.0),
-				self.QualityFactor[i],
-				self.DetectionWindow[i],
-				self.BeamNumber[i],
-				self.Spare1,
-				systemDescriptor)
-			fullDatagram = fullDatagram + bodyRecord
+		beams = np.frombuffer(fullDatagram, dtype=self.rx_dtype, count=self.NumReceiveBeams, offset=header_len + (rec_len*self.NumTransmitSector))
+		beams['BeamPointingAngle']			= np.asarray(self.BeamPointingAngle, dtype=np.float64) * 100.0
+		beams['TwoWayTravelTime']			= np.asarray(self.TwoWayTravelTime, dtype=np.float64) * (4 * self.SampleFrequency)
+		beams['TransmitSectorNumber']		= self.TransmitSectorNumber
+		beams['Reflectivity']				= np.asarray(self.Reflectivity, dtype=np.float64) * 2.0
+		beams['QualityFactor']				= self.QualityFactor
+		beams['DetectionWindow']			= self.DetectionWindow
+		beams['BeamNumber']					= self.BeamNumber
+		beams['Spare']						= self.Spare1
+		beams['systemDescriptor']			= systemDescriptor
 
 		# now pack the footer
-		ETX = 3
-		checksum = sum(fullDatagram[5:]) % 65536
-		footer = struct.pack('=BH', ETX, checksum)
-		fullDatagram = fullDatagram + footer
+		packFooter(fullDatagram)
 
 		return fullDatagram
 
 ###############################################################################
-class h_HEIGHT:
+class h_HEIGHT(cDatagram):
+	__slots__ = datagramSlots
+	bodyFields = ('STX', 'Height', 'HeightType', 'ETX', 'checksum')
 	def __init__(self, fileptr, numberOfBytes):
 		self.typeOfDatagram = 'h'
 		self.offset = fileptr.tell()
@@ -986,10 +1560,8 @@ class h_HEIGHT:
 		self.fileptr = fileptr
 		self.fileptr.seek(numberOfBytes, 1)
 		self.data = ""
-		self.Height = 0
-		self.HeightType = 0
 
-	def read(self):
+	def decode(self):
 		self.fileptr.seek(self.offset, 0)
 		rec_fmt = '=LBBHLLHHlB'
 		rec_len = struct.calcsize(rec_fmt)
@@ -1022,21 +1594,22 @@ class h_HEIGHT_ENCODER:
 		serialNumber = 999
 		STX = 2
 		typeOfDatagram = 'h'
-		checksum = 0
 		model = 2045 #needs to be a sensible value to record is valid.  Maybe would be better to pass this from above
 		try:
-			fullDatagram = struct.pack(rec_fmt, rec_len-4, STX, ord(typeOfDatagram), model, int(recordDate), int(recordTime), counter, serialNumber, int(height * 100), int(heightType))
-			ETX = 3
-			checksum = sum(fullDatagram[5:]) % 65536
-			footer = struct.pack('=BH', ETX, checksum)
-			fullDatagram = fullDatagram + footer
+			# the length field does not count its own 4 bytes, but does count the 3 byte footer
+			fullDatagram = bytearray(rec_len + 3)
+			struct.pack_into(rec_fmt, fullDatagram, 0, rec_len-4+3, STX, ord(typeOfDatagram), model, int(recordDate), int(recordTime), counter, serialNumber, int(height * 100), int(heightType))
+			packFooter(fullDatagram)
 		except:
 			print ("error encoding height field")
 			# header = struct.pack(rec_fmt, rec_len-4, STX, ord(typeOfDatagram), model, int(recordDate), int(recordTime), counter, serialNumber, int(height * 100), int(heightType), ETX, checksum)
 		return fullDatagram
 
 ###############################################################################
-class I_INSTALLATION:
+class I_INSTALLATION(cDatagram):
+	__slots__ = datagramSlots
+	headerFields = ('EMModel', 'RecordDate', 'Time', 'SurveyLineNumber', 'SerialNumber')
+	bodyFields = ('STX', 'SecondarySerialNumber', 'installationParameters')
 	def __init__(self, fileptr, numberOfBytes):
 		self.typeOfDatagram = 'I'	# assign the KM code for this datagram type
 		self.offset = fileptr.tell()	# remember where this packet resides in the file so we can return if needed
@@ -1045,7 +1618,7 @@ class I_INSTALLATION:
 		self.fileptr.seek(numberOfBytes, 1)	 # move the file pointer to the end of the record so we can skip as the default actions
 		self.data = ""
 
-	def read(self):
+	def decode(self):
 		self.fileptr.seek(self.offset, 0)# move the file pointer to the start of the record so we can read from disc
 		rec_fmt = '=LBBHLL3H'
 		rec_len = struct.calcsize(rec_fmt)
@@ -1067,7 +1640,7 @@ class I_INSTALLATION:
 		totalAsciiBytes = self.numberOfBytes - rec_len; # we do not need to read the header twice
 		data = self.fileptr.read(totalAsciiBytes)# read the record from disc
 		bytesRead = bytesRead + totalAsciiBytes
-		parameters = data.decode('utf-8', errors="ignore").split(",")
+		parameters = bytes(data).decode('utf-8', errors="ignore").split(",")
 		self.installationParameters = {}
 		for p in parameters:
 			parts = p.split("=")
@@ -1080,7 +1653,21 @@ class I_INSTALLATION:
 			self.fileptr.read(int(self.numberOfBytes - bytesRead))
 
 ###############################################################################
-class n_ATTITUDE:
+class i_INSTALLATION(I_INSTALLATION):
+	'''the installation stop datagram is identical to the installation start datagram apart from the type code'''
+	__slots__ = ()
+	def __init__(self, fileptr, numberOfBytes):
+		I_INSTALLATION.__init__(self, fileptr, numberOfBytes)
+		self.typeOfDatagram = 'i'
+
+###############################################################################
+class n_ATTITUDE(cDatagram):
+	__slots__ = datagramSlots
+	bodyFields = ('STX', 'NumberEntries', 'SystemDescriptor', 'Attitude', 'ETX', 'checksum')
+	# the fixed part of the attitude record, '=HhhhH'.  a byte count and the input telegram follow it, so the records are not evenly spaced
+	rec_dtype = np.dtype([('timeMillisecs', '<u2'), ('roll', '<i2'), ('pitch', '<i2'), ('heave', '<i2'), ('heading', '<u2')])
+	header_len = 24
+
 	def __init__(self, fileptr, numberOfBytes):
 		self.typeOfDatagram = 'n'
 		self.offset = fileptr.tell()
@@ -1089,7 +1676,7 @@ class n_ATTITUDE:
 		self.fileptr.seek(numberOfBytes, 1)
 		self.data = ""
 
-	def read(self):
+	def decode(self):
 		self.fileptr.seek(self.offset, 0)
 		rec_fmt = '=LBBHLLHHHbB'
 		rec_len = struct.calcsize(rec_fmt)
@@ -1120,7 +1707,7 @@ class n_ATTITUDE:
 			s = rec_unpack(data)
 
 			inputTelegramSize = s[5]
-			data = self.fileptr.read(inputTelegramSize)
+			data = bytes(self.fileptr.read(inputTelegramSize))
 			self.Attitude[i] = [self.RecordDate, self.Time + s[0]/1000, s[1], s[2]/100.0, s[3]/100.0, s[4]/100.0, s[5]/100.0, data]
 			i = i + 1
 
@@ -1135,7 +1722,16 @@ class n_ATTITUDE:
 		self.ETX, self.checksum = readFooter(self.numberOfBytes, self.fileptr)
 
 ###############################################################################
-class N_TRAVELTIME:
+class N_TRAVELTIME(cDatagram):
+	__slots__ = datagramSlots
+	headerFields = ('EMModel', 'RecordDate', 'Time', 'PingCounter', 'SerialNumber')
+	# the variable part of the record, '=hHfffHBBf' per transmit sector and '=hBBHBbfhbB' per receive beam
+	sector_dtype = np.dtype([('TiltAngle', '<i2'), ('FocusRange', '<u2'), ('SignalLength', '<f4'), ('SectorTransmitDelay', '<f4'), ('CentreFrequency', '<f4'), ('MeanAbsorption', '<u2'), ('SignalWaveformID', 'u1'), ('TransmitSectorNumberTX', 'u1'), ('SignalBandwidth', '<f4')])
+	beam_dtype = np.dtype([('BeamPointingAngle', '<i2'), ('TransmitSectorNumber', 'u1'), ('DetectionInfo', 'u1'), ('DetectionWindow', '<u2'), ('QualityFactor', 'u1'), ('DCorr', 'i1'), ('TwoWayTravelTime', '<f4'), ('Reflectivity', '<i2'), ('RealtimeCleaningInformation', 'i1'), ('Spare', 'u1')])
+	bodyFields = ('STX', 'SoundSpeedAtTransducer', 'NumTransmitSector', 'NumReceiveBeams', 'NumValidDetect', 'SampleFrequency', 'DScale', 'ETX', 'checksum') + sector_dtype.names + beam_dtype.names
+	# fields stored in 1/100 units
+	centiFields = ('TiltAngle', 'BeamPointingAngle')
+
 	def __init__(self, fileptr, numberOfBytes):
 		self.typeOfDatagram = 'N'
 		self.offset = fileptr.tell()
@@ -1144,12 +1740,29 @@ class N_TRAVELTIME:
 		self.fileptr.seek(numberOfBytes, 1)
 		self.data = ""
 
-	def read(self):
+	def decode(self):
+		self.decodeFields()
+
+	def readFields(self, *fields):
+		'''decode the header and only the named transmit sector and receive beam fields, eg readFields('BeamPointingAngle').  With no names, every field is decoded'''
+		if len(fields) == 0:
+			self.read()
+			return
+		body = getattr(self, 'body', None)
+		if body is None:
+			body = self.newBody()
+		elif body.bodyDecoded or all(field in vars(body) for field in fields):
+			cDatagram.decodesAvoided += 1
+			return
+		body.decodeFields(*fields)
+		self.keepBody(body)
+
+	def decodeFields(self, *fields):
+		'''decode the header and the named fields into this body.  see readFields()'''
 		self.fileptr.seek(self.offset, 0)
 		rec_fmt = '=LBBHLLHHHHHHfL'
 		rec_len = struct.calcsize(rec_fmt)
 		rec_unpack = struct.Struct(rec_fmt).unpack
-		bytesRead = rec_len
 		s = rec_unpack(self.fileptr.read(rec_len))
 
 		# self.numberOfBytes= s[0]
@@ -1167,64 +1780,27 @@ class N_TRAVELTIME:
 		self.SampleFrequency = float (s[12])
 		self.DScale		  = s[13]
 
-		self.TiltAngle					= [0 for i in range(self.NumTransmitSector)]
-		self.FocusRange				= [0 for i in range(self.NumTransmitSector)]
-		self.SignalLength				 = [0 for i in range(self.NumTransmitSector)]
-		self.SectorTransmitDelay		  = [0 for i in range(self.NumTransmitSector)]
-		self.CentreFrequency			  = [0 for i in range(self.NumTransmitSector)]
-		self.MeanAbsorption			= [0 for i in range(self.NumTransmitSector)]
-		self.SignalWaveformID			 = [0 for i in range(self.NumTransmitSector)]
-		self.TransmitSectorNumberTX	= [0 for i in range(self.NumTransmitSector)]
-		self.SignalBandwidth			  = [0 for i in range(self.NumTransmitSector)]
-
-		self.BeamPointingAngle			= [0 for i in range(self.NumReceiveBeams)]
-		self.TransmitSectorNumber		 = [0 for i in range(self.NumReceiveBeams)]
-		self.DetectionInfo				= [0 for i in range(self.NumReceiveBeams)]
-		self.DetectionWindow			  = [0 for i in range(self.NumReceiveBeams)]
-		self.QualityFactor				= [0 for i in range(self.NumReceiveBeams)]
-		self.DCorr						= [0 for i in range(self.NumReceiveBeams)]
-		self.TwoWayTravelTime			 = [0 for i in range(self.NumReceiveBeams)]
-		self.Reflectivity				 = [0 for i in range(self.NumReceiveBeams)]
-		self.RealtimeCleaningInformation  = [0 for i in range(self.NumReceiveBeams)]
-		self.Spare						= [0 for i in range(self.NumReceiveBeams)]
-
-		# # now read the variable part of the Transmit Record
-		rec_fmt = '=hHfffHBBf'
-		rec_len = struct.calcsize(rec_fmt)
-		rec_unpack = struct.Struct(rec_fmt).unpack
-		for i in range(self.NumTransmitSector):
-			data = self.fileptr.read(rec_len)
-			bytesRead += rec_len
-			s = rec_unpack(data)
-			self.TiltAngle[i] = float (s[0]) / float (100)
-			self.FocusRange[i] =  s[1]
-			self.SignalLength[i] = float (s[2])
-			self.SectorTransmitDelay[i] = float(s[3])
-			self.CentreFrequency[i] =  float (s[4])
-			self.MeanAbsorption[i] =  s[5]
-			self.SignalWaveformID[i] = s[6]
-			self.TransmitSectorNumberTX[i] =  s[7]
-			self.SignalBandwidth[i] = float (s[8])
-
-		# now read the variable part of the recieve record
-		rx_rec_fmt = '=hBBHBbfhbB'
-		rx_rec_len = struct.calcsize(rx_rec_fmt)
-		rx_rec_unpack = struct.Struct(rx_rec_fmt).unpack
-
-		for i in range(self.NumReceiveBeams):
-			data = self.fileptr.read(rx_rec_len)
-			rx_s = rx_rec_unpack(data)
-			bytesRead += rx_rec_len
-			self.BeamPointingAngle[i] = float (rx_s[0]) / float (100)
-			self.TransmitSectorNumber[i] = rx_s[1]
-			self.DetectionInfo[i] = rx_s[2]
-			self.DetectionWindow[i] = rx_s[3]
-			self.QualityFactor[i] = rx_s[4]
-			self.DCorr[i] = rx_s[5]
-			self.TwoWayTravelTime[i] = float (rx_s[6])
-			self.Reflectivity[i] = rx_s[7]
-			self.RealtimeCleaningInformation[i] = rx_s[8]
-			self.Spare[i]					= rx_s[9]
+		# now read the transmit and receive records in one go.  The structured arrays are views onto the raw bytes, so fields we are not asked for cost nothing
+		sectorBytes = self.sector_dtype.itemsize * self.NumTransmitSector
+		beamBytes = self.beam_dtype.itemsize * self.NumReceiveBeams
+		data = self.fileptr.read(sectorBytes + beamBytes)
+		sectors = np.frombuffer(data, dtype=self.sector_dtype, count=self.NumTransmitSector)
+		beams = np.frombuffer(data, dtype=self.beam_dtype, count=self.NumReceiveBeams, offset=sectorBytes)
+
+		if len(fields) == 0:
+			fields = self.sector_dtype.names + self.beam_dtype.names
+		for field in fields:
+			if field in self.sector_dtype.names:
+				values = sectors[field]
+			else:
+				values = beams[field]
+			if field in self.centiFields:
+				values = values / 100
+			elif values.dtype.kind == 'f':
+				values = values.astype(np.float64)
+			else:
+				values = values.copy()
+			setattr(self, field, values)
 
 		rec_fmt = '=BBH'
 		rec_len = struct.calcsize(rec_fmt)
@@ -1236,7 +1812,9 @@ class N_TRAVELTIME:
 		self.checksum		= s[2]
 
 ###############################################################################
-class O_QUALITYFACTOR:
+class O_QUALITYFACTOR(cDatagram):
+	__slots__ = datagramSlots
+	bodyFields = ('STX', 'NBeams', 'NParPerBeam', 'Spare', 'QualityFactor', 'RangeMultiplier', 'ETX', 'checksum')
 	def __init__(self, fileptr, numberOfBytes):
 		self.typeOfDatagram = 'O'
 		self.offset = fileptr.tell()
@@ -1245,7 +1823,7 @@ class O_QUALITYFACTOR:
 		self.fileptr.seek(numberOfBytes, 1)
 		self.data = ""
 
-	def read(self):
+	def decode(self):
 		self.fileptr.seek(self.offset, 0)
 		rec_fmt = '=LBBHLLHHHBB'
 		rec_len = struct.calcsize(rec_fmt)
@@ -1287,26 +1865,25 @@ class O_QUALITYFACTOR:
 		self.checksum			= s[2]
 
 ###############################################################################
+	@onBody
 	def encode(self):
 		'''Encode an O_QUALITYFACTOR datagram record'''
 		header_fmt 	= '=LBBHLLHHHBB'
 		header_len = struct.calcsize(header_fmt)
 
-		fullDatagram = bytearray()
-
 		# now read the variable part of the Record
 		rec_fmt = '=' + str(self.NParPerBeam) + 'f'
 		rec_len = struct.calcsize(rec_fmt)
-		rec_unpack = struct.Struct(rec_fmt).unpack
 
 		footer_fmt = '=BBH'
 		footer_len = struct.calcsize(footer_fmt)
 
 		fullDatagramByteCount = header_len + (rec_len*self.NBeams * self.NParPerBeam) + footer_len
+		fullDatagram = bytearray(fullDatagramByteCount)
 
 		# pack the header
-		recordTime = int(dateToSecondsSinceMidnight(from_timestamp(self.Time))*1000)
-		header = struct.pack(header_fmt,
+		recordTime = to_KongsbergDateTime(self.Time)[1]
+		struct.pack_into(header_fmt, fullDatagram, 0,
 			fullDatagramByteCount-4,
 			self.STX,
 			ord(self.typeOfDatagram),
@@ -1318,27 +1895,25 @@ class O_QUALITYFACTOR:
 			int(self.NBeams),
 			int(self.NParPerBeam),
 			int(self.Spare))
-		fullDatagram = fullDatagram + header
 
 		# pack the beam summary info
-		for i in range (self.NBeams):
-			# for j in range (self.NParPerBeam):
-			bodyRecord = struct.pack(rec_fmt,
-				float(self.QualityFactor[i])) #for now pack the same value.  If we see any .all files with more than 1, we can test and fix this. pkpk
-			fullDatagram = fullDatagram + bodyRecord
+		# for now pack one value per beam.  If we see any .all files with more than 1 parameter per beam, we can test and fix this. pkpk
+		qualityFactors = np.frombuffer(fullDatagram, dtype='<f4', count=self.NBeams, offset=header_len)
+		qualityFactors[:] = self.QualityFactor[:self.NBeams]
 
-		# now pack the footer
+		# now pack the footer.  the spare byte before the ETX is already 0
 		# systemDescriptor = 1
-		ETX = 3
-		checksum = sum(fullDatagram[5:]) % 65536
-		footer = struct.pack(footer_fmt, 0, ETX, checksum)
-		fullDatagram = fullDatagram + footer
+		packFooter(fullDatagram)
 
 		return fullDatagram
 
 
 ###############################################################################
-class P_POSITION:
+class P_POSITION(cDatagram):
+	__slots__ = datagramSlots
+	bodyFields = ('STX', 'Latitude', 'Longitude', 'Quality', 'SpeedOverGround', 'CourseOverGround', 'Heading', 'Descriptor', 'NBytesDatagram', 'ETX', 'checksum')
+	# the fixed part of the datagram, '=LBBHLLHHll4HBB', which is ahead of the NMEA string
+	header_dtype = np.dtype([('numberOfBytes', '<u4'), ('STX', 'u1'), ('typeOfDatagram', 'u1'), ('EMModel', '<u2'), ('RecordDate', '<u4'), ('Time', '<u4'), ('Counter', '<u2'), ('SerialNumber', '<u2'), ('Latitude', '<i4'), ('Longitude', '<i4'), ('Quality', '<u2'), ('SpeedOverGround', '<u2'), ('CourseOverGround', '<u2'), ('Heading', '<u2'), ('Descriptor', 'u1'), ('NBytesDatagram', 'u1')])
 	def __init__(self, fileptr, numberOfBytes):
 		self.typeOfDatagram = 'P'	# assign the KM code for this datagram type
 		self.offset = fileptr.tell()	# remember where this packet resides in the file so we can return if needed
@@ -1347,7 +1922,7 @@ class P_POSITION:
 		self.fileptr.seek(numberOfBytes, 1)	 # move the file pointer to the end of the record so we can skip as the default actions
 		self.data = ""
 
-	def read(self):
+	def decode(self):
 		self.fileptr.seek(self.offset, 0)# move the file pointer to the start of the record so we can read from disc
 		rec_fmt = '=LBBHLLHHll4HBB'
 		rec_len = struct.calcsize(rec_fmt)
@@ -1377,7 +1952,7 @@ class P_POSITION:
 			self.NBytesDatagram  += 1
 
 		# now read the block of data whatever it may contain
-		self.data = self.fileptr.read(self.NBytesDatagram)
+		self.data = bytes(self.fileptr.read(self.NBytesDatagram))
 
 		# # now spare byte only if necessary
 		# if (rec_len + self.NBytesDatagram + 3) % 2 != 0:
@@ -1422,13 +1997,14 @@ class P_POSITION_ENCODER:
 		serialNumber = 999
 		STX = 2
 		typeOfDatagram = 'P'
-		checksum = 0
 		model = 2045 #needs to be a sensible value to record is valid.  Maybe would be better to pass this from above
 		data = "" # for now dont write out the raw position string.  I am not sure if this helps or not.  It can be included if we feel it adds value over confusion
 		# try:
 		# fullDatagram = struct.pack(rec_fmt, rec_len-4, STX, ord(typeOfDatagram), model, int(recordDate), int(recordTime), counter, serialNumber, int(height * 100), int(heightType))
 		recordLength =rec_len- 4 + len(data) + 3 # remove 4 bytes from header and add 3 more for footer
-		fullDatagram = struct.pack(rec_fmt, recordLength,
+		rawBytes = data.encode('ascii')
+		fullDatagram = bytearray(recordLength + 4)
+		struct.pack_into(rec_fmt, fullDatagram, 0, recordLength,
 						STX,
 						ord(typeOfDatagram),
 						model,
@@ -1445,11 +2021,8 @@ class P_POSITION_ENCODER:
 						int(descriptor),
 						int(len(data)))
 		# now add the raw bytes, typically NMEA GGA string
-		fullDatagram = fullDatagram + data.encode('ascii')
-		ETX = 3
-		checksum = sum(fullDatagram[5:]) % 65536
-		footer = struct.pack('=BH', ETX, checksum)
-		fullDatagram = fullDatagram + footer
+		fullDatagram[rec_len:rec_len + len(rawBytes)] = rawBytes
+		packFooter(fullDatagram)
 		return fullDatagram
 		# except:
 			# print ("error encoding POSITION Record")
@@ -1457,7 +2030,9 @@ class P_POSITION_ENCODER:
 
 
 ###############################################################################
-class R_RUNTIME:
+class R_RUNTIME(cDatagram):
+	__slots__ = datagramSlots
+	bodyFields = ('STX', 'operatorStationStatus', 'processingUnitStatus', 'BSPStatus', 'sonarHeadStatus', 'mode', 'filterIdentifier', 'minimumDepth', 'maximumDepth', 'absorptionCoefficient', 'transmitPulseLength', 'transmitBeamWidth', 'transmitPower', 'receiveBeamWidth', 'receiveBandwidth', 'mode2', 'tvg', 'sourceOfSpeedSound', 'maximumPortWidth', 'beamSpacing', 'maximumPortCoverageDegrees', 'yawMode', 'maximumStbdCoverageDegrees', 'maximumStbdWidth', 'transmitAAlongTilt', 'filterIdentifier2', 'ETX', 'checksum', 'beamSpacingString', 'yawAndPitchStabilisationMode', 'DepthMode', 'TXPulseForm', 'dualSwathMode', 'filterSetting')
 	def __init__(self, fileptr, numberOfBytes):
 		self.typeOfDatagram = 'R'	# assign the KM code for this datagram type
 		self.offset = fileptr.tell()	# remember where this packet resides in the file so we can return if needed
@@ -1466,7 +2041,7 @@ class R_RUNTIME:
 		self.fileptr.seek(numberOfBytes, 1)	 # move the file pointer to the end of the record so we can skip as the default actions
 		self.data = ""
 
-	def read(self):
+	def decode(self):
 		self.fileptr.seek(self.offset, 0)# move the file pointer to the start of the record so we can read from disc
 		rec_fmt = '=LBBHLLHHBBBBBBHHHHHbBBBBBHBBBBHHBBH'
 		rec_len = struct.calcsize(rec_fmt)
@@ -1666,8 +2241,9 @@ class R_RUNTIME:
 		# return pprint.pformat(vars(self))
 
 ###############################################################################
-class UNKNOWN_RECORD:
+class UNKNOWN_RECORD(cDatagram):
 	'''used as a convenience tool for datagrams we have no bespoke classes.  Better to make a bespoke class'''
+	__slots__ = datagramSlots
 	def __init__(self, fileptr, numberOfBytes, typeOfDatagram):
 		self.typeOfDatagram = typeOfDatagram
 		self.offset = fileptr.tell()
@@ -1675,11 +2251,14 @@ class UNKNOWN_RECORD:
 		self.fileptr = fileptr
 		self.fileptr.seek(numberOfBytes, 1)
 		self.data = ""
-	def read(self):
-		self.data = self.fileptr.read(self.numberOfBytes)
+	def decode(self):
+		self.fileptr.seek(self.offset, 0)
+		self.data = bytes(self.fileptr.read(self.numberOfBytes))
 
 ###############################################################################
-class U_SVP:
+class U_SVP(cDatagram):
+	__slots__ = datagramSlots
+	bodyFields = ('STX', 'ProfileDate', 'ProfileTime', 'NEntries', 'DepthResolution', 'ETX', 'checksum')
 	def __init__(self, fileptr, numberOfBytes):
 		self.typeOfDatagram = 'U'
 		self.offset = fileptr.tell()
@@ -1688,7 +2267,7 @@ class U_SVP:
 		self.fileptr.seek(numberOfBytes, 1)
 		self.data = []
 
-	def read(self):
+	def decode(self):
 		self.fileptr.seek(self.offset, 0)
 		rec_fmt = '=LBBHLLHHLLHH'
 		rec_len = struct.calcsize(rec_fmt)
@@ -1725,7 +2304,12 @@ class U_SVP:
 
 
 ###############################################################################
-class X_DEPTH:
+class X_DEPTH(cDatagram):
+	__slots__ = datagramSlots
+	bodyFields = ('STX', 'Heading', 'SoundSpeedAtTransducer', 'TransducerDepth', 'NBeams', 'NValidDetections', 'SampleFrequency', 'ScanningInfo', 'spare1', 'spare2', 'spare3', 'Depth', 'AcrossTrackDistance', 'AlongTrackDistance', 'DetectionWindowsLength', 'QualityFactor', 'BeamIncidenceAngleAdjustment', 'DetectionInformation', 'RealtimeCleaningInformation', 'Reflectivity', 'ETX', 'checksum')
+	# the variable part of the record, '=fffHBBBbh' per beam
+	beam_dtype = np.dtype([('Depth', '<f4'), ('AcrossTrackDistance', '<f4'), ('AlongTrackDistance', '<f4'), ('DetectionWindowsLength', '<u2'), ('QualityFactor', 'u1'), ('BeamIncidenceAngleAdjustment', 'u1'), ('DetectionInformation', 'u1'), ('RealtimeCleaningInformation', 'i1'), ('Reflectivity', '<i2')])
+
 	def __init__(self, fileptr, numberOfBytes):
 		self.typeOfDatagram = 'X'
 		self.offset = fileptr.tell()
@@ -1734,7 +2318,7 @@ class X_DEPTH:
 		self.fileptr.seek(numberOfBytes, 1)
 		self.data = ""
 
-	def read(self):
+	def decode(self):
 		self.fileptr.seek(self.offset, 0)
 		rec_fmt = '=LBBHLL4Hf2Hf4B'
 		rec_len = struct.calcsize(rec_fmt)
@@ -1761,40 +2345,20 @@ class X_DEPTH:
 		self.spare2				 = s[16]
 		self.spare3				 = s[17]
 
-		self.Depth						= [0 for i in range(self.NBeams)]
-		self.AcrossTrackDistance		  = [0 for i in range(self.NBeams)]
-		self.AlongTrackDistance		= [0 for i in range(self.NBeams)]
-		self.DetectionWindowsLength	= [0 for i in range(self.NBeams)]
-		self.QualityFactor				= [0 for i in range(self.NBeams)]
-		self.BeamIncidenceAngleAdjustment = [0 for i in range(self.NBeams)]
-		self.DetectionInformation		 = [0 for i in range(self.NBeams)]
-		self.RealtimeCleaningInformation= [0 for i in range(self.NBeams)]
-		self.Reflectivity				 = [0 for i in range(self.NBeams)]
-
-		# # now read the variable part of the Record
-		rec_fmt = '=fffHBBBbh'
-		rec_len = struct.calcsize(rec_fmt)
-		rec_unpack = struct.Struct(rec_fmt).unpack
-		for i in range(self.NBeams):
-			data = self.fileptr.read(rec_len)
-			s = rec_unpack(data)
-			self.Depth[i] = s[0]
-			self.AcrossTrackDistance[i] =  s[1]
-			self.AlongTrackDistance[i] = s[2]
-			self.DetectionWindowsLength[i] = s[3]
-			self.QualityFactor[i] =  s[4]
-			self.BeamIncidenceAngleAdjustment[i] =  float (s[5] / 10)
-			self.DetectionInformation[i] = s[6]
-			self.RealtimeCleaningInformation[i] =  s[7]
-			self.Reflectivity[i] = float (s[8] / 10)
-
-			# now do some sanity checks.  We have examples where the Depth and Across track values are NaN
-			if (math.isnan(self.Depth[i])):
-				self.Depth[i] = 0
-			if (math.isnan(self.AcrossTrackDistance[i])):
-				self.AcrossTrackDistance[i] = 0
-			if (math.isnan(self.AlongTrackDistance[i])):
-				self.AlongTrackDistance[i] = 0
+		# now read the variable part of the Record in one go and decode every beam as numpy arrays.  The arrays behave like the lists we used to return, so len(), indexing and iteration work as before
+		data = self.fileptr.read(self.beam_dtype.itemsize * self.NBeams)
+		beams = np.frombuffer(data, dtype=self.beam_dtype, count=self.NBeams)
+
+		# now do some sanity checks.  We have examples where the Depth and Across track values are NaN
+		self.Depth						= zeroNaN(beams['Depth'])
+		self.AcrossTrackDistance		  = zeroNaN(beams['AcrossTrackDistance'])
+		self.AlongTrackDistance		= zeroNaN(beams['AlongTrackDistance'])
+		self.DetectionWindowsLength	= beams['DetectionWindowsLength'].copy()
+		self.QualityFactor				= beams['QualityFactor'].copy()
+		self.BeamIncidenceAngleAdjustment = beams['BeamIncidenceAngleAdjustment'] / 10
+		self.DetectionInformation		 = beams['DetectionInformation'].copy()
+		self.RealtimeCleaningInformation= beams['RealtimeCleaningInformation'].copy()
+		self.Reflectivity				 = beams['Reflectivity'] / 10
 
 		rec_fmt = '=BBH'
 		rec_len = struct.calcsize(rec_fmt)
@@ -1806,47 +2370,52 @@ class X_DEPTH:
 		self.checksum		= s[2]
 
 ###############################################################################
+	@onBody
 	def encode(self):
 		'''Encode a Depth XYZ datagram record'''
 
 		header_fmt = '=LBBHLL4Hf2Hf4B'
 		header_len = struct.calcsize(header_fmt)
 
-		fullDatagram = bytearray()
-
-		rec_fmt = '=fffHBBBbh'
-		rec_len = struct.calcsize(rec_fmt)
+		rec_len = self.beam_dtype.itemsize
 
 		footer_fmt = '=BBH'
 		footer_len = struct.calcsize(footer_fmt)
 
 		fullDatagramByteCount = header_len + (rec_len*self.NBeams) + footer_len
+		fullDatagram = bytearray(fullDatagramByteCount)
 
 		# pack the header
-		recordTime = int(dateToSecondsSinceMidnight(from_timestamp(self.Time))*1000)
-		header = struct.pack(header_fmt, fullDatagramByteCount-4, self.STX, ord(self.typeOfDatagram), self.EMModel, self.RecordDate, recordTime, self.Counter, self.SerialNumber, int(self.Heading * 100), int(self.SoundSpeedAtTransducer * 10), self.TransducerDepth, self.NBeams, self.NValidDetections, self.SampleFrequency, self.ScanningInfo, self.spare1, self.spare2, self.spare3)
-		fullDatagram = fullDatagram + header
-
-		# pack the beam summary info
-		for i in range (self.NBeams):
-			bodyRecord = struct.pack(rec_fmt, self.Depth[i], self.AcrossTrackDistance[i], self.AlongTrackDistance[i], self.DetectionWindowsLength[i], self.QualityFactor[i], int(self.BeamIncidenceAngleAdjustment[i]*10), self.DetectionInformation[i], self.RealtimeCleaningInformation[i], int(self.Reflectivity[i]*10), )
-			fullDatagram = fullDatagram + bodyRecord
+		recordTime = to_KongsbergDateTime(self.Time)[1]
+		struct.pack_into(header_fmt, fullDatagram, 0, fullDatagramByteCount-4, self.STX, ord(self.typeOfDatagram), self.EMModel, self.RecordDate, recordTime, self.Counter, self.SerialNumber, int(self.Heading * 100), int(self.SoundSpeedAtTransducer * 10), self.TransducerDepth, self.NBeams, self.NValidDetections, self.SampleFrequency, self.ScanningInfo, self.spare1, self.spare2, self.spare3)
+
+		# pack the beam summary info as whole arrays straight into the datagram.  Assigning the scaled floats to the integer fields truncates them in the same way as int()
+		beams = np.frombuffer(fullDatagram, dtype=self.beam_dtype, count=self.NBeams, offset=header_len)
+		beams['Depth']							= self.Depth[:self.NBeams]
+		beams['AcrossTrackDistance']			= self.AcrossTrackDistance[:self.NBeams]
+		beams['AlongTrackDistance']				= self.AlongTrackDistance[:self.NBeams]
+		beams['DetectionWindowsLength']			= self.DetectionWindowsLength[:self.NBeams]
+		beams['QualityFactor']					= self.QualityFactor[:self.NBeams]
+		beams['BeamIncidenceAngleAdjustment']	= np.asarray(self.BeamIncidenceAngleAdjustment[:self.NBeams]) * 10
+		beams['DetectionInformation']			= self.DetectionInformation[:self.NBeams]
+		beams['RealtimeCleaningInformation']	= self.RealtimeCleaningInformation[:self.NBeams]
+		beams['Reflectivity']					= np.asarray(self.Reflectivity[:self.NBeams]) * 10
 
 		systemDescriptor = 1
-		tmp = struct.pack('=B', systemDescriptor)
-		fullDatagram = fullDatagram + tmp
+		struct.pack_into('=B', fullDatagram, fullDatagramByteCount - footer_len, systemDescriptor)
 
 		# now pack the footer
-		ETX = 3
-		checksum = 0
-
-		footer = struct.pack('=BH', ETX, checksum)
-		fullDatagram = fullDatagram + footer
+		packFooter(fullDatagram)
 
 		return fullDatagram
 
 ###############################################################################
-class Y_SEABEDIMAGE:
+class Y_SEABEDIMAGE(cDatagram):
+	__slots__ = datagramSlots
+	bodyFields = ('STX', 'SampleFrequency', 'RangeToNormalIncidence', 'NormalIncidence', 'ObliqueBS', 'TxBeamWidth', 'TVGCrossOver', 'NumBeams', 'sortingDirection', 'detectionInfo', 'numberOfSamplesPerBeam', 'centreSampleNumber', 'sampleOffset', 'numSamples', 'samples', 'ETX', 'checksum')
+	# the per beam summary, '=bBHH' per beam.  The samples follow as one int16 block
+	beam_dtype = np.dtype([('sortingDirection', 'i1'), ('detectionInfo', 'u1'), ('numberOfSamplesPerBeam', '<u2'), ('centreSampleNumber', '<u2')])
+
 	def __init__(self, fileptr, numberOfBytes):
 		self.typeOfDatagram = 'Y'
 		self.offset = fileptr.tell()
@@ -1854,10 +2423,8 @@ class Y_SEABEDIMAGE:
 		self.fileptr = fileptr
 		self.fileptr.seek(numberOfBytes, 1)
 		self.data = ""
-		self.ARC = {}
-		self.BeamPointingAngle=[]
 
-	def read(self):
+	def decode(self):
 		self.fileptr.seek(self.offset, 0)
 		rec_fmt = '=LBBHLLHHfHhhHHH'
 		rec_len = struct.calcsize(rec_fmt)
@@ -1879,31 +2446,18 @@ class Y_SEABEDIMAGE:
 		self.TxBeamWidth= s[12]
 		self.TVGCrossOver= s[13]
 		self.NumBeams= s[14]
-		self.beams = []
-		self.numSamples = 0
-		self.samples =[]
 
-		rec_fmt = '=bBHH'
-		rec_len = struct.calcsize(rec_fmt)
-		rec_unpack = struct.Struct(rec_fmt).unpack
-
-		self.numSamples = 0
-		for i in range(self.NumBeams):
-			s = rec_unpack(self.fileptr.read(rec_len))
-			b = cBeam(s, 0)
-			self.numSamples = self.numSamples + b.numberOfSamplesPerBeam
-			self.beams.append(b)
-
-		rec_fmt = '=' + str(self.numSamples) + 'h'
-		rec_len = struct.calcsize(rec_fmt)
-		rec_unpack = struct.Struct(rec_fmt).unpack
-		self.samples = rec_unpack(self.fileptr.read(rec_len))
+		beams = np.frombuffer(self.fileptr.read(self.beam_dtype.itemsize * self.NumBeams), dtype=self.beam_dtype, count=self.NumBeams)
+		self.sortingDirection		= beams['sortingDirection'].copy()
+		self.detectionInfo			= beams['detectionInfo'].copy()
+		self.numberOfSamplesPerBeam	= beams['numberOfSamplesPerBeam'].astype(np.int64)
+		self.centreSampleNumber		= beams['centreSampleNumber'].copy()
 
-		# allocate the samples to the correct beams so it is easier to use
-		sampleIDX = 0
-		for b in self.beams:
-			b.samples = self.samples[sampleIDX: sampleIDX + b.numberOfSamplesPerBeam]
-			sampleIDX = sampleIDX + b.numberOfSamplesPerBeam
+		# the samples stay as a single int16 view onto the record.  each beam is the slice sampleOffset[i]:sampleOffset[i]+numberOfSamplesPerBeam[i]
+		self.sampleOffset = np.zeros(self.NumBeams, dtype=np.int64)
+		np.cumsum(self.numberOfSamplesPerBeam[:-1], out=self.sampleOffset[1:])
+		self.numSamples = int(self.numberOfSamplesPerBeam.sum())
+		self.samples = np.frombuffer(self.fileptr.read(self.numSamples * 2), dtype='<i2', count=self.numSamples)
 
 		# read an empty byte
 		self.fileptr.read(1)
@@ -1911,70 +2465,144 @@ class Y_SEABEDIMAGE:
 		# now read the footer
 		self.ETX, self.checksum = readFooter(self.numberOfBytes, self.fileptr)
 
+	@onBody
+	def beamSamples(self, beam):
+		'''return the samples for a single beam as a view onto the sample array'''
+		return self.samples[self.sampleOffset[beam]: self.sampleOffset[beam] + self.numberOfSamplesPerBeam[beam]]
+
+	def beamSampleSums(self):
+		'''return the sum of the samples in every beam'''
+		cumulative = np.zeros(self.numSamples + 1, dtype=np.int64)
+		np.cumsum(self.samples, out=cumulative[1:])
+		return cumulative[self.sampleOffset + self.numberOfSamplesPerBeam] - cumulative[self.sampleOffset]
+
 ###############################################################################
-	def encode(self):
-		'''Encode a seabed image datagram record'''
+	@onBody
+	def encode(self, ARC, BeamPointingAngle):
+		'''Encode a seabed image datagram record, correcting the samples of each beam by the ARC value at its beam pointing angle.  The ARC is a dictionary of correction by whole degree, and the BeamPointingAngle comes from the raw range datagram of the same ping'''
 
 		header_fmt = '=LBBHLLHHfHhhHHH'
 		header_len = struct.calcsize(header_fmt)
 
-		fullDatagram = bytearray()
-
-		rec_fmt = '=bBHH'
-		rec_len = struct.calcsize(rec_fmt)
-
-		sample_fmt = '=' + str(self.numSamples) + 'h'
-		sample_len = struct.calcsize(sample_fmt)
-
 		footer_fmt = '=BBH'
 		footer_len = struct.calcsize(footer_fmt)
 
-		fullDatagramByteCount = header_len + (rec_len*self.NumBeams) + sample_len + footer_len
+		fullDatagramByteCount = header_len + (self.beam_dtype.itemsize*self.NumBeams) + (self.numSamples*2) + footer_len
+		fullDatagram = bytearray(fullDatagramByteCount)
 
 		# pack the header
-		recordTime = int(dateToSecondsSinceMidnight(from_timestamp(self.Time))*1000)
-		header = struct.pack(header_fmt, fullDatagramByteCount-4, self.STX, ord(self.typeOfDatagram), self.EMModel, self.RecordDate, recordTime, self.Counter, self.SerialNumber, self.SampleFrequency, self.RangeToNormalIncidence, self.NormalIncidence, self.ObliqueBS, self.TxBeamWidth, self.TVGCrossOver, self.NumBeams)
-		fullDatagram = fullDatagram + header
-
-		# pack the beam summary info
-		s = []
-		for i,b in enumerate (self.beams):
-			bodyRecord = struct.pack(rec_fmt, b.sortingDirection, b.detectionInfo, b.numberOfSamplesPerBeam, b.centreSampleNumber)
-			fullDatagram = fullDatagram + bodyRecord
-			# using the takeoffangle, we need to look up the correction from the ARC and apply it to the samples.
-			a = round(self.BeamPointingAngle[i],0)
-			correction = self.ARC[a]
-			for sample in b.samples:
-				s.append(int(sample + correction))
-		sampleRecord = struct.pack(sample_fmt, *s)
-		fullDatagram = fullDatagram + sampleRecord
+		recordTime = to_KongsbergDateTime(self.Time)[1]
+		struct.pack_into(header_fmt, fullDatagram, 0, fullDatagramByteCount-4, self.STX, ord(self.typeOfDatagram), self.EMModel, self.RecordDate, recordTime, self.Counter, self.SerialNumber, self.SampleFrequency, self.RangeToNormalIncidence, self.NormalIncidence, self.ObliqueBS, self.TxBeamWidth, self.TVGCrossOver, self.NumBeams)
+
+		# pack the beam summary info straight into the datagram
+		beams = np.frombuffer(fullDatagram, dtype=self.beam_dtype, count=self.NumBeams, offset=header_len)
+		beams['sortingDirection'] = self.sortingDirection
+		beams['detectionInfo'] = self.detectionInfo
+		beams['numberOfSamplesPerBeam'] = self.numberOfSamplesPerBeam
+		beams['centreSampleNumber'] = self.centreSampleNumber
+
+		# using the takeoffangle, we need to look up the correction from the ARC and apply it to the samples.  one add across every sample, then clip so we cannot wrap around the int16 range
+		corrections = np.array([ARC[round(a,0)] for a in BeamPointingAngle[:self.NumBeams]], dtype=np.float64)
+		samples = np.trunc(self.samples + np.repeat(corrections, self.numberOfSamplesPerBeam))
+		samples = np.clip(samples, -32768, 32767)
+		np.frombuffer(fullDatagram, dtype='<i2', count=len(samples), offset=header_len + beams.nbytes)[:] = samples
 
 		systemDescriptor = 1
-		tmp = struct.pack('=B', systemDescriptor)
-		fullDatagram = fullDatagram + tmp
+		struct.pack_into('=B', fullDatagram, fullDatagramByteCount - footer_len, systemDescriptor)
 
 		# now pack the footer
-		ETX = 3
-		checksum = 0
-		footer = struct.pack('=BH', ETX, checksum)
-		fullDatagram = fullDatagram + footer
+		packFooter(fullDatagram)
 
 		return fullDatagram
 
+###############################################################################
+# DATAGRAM REGISTRY
+###############################################################################
+# the class used to decode each datagram type code.  Datagrams without a class are read as UNKNOWN_RECORD
+datagramClasses = {}
+
+def registerDatagram(typeOfDatagram, datagramClass):
+	'''register the class used to decode a datagram type, e.g. registerDatagram('G', G_SURFACESOUNDSPEED).  The class is made with (fileptr, numberOfBytes) just like the classes in this module, so you can add your own or replace ours'''
+	datagramClasses[typeOfDatagram] = datagramClass
+
+registerDatagram('3', E_EXTRA)			# 3_EXTRA PARAMETERS DECIMAL 51
+registerDatagram('A', A_ATTITUDE)		# A ATTITUDE
+registerDatagram('C', C_CLOCK)			# C Clock
+registerDatagram('D', D_DEPTH)			# D DEPTH
+registerDatagram('f', f_RAWRANGE)		# f Raw Range
+registerDatagram('h', h_HEIGHT)			# h Height, not to be confused with H_Heading!
+registerDatagram('I', I_INSTALLATION)	# I Installation (Start)
+registerDatagram('i', i_INSTALLATION)	# i Installation (Stop)
+registerDatagram('n', n_ATTITUDE)		# n ATTITUDE
+registerDatagram('N', N_TRAVELTIME)		# N Angle and Travel Time
+registerDatagram('O', O_QUALITYFACTOR)	# O_QUALITYFACTOR
+registerDatagram('R', R_RUNTIME)		# R_RUNTIME
+registerDatagram('P', P_POSITION)		# P Position
+registerDatagram('U', U_SVP)			# U Sound Velocity
+registerDatagram('X', X_DEPTH)			# X Depth
+registerDatagram('Y', Y_SEABEDIMAGE)	# Y_SeabedImage
+
 ###############################################################################
 # TIME HELPER FUNCTIONS
 ###############################################################################
 def to_timestamp(dateObject):
 	return (dateObject - datetime(1970, 1, 1)).total_seconds()
 
+def to_timestamps(recordDates, recordTimes):
+	'''return a numpy array of unix timestamps from arrays of kongsberg YYYYMMDD dates and seconds since midnight'''
+	recordDates = np.asarray(recordDates, dtype=np.int64)
+	years = (recordDates // 10000 - 1970).astype('datetime64[Y]')
+	months = (recordDates // 100 % 100 - 1).astype('timedelta64[M]')
+	days = (recordDates % 100 - 1).astype('timedelta64[D]')
+	midnight = ((years + months).astype('datetime64[D]') + days).astype(np.int64) * 86400
+	return midnight + np.asarray(recordTimes, dtype=np.float64)
+
 def to_DateTime(recordDate, recordTime):
 	'''return a python date object from a split date and time record. works with kongsberg date and time structures'''
-	date_object = datetime.strptime(str(recordDate), '%Y%m%d') + timedelta(0,recordTime)
-	return date_object
+	return midnightDateTime(recordDate) + timedelta(0,recordTime)
+
+# the midnight at the start of each kongsberg YYYYMMDD date we have seen.  a file only spans a few dates, so this stays tiny
+midnightDateTimes = {}
+
+def midnightDateTime(recordDate):
+	'''return a python date object for midnight at the start of a kongsberg date.  the same as parsing the date with strptime, but each date is only converted once'''
+	midnight = midnightDateTimes.get(recordDate)
+	if midnight is None:
+		midnight = datetime.strptime(str(recordDate), '%Y%m%d')
+		midnightDateTimes[recordDate] = midnight
+	return midnight
+
+def recordTimestamp(recordDate, recordTime):
+	'''return the unix timestamp from a kongsberg date and seconds since midnight.  the same value as to_timestamp(to_DateTime(recordDate, recordTime))'''
+	return to_timestamp(midnightDateTime(recordDate) + timedelta(0,recordTime))
+
+def recordTimestamps(recordDates, recordTimes):
+	'''the array version of recordTimestamp.  Unlike to_timestamps, the times are rounded to the microsecond like timedelta does, so we get exactly the same values as converting one record at a time'''
+	midnights = to_timestamps(recordDates, 0).astype(np.int64)
+	return (midnights * 1000000 + np.round(np.asarray(recordTimes, dtype=np.float64) * 1e6).astype(np.int64)) / 1e6
 
 def from_timestamp(unixtime):
 	return datetime.utcfromtimestamp(unixtime)
 
+def to_KongsbergDateTimes(timestamps):
+	'''the inverse of to_timestamps.  return numpy arrays of kongsberg YYYYMMDD dates and milliseconds since midnight from an array of unix timestamps.  The arithmetic follows from_timestamp and dateToSecondsSinceMidnight, so we get the same values as converting one timestamp at a time'''
+	timestamps = np.asarray(timestamps, dtype=np.float64)
+	seconds = np.floor(timestamps)
+	# like datetime, round the fraction to the nearest microsecond
+	microseconds = seconds.astype(np.int64) * 1000000 + np.round((timestamps - seconds) * 1e6).astype(np.int64)
+	days, microseconds = np.divmod(microseconds, 86400000000)
+	recordTimes = (microseconds / 1e6 * 1000).astype(np.int64)
+	dates = days.astype('datetime64[D]')
+	months = dates.astype('datetime64[M]')
+	recordDates = (months.astype('datetime64[Y]').astype(np.int64) + 1970) * 10000 + (months.astype(np.int64) % 12 + 1) * 100 + (dates - months).astype(np.int64) + 1
+	return recordDates, recordTimes
+
+def to_KongsbergDateTime(timestamp):
+	'''the inverse of recordTimestamp for the encoders.  return the kongsberg YYYYMMDD date and milliseconds since midnight of a unix timestamp, the same values as dateToKongsbergDate and dateToSecondsSinceMidnight give without formatting strings'''
+	d = from_timestamp(timestamp)
+	microseconds = ((d.hour * 3600 + d.minute * 60 + d.second) * 1000000) + d.microsecond
+	return d.year * 10000 + d.month * 100 + d.day, int(microseconds / 1000000 * 1000)
+
 def dateToKongsbergDate(dateObject):
 	return dateObject.strftime('%Y%m%d')
 
@@ -1984,6 +2612,85 @@ def dateToKongsbergTime(dateObject):
 def dateToSecondsSinceMidnight(dateObject):
 	return (dateObject - dateObject.replace(hour=0, minute=0, second=0, microsecond=0)).total_seconds()
 
+###############################################################################
+# ATTITUDE HELPER FUNCTIONS
+###############################################################################
+def attitudeRecords(typeOfDatagram, data):
+	'''return the attitude records in the raw bytes of an 'A' or 'n' datagram as an array of the class rec_dtype, without decoding the datagram.  A truncated datagram gives us the records which are complete'''
+	if typeOfDatagram == 'A':
+		numberEntries = struct.unpack_from('=H', data, 20)[0]
+		numberEntries = min(numberEntries, (len(data) - A_ATTITUDE.header_len) // A_ATTITUDE.rec_dtype.itemsize)
+		return np.frombuffer(data, dtype=A_ATTITUDE.rec_dtype, count=max(numberEntries, 0), offset=A_ATTITUDE.header_len)
+
+	# walk the byte counts to find where each 'n' record starts, then gather the fixed part of every record in one go
+	numberEntries = struct.unpack_from('=H', data, 20)[0]
+	rec_len = n_ATTITUDE.rec_dtype.itemsize
+	starts = []
+	start = n_ATTITUDE.header_len
+	while len(starts) < numberEntries and start + rec_len < len(data):
+		starts.append(start)
+		start += rec_len + 1 + data[start + rec_len]
+	body = np.frombuffer(data, dtype=np.uint8)
+	gathered = body[np.add.outer(np.array(starts, dtype=np.int64), np.arange(rec_len))]
+	return gathered.reshape(-1).view(n_ATTITUDE.rec_dtype)
+
+###############################################################################
+# INDEX AND CACHE HELPER FUNCTIONS
+###############################################################################
+def typeCodes(types):
+	'''convert a string of datagram types such as 'AhP' into an array of the type byte values'''
+	return np.frombuffer(types.encode('ascii'), dtype=np.uint8)
+
+def loadCache(cacheFileName, sourceFileName):
+	'''load the arrays from a numpy sidecar file, provided it was built from the current version of the source file.  returns None if there is no valid cache'''
+	if not os.path.isfile(cacheFileName):
+		return None
+	try:
+		stat = os.stat(sourceFileName)
+		with np.load(cacheFileName, allow_pickle=False) as cache:
+			if int(cache['sourceSize']) != stat.st_size or int(cache['sourceMtime']) != stat.st_mtime_ns:
+				return None
+			return {key: cache[key] for key in cache.files}
+	except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+		return None
+
+def saveCache(cacheFileName, sourceFileName, **arrays):
+	'''save arrays to a numpy sidecar file stamped with the size and modification time of the source file, so we can tell when it goes stale'''
+	stat = os.stat(sourceFileName)
+	tempFileName = None
+	try:
+		# a temporary file of our own, so parallel workers saving the same cache do not write over each other before the rename
+		fd, tempFileName = tempfile.mkstemp(dir=os.path.dirname(cacheFileName) or '.', suffix=".tmp")
+		with os.fdopen(fd, 'wb') as f:
+			np.savez(f, sourceSize=stat.st_size, sourceMtime=stat.st_mtime_ns, **arrays)
+		os.replace(tempFileName, cacheFileName)
+	except OSError:
+		# read only media is fine, we just cannot keep the cache for next time
+		print ("unable to write cache file, continuing without it:", cacheFileName)
+		if tempFileName is not None and os.path.exists(tempFileName):
+			os.remove(tempFileName)
+
+###############################################################################
+# CHECKSUM HELPER FUNCTIONS
+###############################################################################
+def sumBytes(data):
+	'''the sum of the bytes in a bytes like object.  below a few hundred bytes, setting up numpy costs more than a plain python sum'''
+	if len(data) < 256:
+		return sum(data)
+	return int(np.frombuffer(data, dtype=np.uint8).sum(dtype=np.uint64))
+
+def packFooter(datagram):
+	'''fill in the ETX and checksum in the last 3 bytes of a datagram packed into a preallocated buffer'''
+	ETX = 3
+	struct.pack_into('=BH', datagram, len(datagram) - 3, ETX, sumBytes(memoryview(datagram)[5:-3]) % 65536)
+	return datagram
+
+def verifyChecksum(datagram):
+	'''return True if a complete datagram, from the length field to the checksum, has an ETX and a checksum which matches its contents'''
+	if len(datagram) < 8 or datagram[-3] != 3:
+		return False
+	return sumBytes(memoryview(datagram)[5:-3]) % 65536 == struct.unpack_from('<H', datagram, len(datagram) - 2)[0]
+
 ###############################################################################
 # bitwise helper functions
 ###############################################################################
@@ -1995,6 +2702,15 @@ def isBitSet(int_type, offset):
 def set_bit(value, bit):
  return value | (1<<bit)
 
+###############################################################################
+# array helper functions
+###############################################################################
+def zeroNaN(values):
+	'''return a float64 copy of a numpy array with any NaN values replaced by zero'''
+	values = values.astype(np.float64)
+	values[np.isnan(values)] = 0
+	return values
+
 if __name__ == "__main__":
 		main()
 		# exit()
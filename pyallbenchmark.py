@@ -0,0 +1,233 @@
+#name:			pyALLBenchmark
+#created:		October 2026
+#description:	python module to time the hot paths in pyall against a real .all file so we can keep an eye on processing performance
+#See readme.md for more details
+
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from datetime import datetime
+from datetime import timedelta
+from functools import partial
+from argparse import ArgumentParser
+import numpy as np
+import pyall
+
+###############################################################################
+def main():
+	parser = ArgumentParser(description='Time the per record overheads of pyall against a Kongsberg .all file.',
+			epilog='Example: \n To benchmark a single file use -i c:/temp/myfile.all\n')
+	parser.add_argument('-i', dest='inputFile', action='store', help='Input ALL filename to benchmark')
+	parser.add_argument('-passes', dest='passes', action='store', default="5", help='Number of passes through the file.  The best pass is reported. [Default: 5]')
+	parser.add_argument('-mmap', action='store_true', default=False, dest='mmap', help='Read the file using memory mapping.  [Default: False]')
+
+	if len(sys.argv)==1:
+		parser.print_help()
+		sys.exit(1)
+
+	args = parser.parse_args()
+	passes = int(args.passes)
+
+	print ("Benchmarking: %s" % args.inputFile)
+	benchmarkDispatch(args.inputFile, passes, args.mmap)
+	benchmarkEncode(args.inputFile, passes, args.mmap)
+	benchmarkTime(args.inputFile, passes, args.mmap)
+
+###############################################################################
+def benchmarkDispatch(fileName, passes, memoryMap=False):
+	'''time the cost of turning each record into a datagram shell, i.e. reading the header, picking the class and making the object.  No datagram is decoded'''
+	r = pyall.ALLReader(fileName, memoryMap)
+	best = None
+	recordCount = 0
+	for p in range(passes):
+		r.rewind()
+		recordCount = 0
+		start_time = time.perf_counter()
+		while r.moreData():
+			typeOfDatagram, datagram = r.readDatagram()
+			recordCount += 1
+		duration = time.perf_counter() - start_time
+		best = duration if best is None else min(best, duration)
+
+	# now see how much memory the shells need if we hold onto them
+	r.rewind()
+	tracemalloc.start()
+	shells = []
+	while r.moreData():
+		shells.append(r.readDatagram()[1])
+	shellBytes = tracemalloc.get_traced_memory()[0]
+	tracemalloc.stop()
+	r.close()
+
+	# the old if chain did up to 16 comparisons to find the class.  time that against the registry lookup for the same records
+	types = [datagram.typeOfDatagram for datagram in shells]
+	start_time = time.perf_counter()
+	for p in range(passes):
+		for typeOfDatagram in types:
+			chainLookup(typeOfDatagram)
+	chainDuration = (time.perf_counter() - start_time) / passes
+	start_time = time.perf_counter()
+	for p in range(passes):
+		for typeOfDatagram in types:
+			pyall.datagramClasses.get(typeOfDatagram)
+	registryDuration = (time.perf_counter() - start_time) / passes
+
+	recordCount = max(recordCount, 1)
+	print ("Records: %d" % recordCount)
+	print ("Read header, dispatch and make shell: %.3f us per record" % (best * 1e6 / recordCount))
+	print ("Memory per shell: %.1f bytes" % (shellBytes / recordCount))
+	print ("Class lookup, if chain: %.3f us per record, registry: %.3f us per record" % (chainDuration * 1e6 / recordCount, registryDuration * 1e6 / recordCount))
+
+###############################################################################
+def benchmarkEncode(fileName, passes, memoryMap=False):
+	'''time encode() for every datagram type we can encode.  The datagrams in the file are decoded once up front, so we time just the encoding.  The A, h and P encoders are fed the records from the file'''
+	r = pyall.ALLReader(fileName, memoryMap)
+	datagrams = defaultdict(list)
+	attitude = []
+	heights = []
+	positions = []
+	beamPointingAngles = []
+	# a flat angular response curve, so the Y encoder has a correction for every angle
+	ARC = {float(angle): 0.0 for angle in range(-90, 91)}
+	while r.moreData():
+		typeOfDatagram, datagram = r.readDatagram()
+		if typeOfDatagram in 'DfOXY':
+			datagram.read()
+			if typeOfDatagram == 'Y':
+				if len(beamPointingAngles) == 0:
+					continue
+				datagrams[typeOfDatagram].append(partial(datagram.encode, ARC, beamPointingAngles))
+			else:
+				datagrams[typeOfDatagram].append(datagram.encode)
+		elif typeOfDatagram == 'N':
+			datagram.readFields('BeamPointingAngle')
+			beamPointingAngles = datagram.BeamPointingAngle
+		elif typeOfDatagram == 'A':
+			datagram.read()
+			# the encoder wants unix timestamp, roll, pitch, heave, heading
+			midnight = pyall.recordTimestamp(datagram.RecordDate, 0)
+			attitude.append([[midnight + record[1]] + record[3:7] for record in datagram.Attitude])
+		elif typeOfDatagram == 'h':
+			datagram.read()
+			heights.append((datagram.Height, datagram.RecordDate, datagram.Time * 1000, datagram.Counter))
+		elif typeOfDatagram == 'P':
+			datagram.read()
+			positions.append((datagram.RecordDate, datagram.Time * 1000, datagram.Counter, datagram.Latitude, datagram.Longitude, datagram.Quality, datagram.SpeedOverGround, datagram.CourseOverGround, datagram.Heading, datagram.Descriptor, datagram.NBytesDatagram, datagram.data))
+	r.close()
+
+	encoders = {}
+	for typeOfDatagram in sorted(datagrams):
+		encoders[typeOfDatagram] = datagrams[typeOfDatagram]
+	attitudeEncoder = pyall.A_ATTITUDE_ENCODER()
+	encoders['A'] = [partial(attitudeEncoder.encode, records, counter) for counter, records in enumerate(attitude) if len(records) > 0]
+	heightEncoder = pyall.h_HEIGHT_ENCODER()
+	encoders['h'] = [partial(heightEncoder.encode, *height) for height in heights]
+	positionEncoder = pyall.P_POSITION_ENCODER()
+	encoders['P'] = [partial(positionEncoder.encode, *position) for position in positions]
+
+	print ("Encode throughput, best of %d passes:" % passes)
+	for typeOfDatagram, calls in encoders.items():
+		if len(calls) == 0:
+			continue
+		best = None
+		for p in range(passes):
+			byteCount = 0
+			start_time = time.perf_counter()
+			for encode in calls:
+				byteCount += len(encode())
+			duration = time.perf_counter() - start_time
+			best = duration if best is None else min(best, duration)
+		best = max(best, 1e-9)
+		print ("  %-24s %8d datagrams %10.2f us per datagram %10.1f MB/s" % (pyall.ALLReader.getDatagramName(typeOfDatagram), len(calls), best * 1e6 / len(calls), byteCount / 1e6 / best))
+
+###############################################################################
+def benchmarkTime(fileName, passes, memoryMap=False):
+	'''time the conversions between kongsberg date and time fields and unix timestamps, one at a time and as arrays, against the strptime and strftime conversions they replace.  We use the time of every datagram and every attitude record in the file'''
+	r = pyall.ALLReader(fileName, memoryMap)
+	recordDates = []
+	recordTimes = []
+	while r.moreData():
+		typeOfDatagram, datagram = r.readDatagram()
+		recordDates.append(r.recordDate)
+		recordTimes.append(r.recordTime)
+		if typeOfDatagram == 'A':
+			datagram.read()
+			for a in datagram.Attitude:
+				recordDates.append(a[0])
+				recordTimes.append(a[1])
+	r.close()
+	recordCount = max(len(recordDates), 1)
+	timestamps = [pyall.recordTimestamp(recordDate, recordTime) for recordDate, recordTime in zip(recordDates, recordTimes)]
+	dateArray = np.array(recordDates)
+	timeArray = np.array(recordTimes)
+	timestampArray = np.array(timestamps)
+
+	conversions = [
+		("to timestamp, strptime", lambda: [strptimeTimestamp(recordDate, recordTime) for recordDate, recordTime in zip(recordDates, recordTimes)]),
+		("to timestamp, recordTimestamp", lambda: [pyall.recordTimestamp(recordDate, recordTime) for recordDate, recordTime in zip(recordDates, recordTimes)]),
+		("to timestamp, to_timestamps", lambda: pyall.to_timestamps(dateArray, timeArray)),
+		("to kongsberg, strftime", lambda: [strftimeKongsbergDateTime(timestamp) for timestamp in timestamps]),
+		("to kongsberg, to_KongsbergDateTime", lambda: [pyall.to_KongsbergDateTime(timestamp) for timestamp in timestamps]),
+		("to kongsberg, to_KongsbergDateTimes", lambda: pyall.to_KongsbergDateTimes(timestampArray)),
+	]
+	print ("Time conversions, best of %d passes over %d records:" % (passes, recordCount))
+	for name, convert in conversions:
+		best = None
+		for p in range(passes):
+			start_time = time.perf_counter()
+			convert()
+			duration = time.perf_counter() - start_time
+			best = duration if best is None else min(best, duration)
+		print ("  %-36s %10.3f us per record" % (name, best * 1e6 / recordCount))
+
+###############################################################################
+def strptimeTimestamp(recordDate, recordTime):
+	'''the unix timestamp as it was computed before the midnight cache.  only used as the baseline for benchmarkTime'''
+	return pyall.to_timestamp(datetime.strptime(str(recordDate), '%Y%m%d') + timedelta(0,recordTime))
+
+def strftimeKongsbergDateTime(timestamp):
+	'''the kongsberg date and time as the encoders computed them before to_KongsbergDateTime.  only used as the baseline for benchmarkTime'''
+	dateObject = pyall.from_timestamp(timestamp)
+	return int(pyall.dateToKongsbergDate(dateObject)), int(pyall.dateToSecondsSinceMidnight(dateObject)*1000)
+
+###############################################################################
+def chainLookup(typeOfDatagram):
+	'''the class lookup as it was done before the datagram registry.  only used as the baseline for benchmarkDispatch'''
+	if typeOfDatagram == '3':
+		return pyall.E_EXTRA
+	if typeOfDatagram == 'A':
+		return pyall.A_ATTITUDE
+	if typeOfDatagram == 'C':
+		return pyall.C_CLOCK
+	if typeOfDatagram == 'D':
+		return pyall.D_DEPTH
+	if typeOfDatagram == 'f':
+		return pyall.f_RAWRANGE
+	if typeOfDatagram == 'h':
+		return pyall.h_HEIGHT
+	if typeOfDatagram == 'I':
+		return pyall.I_INSTALLATION
+	if typeOfDatagram == 'i':
+		return pyall.i_INSTALLATION
+	if typeOfDatagram == 'n':
+		return pyall.n_ATTITUDE
+	if typeOfDatagram == 'N':
+		return pyall.N_TRAVELTIME
+	if typeOfDatagram == 'O':
+		return pyall.O_QUALITYFACTOR
+	if typeOfDatagram == 'R':
+		return pyall.R_RUNTIME
+	if typeOfDatagram == 'P':
+		return pyall.P_POSITION
+	if typeOfDatagram == 'U':
+		return pyall.U_SVP
+	if typeOfDatagram == 'X':
+		return pyall.X_DEPTH
+	if typeOfDatagram == 'Y':
+		return pyall.Y_SEABEDIMAGE
+	return None
+
+###############################################################################
+if __name__ == "__main__":
+	main()
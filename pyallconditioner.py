@@ -4,8 +4,13 @@
 #description:	python module to pre-process a Kongsberg ALL sonar file and do useful things with it
 #See readme.md for more details
 
+import contextlib
+import copy
 import csv
+import io
+import multiprocessing
 import sys
+import traceback
 import time
 import math
 import os
@@ -17,15 +22,12 @@ from datetime import timedelta
 from glob import glob
 import pyall
 import POSMVRead
-import struct
 import numpy as np
 # from bisect import bisect_left, bisect_right
 # import sortedcollection
 # from operator import itemgetter
-from collections import deque
 from collections import defaultdict
 import matplotlib.pyplot as plt
-from scipy import stats
 from scipy import signal
 
 ###############################################################################
@@ -51,6 +53,7 @@ def main():
 	parser.add_argument('-injectA', dest='injectAFileName', action='store', default="", help='Inject this ATTITUDE file as "A" datagrams. e.g. -injectA "*.srh|*.txt" (Hint: remember the quotes!)')
 	parser.add_argument('-injectAH', dest='injectAHFileName', action='store', default="", help='Inject this ATTIDUE+HEIGHT file as "A" and "H" datagrams. e.g. -injectAH "*.txt" (Hint: remember the quotes!)')
 	parser.add_argument('-injectP', dest='injectPOSITIONFileName', action='store', default="", help='Inject this POSITION file as "P" datagrams. e.g. -inject myposition.txt or -injectP "*.txt" (Hint: remember the quotes for wildcard!)')
+	parser.add_argument('-overlap', dest='overlap', action='store', default="all", choices=['all', 'first', 'last'], help='When the injection files overlap in time, keep all the records with the same timestamp, or only the record from the first or the last file. e.g. -overlap first [Default: all]')
 	parser.add_argument('-injectbscorr', dest='injectbscorr', action='store', default="", help='Apply a correction to the Y_SeabedImage datagrams by adding a CSV correction file as createed with the -extractbscorr option. eg. -injectbscorr c:/angularResponse.csv')
 	parser.add_argument('-splitd', action='store_true', default=False, dest='splitd', help='split the .all file every time the depth mode changes.  [Default: False]')
 	parser.add_argument('-splitf', action='store_true', default=False, dest='splitf', help='split the .all file every time the central frequency changes.  [Default: False]')
@@ -59,6 +62,8 @@ def main():
 	parser.add_argument('-beamqc', dest='beamqc', action='store_true', default=False, help='for QC purposes compute a best fit line through each ping and the delta Z for each beam, then compute the mean deviation. Identify noisy beams.')
 	parser.add_argument('-testfwrite', dest='testfwrite', action='store_true', default=False, help='test the encoding of f records.')
 	parser.add_argument('-testdwrite', dest='testdwrite', action='store_true', default=False, help='test the encoding of D records.')
+	parser.add_argument('-jobs', dest='jobs', action='store', default="1", help='Process this many files at the same time using worker processes.  The log is still printed in file order.  When only -extractbackscatter, -extractnadir or -wobble are used, each file is also cut into this many byte ranges which are decoded in parallel. e.g. -jobs 8  [Default: 1]')
+	parser.add_argument('-mmap', dest='mmap', action='store_true', default=False, help='memory map the .all files so datagrams are decoded and written without extra seeks or copies.  Recommended for large files.  [Default: False]')
 
 	if len(sys.argv)==1:
 		parser.print_help()
@@ -66,21 +71,19 @@ def main():
 
 	args = parser.parse_args()
 
-	fileCounter=0
 	matches				= []
-	correctBackscatter 	= False
 	writeConditionedFile= True
 	splitd				= False
-	splitfileend		= 0
 	splitt				= 0
-	latitude			= 0
-	longitude			= 0
 	wobble				= False
 	beamQC 				= False
 	testfwrite			= False
 	testdwrite			= False
-	centerFrequency 	= 0
-	outFilePtr 			= None
+	ARC					= None
+	heads				= {}
+	SRH					= None
+	ATT					= None
+	POS					= None
 
 	if args.recursive:
 		for root, dirnames, filenames in os.walk(os.path.dirname(args.inputFile)):
@@ -113,34 +116,32 @@ def main():
 		testdwrite = True
 		# args.exclude += 'D' # we need to NOT write out the original data as we will be creating new records
 		writeConditionedFile = True # we dont need to write a conditioned .all file
-		dwrite = 0
 
 	if len(args.injectbscorr) > 0:
-		beamPointingAngles = []
 		ARC = loadARC(args.injectbscorr)
 		args.exclude = 'Y' # we need to NOT write out the original data as we will be creating new records
 
 	if args.extractbackscatter:
 		writeConditionedFile= False #we do not need to write out a .all file
 		# we need a generic set of beams into which we can insert individual ping data.  Thhis will be the angular respnse curve
-		beamdetail = [0,0,0,0]
-		startAngle = -90
-		ARC = [pyall.cBeam(beamdetail, i) for i in range(startAngle, -startAngle)]
-		beamPointingAngles = []
-		transmitSector = []
-		outFileName = os.path.join(os.path.dirname(os.path.abspath(matches[0])), args.odir, "AngularResponseCurve.csv")
-		outFileName = createOutputFileName(outFileName)
-
-	# the user has specified a file for injection, so load it into a dictionary so we inject them into the correct spot in the file
+		ARC = createAngularResponseCurve()
+		arcFileName = os.path.join(os.path.dirname(os.path.abspath(matches[0])), args.odir, "AngularResponseCurve.csv")
+		arcFileName = createOutputFileName(arcFileName)
+
+	# the user has specified a file for injection, so load the records which fall within the time span of the .all files so we inject them into the correct spot in the file
+	window = None
+	if args.injectAFileName or args.injectAHFileName or args.injectPOSITIONFileName:
+		window = injectionWindow(matches, args.mmap)
+
 	if args.injectAFileName:
 		print ("Injector will inject system 1 'A' records as an active attitude data sensor with pitch,roll,heave and heading data. You may well need to also use the -exclude A to remove the existing records so the .all file is not conflicted")
 		if args.injectAFileName.lower().endswith('.srh'):
 			SRH = SRHReader()
-			SRH.loadFiles(args.injectAFileName) # load all the filenames
+			SRH.loadFiles(args.injectAFileName, args.overlap, window) # load all the filenames
 			print ("Records to inject: %d" % len(SRH.SRHData))
 		if args.injectAFileName.lower().endswith('.txt'):
 			ATT = ATTReader()
-			ATT.loadFiles(args.injectAFileName)
+			ATT.loadFiles(args.injectAFileName, args.overlap, window)
 			print ("Records to inject: %d" % len(ATT.ATTData))
 		else:
 			print ("Injecting POSMV True Heave Data...")
@@ -150,7 +151,7 @@ def main():
 		print ("Injector will inject 'h' height records GPS height from atttitde CSV file You may well need to also use the -exclude h to remove the existing records so the .all file is not conflicted")
 		if args.injectAHFileName.lower().endswith('.txt'):
 			ATT = ATTReader()
-			ATT.loadFiles(args.injectAHFileName)
+			ATT.loadFiles(args.injectAHFileName, args.overlap, window)
 			print ("Records to inject: %d" % len(ATT.ATTData))
 		# auto exclude attitude records.  on reflection, we should probably NOT do this.
 		# args.exclude = 'n'
@@ -159,14 +160,26 @@ def main():
 		print ("Injector will inject system 1 'P' attitude records as an active attitude data sensor with latitude, longitude data. You may well need to also use the -exclude P to remove the existing records so the .all file is not conflicted")
 		if args.injectPOSITIONFileName.lower().endswith('.txt'):
 			POS = POSITIONReader()
-			POS.loadFiles(args.injectPOSITIONFileName)
+			POS.loadFiles(args.injectPOSITIONFileName, args.overlap, window)
 			print ("Records to inject: %d" % len(POS.PositionData))
 		# auto exclude attitude records.  on reflection, we should probably NOT do this.
 		# args.exclude = 'n'
 
+	# sort the records to inject by time once, so every file can find its records with a binary search
+	injectors = []
+	if args.injectAFileName:
+		if args.injectAFileName.lower().endswith('.srh'):
+			injectors.append(cInjector('A', SRH.SRHData))
+		if args.injectAFileName.lower().endswith('.txt'):
+			injectors.append(cInjector('A', ATT.ATTData))
+	if args.injectAHFileName and args.injectAHFileName.lower().endswith('.txt'):
+		injectors.append(cInjector('A', ATT.ATTData, injectHeight=True))
+	if args.injectPOSITIONFileName and args.injectPOSITIONFileName.lower().endswith('.txt'):
+		injectors.append(cInjector('P', POS.PositionData, strings=POS.PositionStrings))
+
 	if args.extractinstall:
 		writeConditionedFile= False #we do not need to write out a .all file
-		r = pyall.ALLReader(matches[0])
+		r = pyall.ALLReader(matches[0], args.mmap)
 		installStart, installStop, initialMode, datagram = r.loadInstallationRecords()
 		r.close()
 		# header = "Waterline(m),Transmit X(m), Transmit Y(m), Transmit Z(m), Receive(X), Receive(Y), Receive(Z), "
@@ -180,7 +193,6 @@ def main():
 		writeConditionedFile= False #we do not need to write out a .all file
 
 	if args.extractclock:
-		timestamps=[]
 		writeConditionedFile= False #we do not need to write out a .all file
 
 	if args.extractattitude:
@@ -206,18 +218,14 @@ def main():
 
 	if args.splitd:
 		splitd=True
-		initialDepthMode = ""
-
-	if args.splitf:
-		centerFrequency = 0
 
 	if args.beamqc:
 		beamQC=True
-		heads = {}
 		writeConditionedFile= False
-		r = pyall.ALLReader(matches[0])
+		r = pyall.ALLReader(matches[0], args.mmap)
 		# we need the head installation parameters so we can compute and use the take off angles.
-		installStart, installStop, initialMode, datagram = r.loadInstallationRecords()
+		typeOfDatagram, datagram = next(r.datagramsOfType('I'))
+		datagram.read()
 		head = getHead(heads, datagram.SerialNumber)
 		head.installationParameters = datagram.installationParameters
 		head.installationRollAngle = float(head.installationParameters['S1R'])
@@ -231,709 +239,917 @@ def main():
 		writeConditionedFile= False
 		wobbleResults = []
 		attitudeData = []
+
+	# when we are only extracting, we can stream through just the datagrams the extraction needs and skip everything else
+	loopTypes = None
+	if not (writeConditionedFile or beamQC or wobble or args.extractnadir or args.extractbackscatter):
+		# the attitude is converted in bulk by loadAttitude(), so the loop does not need the 'A' datagrams
+		extractTypes = {'extractclock': 'C', 'extractheight': 'h', 'extractposition': 'P', 'extractattitude': '', 'extractattitudeheight': 'h', 'extractruntime': 'R', 'extractinstall': 'I', 'extractsvp': 'U', 'extractbscorr': '3'}
+		loopTypes = "".join(extractTypes[option] for option in extractTypes if getattr(args, option))
+		if len(loopTypes) == 0 and not any(getattr(args, option) for option in extractTypes):
+			loopTypes = None
+
+	# the backscatter, nadir and wobble reductions can also be split into byte ranges within a file, so long as nothing else needs the whole file
+	chunkModes = ['extractbackscatter', 'extractnadir', 'wobble']
+	wholeFileModes = ['extractclock', 'extractheight', 'extractposition', 'extractattitude', 'extractattitudeheight', 'extractruntime', 'extractinstall', 'extractsvp', 'extractbscorr', 'beamqc']
+	chunkFiles = not writeConditionedFile and any(getattr(args, option) for option in chunkModes) and not any(getattr(args, option) for option in wholeFileModes)
+
+	# when all we do is drop datagrams, nothing needs decoding so the datagrams we keep can be copied across in large runs
+	rewriteModes = ['splitf', 'injectAFileName', 'injectAHFileName', 'injectPOSITIONFileName', 'injectbscorr']
+	excludeOnly = writeConditionedFile and not (splitd or splitt > 0 or testfwrite or testdwrite) and not any(getattr(args, option) for option in rewriteModes)
+
+	settings = cSettings(writeConditionedFile=writeConditionedFile, splitd=splitd, splitt=splitt, wobble=wobble, beamQC=beamQC, testfwrite=testfwrite, testdwrite=testdwrite, loopTypes=loopTypes, chunkFiles=chunkFiles, excludeOnly=excludeOnly, ARC=ARC, heads=heads, injectors=injectors)
 # #################################################################################
-	for filename in matches:
-		if args.injectAFileName:
-			# find out the first and last timestamps in the .all file
-			r = pyall.ALLReader(filename)
-			count, start, end = r.getRecordCount()
-			# load the heave data from the posmv files
-			POSMVRead.loadData(args.injectAFileName, start, end)
-			r.close()
+	# the files are independent, so process them one at a time or in parallel with -jobs.  Either way the results come back in file order, so we can reduce the per file ARC, beamqc and wobble results here
+	for filename, (fileARC, fileHeads, fileWobbleResults, fileAttitudeData) in runFiles(matches, args, settings):
+		if args.extractbackscatter:
+			mergeAngularResponseCurve(ARC, fileARC)
+			# print out the extracted backscatter angular response curve
+			writeAngularResponseCurve(ARC, arcFileName, args.inputFile)
 
-		if args.extractruntime:
-			# create an output file based on the input
-			outFileName = os.path.join(os.path.dirname(os.path.abspath(filename)), args.odir, os.path.basename(filename))
-			outFileName = os.path.splitext(outFileName)[0]+'_RUNTIME.txt'
-			# outFileName  = addFileNameAppendage(outFileName, args.odix)
-			outFileName  = createOutputFileName(outFileName)
-			outRuntimeFilePtr = open(outFileName, 'w')
-			print ("writing RUNTIME to file: %s" % outFileName)
+		if beamQC:
+			mergeHeads(heads, fileHeads)
 
-		if args.extractnadir:
-			# create an output file based on the input
-			outFileName = os.path.join(os.path.dirname(os.path.abspath(filename)), args.odir, os.path.basename(filename))
-			outFileName = os.path.splitext(outFileName)[0]+'_NADIR.txt'
-			# outFileName  = addFileNameAppendage(outFileName, args.odix)
-			outFileName  = createOutputFileName(outFileName)
-			outNadirFilePtr = open(outFileName, 'w')
-			print ("writing NADIR to file: %s" % outFileName)
+		if wobble:
+			wobbleResults += fileWobbleResults
+			attitudeData += fileAttitudeData
+			plotWobble(wobbleResults, attitudeData, filename, args)
 
-		if args.extractattitude:
-			# create an output file based on the input
-			outFileName = os.path.join(os.path.dirname(os.path.abspath(filename)), args.odir, os.path.basename(filename))
-			outFileName = os.path.splitext(outFileName)[0]+'_ATTITUDE.txt'
-			# outFileName  = addFileNameAppendage(outFileName, args.odix)
-			outFileName  = createOutputFileName(outFileName)
-			outAttitudeFilePtr = open(outFileName, 'w')
-			print ("writing ATTITUDE to file: %s" % outFileName)
-		if args.extractclock:
-			# create an output file based on the input
-			outFileName = os.path.join(os.path.dirname(os.path.abspath(filename)), args.odir, os.path.basename(filename))
-			outFileName = os.path.splitext(outFileName)[0]+'_CLOCK.txt'
-			# outFileName  = addFileNameAppendage(outFileName, args.odix)
-			outFileName  = createOutputFileName(outFileName)
-			outClockFilePtr = open(outFileName, 'w')
-			print ("writing CLOCK to file: %s" % outFileName)
+	if beamQC:
+		plt.figure(figsize=(12,4))
+		# plt.axhline(0, color='black', linewidth=0.3)
+		plt.grid(linestyle='-', linewidth='0.2', color='black')
 
-		if args.extractheight:
-			# create an output file based on the input
-			outFileName = os.path.join(os.path.dirname(os.path.abspath(filename)), args.odir, os.path.basename(filename))
-			outFileName = os.path.splitext(outFileName)[0]+'_HEIGHT.txt'
-			# outFileName  = addFileNameAppendage(outFileName, args.odix)
-			outFileName  = createOutputFileName(outFileName)
-			outHeightFilePtr = open(outFileName, 'w')
-			print ("writing HEIGHT to file: %s" % outFileName)
+		trace=[]
+		names =[]
+		for key, head in heads.items():
+			names.append(head.ID)
+			beam = np.flatnonzero(head.beamCount)
+			profile = head.beamSum[beam] / head.beamCount[beam]
 
-		if args.extractposition:
-			# create an output file based on the input
-			outFileName = os.path.join(os.path.dirname(os.path.abspath(filename)), args.odir, os.path.basename(filename))
-			outFileName = os.path.splitext(outFileName)[0]+'_POSITION.txt'
-			# outFileName  = addFileNameAppendage(outFileName, args.odix)
-			outFileName  = createOutputFileName(outFileName)
-			outPositionFilePtr = open(outFileName, 'w')
-			print ("writing POSITION to file: %s" % outFileName)
+			trace.append(plt.bar(beam, profile))
 
-		if args.extractattitudeheight:
-			# create an output file based on the input
-			outFileName = os.path.join(os.path.dirname(os.path.abspath(filename)), args.odir, os.path.basename(filename))
-			outFileName = os.path.splitext(outFileName)[0]+'_ATTITUDEHEIGHT.txt'
-			# outFileName  = addFileNameAppendage(outFileName, args.odix)
-			outFileName  = createOutputFileName(outFileName)
-			outAttitudeHeightFilePtr = open(outFileName, 'w')
-			print ("writing ATTITUDE+HEIGHT to file: %s" % outFileName)
-			attitudeData = []
-			heightData = []
-
-		# if writeConditionedFile:
-		# 	# create an output file based on the input
-		# 	outFileName = os.path.join(os.path.dirname(os.path.abspath(filename)), args.odir, os.path.basename(filename))
-		# 	outFileName  = addFileNameAppendage(outFileName, args.odix)
-		# 	outFileName  = createOutputFileName(outFileName)
-		# 	outFilePtr = open(outFileName, 'wb')
-		# 	print ("writing to conditioned file: %s" % outFileName)
-
-		# open the file and do some initialisation stuff
-		r = pyall.ALLReader(filename)
-		counter = 0
+		plt.legend(trace, names)
+		plt.xlabel('Beam #')
+		plt.ylabel('Deviation(m)')
+		plt.title("Mean Slope Rectified Profile")
+		plt.ylim(-0.1,0.1)
 
-		if args.extractruntime:
-			s = "Runtime"
-			run = pyall.R_RUNTIME(outRuntimeFilePtr, 0)
-			s = run.header()
-			outRuntimeFilePtr.write(s + "\n")
+		# plt.text(0.05, 0.95, heads[names[0]].beamCount[100], fontsize=14, verticalalignment='top')
 
-		if args.extractclock:
-			s = "RecordDate,ExternalDate,RecordTime,ExternalTime,Difference,PPSInUse"
-			outClockFilePtr.write(s + "\n")
 
-		if args.extractattitude:
-			# read the first record so we get a date for the file header
-			typeOfDatagram, datagram = r.readDatagram()
-			s = r.currentRecordDateTime().strftime('%Y%m%d') + ",Timestamp, Roll, Pitch, Heave, Heading"
-			outAttitudeFilePtr.write(s + "\n")
+		outFileName = os.path.join(os.path.dirname(os.path.abspath(filename)), args.odir, os.path.basename(filename))
+		outFileName  = createOutputFileName(outFileName)
+		plt.savefig(os.path.splitext(outFileName)[0]+'_BeamQC.png', dpi = 300)
+		plt.show()
+		plt.close()
 
-		if args.extractheight:
-			# read the first record so we get a date for the file header
-			typeOfDatagram, datagram = r.readDatagram()
-			s = r.currentRecordDateTime().strftime('%Y%m%d') + ",Timestamp, Height"
-			outHeightFilePtr.write(s + "\n")
+	# update_progress("Process Complete: ", (fileCounter/len(matches)))
 
-		if args.extractnadir:
-			# read the first record so we get a date for the file header
-			typeOfDatagram, datagram = r.readDatagram()
-			s = "NadirDepth, TransducerDepth, currentRoll, currentPitch, currentHeave, currentHeading"
-			outNadirFilePtr.write(s + "\n")
+###############################################################################
+def processFile(filename, args, settings):
+	'''condition or extract a single .all file.  The results we accumulate across files (the backscatter ARC, the beamqc heads and the wobble results) are returned rather than shared, so the caller can merge them in file order'''
+	if settings.excludeOnly:
+		return excludeFile(filename, args, settings)
+
+	writeConditionedFile = settings.writeConditionedFile
+	splitd = settings.splitd
+	splitt = settings.splitt
+	wobble = settings.wobble
+	beamQC = settings.beamQC
+	testfwrite = settings.testfwrite
+	testdwrite = settings.testdwrite
+	loopTypes = settings.loopTypes
+	outFilePtr = None
+	outFileName = ""
+	splitfileend = 0
+	centerFrequency = 0
+	initialDepthMode = ""
+	dwrite = 0
+	startAngle = -90
+	beamPointingAngles = []
+	timestamps = []
+	wobbleResults = []
+	attitudeData = []
+	extractFilePtrs = []
+	# each file sums into its own angular response curve and heads so nothing is shared between files
+	ARC = settings.ARC
+	if args.extractbackscatter:
+		ARC = createAngularResponseCurve(startAngle)
+		# pair each seabed image with the raw range datagram from the same ping and head
+		pings = pyall.cPingAssembler('NY')
+	heads = copy.deepcopy(settings.heads)
+	if args.injectAFileName:
+		# find out the first and last timestamps in the .all file
+		r = pyall.ALLReader(filename, args.mmap)
+		count, start, end = r.getRecordCount()
+		# load the heave data from the posmv files
+		POSMVRead.loadData(args.injectAFileName, start, end)
+		r.close()
 
-		if args.extractposition:
-			# read the first record so we get a date for the file header
-			typeOfDatagram, datagram = r.readDatagram()
-			s = "Timestamp, Counter, Latitude, Longitude, Quality, Speed, Course, Heading, Descriptor, numBytes, Datagram"
-			# s = r.currentRecordDateTime().strftime('%Y%m%d') + ",Timestamp, Counter, Latitude, Longitude, Quality, Speed, Course, Heading, Descriptor, numBytes, Datagram"
-			outPositionFilePtr.write(s + "\n")
+	if args.extractruntime:
+		# create an output file based on the input
+		outFileName = os.path.join(os.path.dirname(os.path.abspath(filename)), args.odir, os.path.basename(filename))
+		outFileName = os.path.splitext(outFileName)[0]+'_RUNTIME.txt'
+		# outFileName  = addFileNameAppendage(outFileName, args.odix)
+		outFileName  = createOutputFileName(outFileName)
+		outRuntimeFilePtr = open(outFileName, 'w')
+		extractFilePtrs.append(outRuntimeFilePtr)
+		print ("writing RUNTIME to file: %s" % outFileName)
 
-		if args.extractattitudeheight:
-			# read the first record so we get a date for the file header
-			typeOfDatagram, datagram = r.readDatagram()
-			s = r.currentRecordDateTime().strftime('%Y%m%d') + ",Timestamp, Roll, Pitch, Heave, Heading, Height"
-			outAttitudeHeightFilePtr.write(s + "\n")
-
-		if splitd or args.splitf or splitt>0:
-			InstallStart, InstallEnd, initialDepthMode = r.loadInstallationRecords()
-			centerFrequency = r.loadCenterFrequency()
-
-		if args.injectAFileName:
-			TypeOfDatagram, datagram = r.readDatagram()
-			if args.injectAFileName.lower().endswith('.srh'):
-				# kill off the leading records so we do not swamp the filewith unwanted records
-				SRHSubset = deque(SRH.SRHData)
-				SRHSubset = trimInjectionData(pyall.to_timestamp(r.currentRecordDateTime()), SRHSubset)
-				r.rewind()
-			if args.injectAFileName.lower().endswith('.txt'):
-				# kill off the leading records so we do not swamp the filewith unwanted records
-				ATTSubset = deque(ATT.ATTData)
-				ATTSubset = trimInjectionData(pyall.to_timestamp(r.currentRecordDateTime()), ATTSubset)
-				r.rewind()
-		if args.injectAHFileName:
-			TypeOfDatagram, datagram = r.readDatagram()
-			if args.injectAHFileName.lower().endswith('.txt'):
-				# kill off the leading records so we do not swamp the filewith unwanted records
-				ATTSubset = deque(ATT.ATTData)
-				ATTSubset = trimInjectionData(pyall.to_timestamp(r.currentRecordDateTime()), ATTSubset)
-				r.rewind()
-				lastHeightTimeStamp = 0
-		if args.injectPOSITIONFileName:
-			TypeOfDatagram, datagram = r.readDatagram()
-			if args.injectPOSITIONFileName.lower().endswith('.txt'):
-				# kill off the leading records so we do not swamp the filewith unwanted records
-				POSSubset = deque(POS.PositionData)
-				POSSubset = trimInjectionData(pyall.to_timestamp(r.currentRecordDateTime()), POSSubset)
-				r.rewind()
-				lastPositionTimeStamp = 0
-		if args.extractsvp:
-			# we need the position of the SVP dip in the SVP file, so use the first position record in the file
-			nav = r.loadNavigation(True)
-			if len(nav) > 0:
-				latitude = nav[0][1]
-				longitude = nav[0][2]
-
-		currPitch = 0
-		currRoll = 0
-		currHeave = 0
-		currHeading = 0
-		currRuntime = ""
-		###############################################################
-		################ main loop through all records ################
-		###############################################################
-		while r.moreData():
-			# read a datagram.  If we support it, return the datagram type and aclass for that datagram
-			TypeOfDatagram, datagram = r.readDatagram()
-
-			if splitfileend == 0:
-				splitfileend = pyall.to_timestamp(r.currentRecordDateTime())
-
-			# read the bytes into a buffer
-			rawBytes = r.readDatagramBytes(datagram.offset, datagram.numberOfBytes)
-
-			if beamQC:
-				if TypeOfDatagram == 'f':
-					datagram.read()
+	if args.extractnadir:
+		# create an output file based on the input
+		outFileName = os.path.join(os.path.dirname(os.path.abspath(filename)), args.odir, os.path.basename(filename))
+		outFileName = os.path.splitext(outFileName)[0]+'_NADIR.txt'
+		# outFileName  = addFileNameAppendage(outFileName, args.odix)
+		outFileName  = createOutputFileName(outFileName)
+		outNadirFilePtr = open(outFileName, 'w')
+		extractFilePtrs.append(outNadirFilePtr)
+		print ("writing NADIR to file: %s" % outFileName)
+
+	if args.extractattitude:
+		# create an output file based on the input
+		outFileName = os.path.join(os.path.dirname(os.path.abspath(filename)), args.odir, os.path.basename(filename))
+		outFileName = os.path.splitext(outFileName)[0]+'_ATTITUDE.txt'
+		# outFileName  = addFileNameAppendage(outFileName, args.odix)
+		outFileName  = createOutputFileName(outFileName)
+		outAttitudeFilePtr = open(outFileName, 'w')
+		extractFilePtrs.append(outAttitudeFilePtr)
+		print ("writing ATTITUDE to file: %s" % outFileName)
+	if args.extractclock:
+		# create an output file based on the input
+		outFileName = os.path.join(os.path.dirname(os.path.abspath(filename)), args.odir, os.path.basename(filename))
+		outFileName = os.path.splitext(outFileName)[0]+'_CLOCK.txt'
+		# outFileName  = addFileNameAppendage(outFileName, args.odix)
+		outFileName  = createOutputFileName(outFileName)
+		outClockFilePtr = open(outFileName, 'w')
+		extractFilePtrs.append(outClockFilePtr)
+		print ("writing CLOCK to file: %s" % outFileName)
+
+	if args.extractheight:
+		# create an output file based on the input
+		outFileName = os.path.join(os.path.dirname(os.path.abspath(filename)), args.odir, os.path.basename(filename))
+		outFileName = os.path.splitext(outFileName)[0]+'_HEIGHT.txt'
+		# outFileName  = addFileNameAppendage(outFileName, args.odix)
+		outFileName  = createOutputFileName(outFileName)
+		outHeightFilePtr = open(outFileName, 'w')
+		extractFilePtrs.append(outHeightFilePtr)
+		print ("writing HEIGHT to file: %s" % outFileName)
+
+	if args.extractposition:
+		# create an output file based on the input
+		outFileName = os.path.join(os.path.dirname(os.path.abspath(filename)), args.odir, os.path.basename(filename))
+		outFileName = os.path.splitext(outFileName)[0]+'_POSITION.txt'
+		# outFileName  = addFileNameAppendage(outFileName, args.odix)
+		outFileName  = createOutputFileName(outFileName)
+		outPositionFilePtr = open(outFileName, 'w')
+		extractFilePtrs.append(outPositionFilePtr)
+		print ("writing POSITION to file: %s" % outFileName)
+
+	if args.extractattitudeheight:
+		# create an output file based on the input
+		outFileName = os.path.join(os.path.dirname(os.path.abspath(filename)), args.odir, os.path.basename(filename))
+		outFileName = os.path.splitext(outFileName)[0]+'_ATTITUDEHEIGHT.txt'
+		# outFileName  = addFileNameAppendage(outFileName, args.odix)
+		outFileName  = createOutputFileName(outFileName)
+		outAttitudeHeightFilePtr = open(outFileName, 'w')
+		extractFilePtrs.append(outAttitudeHeightFilePtr)
+		print ("writing ATTITUDE+HEIGHT to file: %s" % outFileName)
+		heightData = []
+
+	# if writeConditionedFile:
+	# 	# create an output file based on the input
+	# 	outFileName = os.path.join(os.path.dirname(os.path.abspath(filename)), args.odir, os.path.basename(filename))
+	# 	outFileName  = addFileNameAppendage(outFileName, args.odix)
+	# 	outFileName  = createOutputFileName(outFileName)
+	# 	outFilePtr = open(outFileName, 'wb')
+	# 	print ("writing to conditioned file: %s" % outFileName)
+
+	# open the file and do some initialisation stuff
+	r = pyall.ALLReader(filename, args.mmap)
+
+	if args.extractruntime:
+		s = "Runtime"
+		run = pyall.R_RUNTIME(outRuntimeFilePtr, 0)
+		s = run.header()
+		outRuntimeFilePtr.write(s + "\n")
+
+	if args.extractclock:
+		s = "RecordDate,ExternalDate,RecordTime,ExternalTime,Difference,PPSInUse"
+		outClockFilePtr.write(s + "\n")
+
+	if args.extractattitude:
+		# read the first record so we get a date for the file header
+		typeOfDatagram, datagram = r.readDatagram()
+		s = r.currentRecordDateTime().strftime('%Y%m%d') + ",Timestamp, Roll, Pitch, Heave, Heading"
+		outAttitudeFilePtr.write(s + "\n")
+		# timetamp, roll, pitch, heave, heading
+		np.savetxt(outAttitudeFilePtr, attitudeRows(r.loadAttitude('A')), fmt='%.3f', delimiter=',')
+
+	if args.extractheight:
+		# read the first record so we get a date for the file header
+		typeOfDatagram, datagram = r.readDatagram()
+		s = r.currentRecordDateTime().strftime('%Y%m%d') + ",Timestamp, Height"
+		outHeightFilePtr.write(s + "\n")
+
+	if args.extractnadir:
+		# read the first record so we get a date for the file header
+		typeOfDatagram, datagram = r.readDatagram()
+		s = "NadirDepth, TransducerDepth, currentRoll, currentPitch, currentHeave, currentHeading"
+		outNadirFilePtr.write(s + "\n")
+
+	if args.extractposition:
+		# read the first record so we get a date for the file header
+		typeOfDatagram, datagram = r.readDatagram()
+		s = "Timestamp, Counter, Latitude, Longitude, Quality, Speed, Course, Heading, Descriptor, numBytes, Datagram"
+		# s = r.currentRecordDateTime().strftime('%Y%m%d') + ",Timestamp, Counter, Latitude, Longitude, Quality, Speed, Course, Heading, Descriptor, numBytes, Datagram"
+		outPositionFilePtr.write(s + "\n")
+
+	if args.extractattitudeheight:
+		# read the first record so we get a date for the file header
+		typeOfDatagram, datagram = r.readDatagram()
+		s = r.currentRecordDateTime().strftime('%Y%m%d') + ",Timestamp, Roll, Pitch, Heave, Heading, Height"
+		outAttitudeHeightFilePtr.write(s + "\n")
+		attitudeHeightData = attitudeRows(r.loadAttitude('A'))
+
+	if wobble:
+		attitudeData = attitudeRows(r.loadAttitude('A')).tolist()
+
+	if splitd or args.splitf or splitt>0:
+		InstallStart, InstallEnd, initialDepthMode = r.loadInstallationRecords()
+		centerFrequency = r.loadCenterFrequency()
+
+	# each file injects from its own copy of the injectors, starting just before the first record in the file so we do not swamp the file with unwanted records
+	injectors = [copy.copy(injector) for injector in settings.injectors]
+	if len(injectors) > 0:
+		TypeOfDatagram, datagram = r.readDatagram()
+		for injector in injectors:
+			injector.rewind(r.currentRecordTimestamp())
+		r.rewind()
+
+	currPitch = 0
+	currRoll = 0
+	currHeave = 0
+	currHeading = 0
+	currRuntime = ""
+	# several options can look at the same datagram.  read() only decodes it once, so count how many decodes that saves
+	decodesAvoided = pyall.cDatagram.decodesAvoided
+	###############################################################
+	################ main loop through all records ################
+	###############################################################
+	for TypeOfDatagram, datagram in r.iter(loopTypes):
+		# the iterator hands us each datagram.  If we support it, we get the datagram type and a class for that datagram
+
+		if splitfileend == 0:
+			splitfileend = r.currentRecordTimestamp()
+
+		# read the bytes into a buffer
+		rawBytes = r.readDatagramBytes(datagram.offset, datagram.numberOfBytes)
+
+		if beamQC:
+			if TypeOfDatagram == 'f':
+				datagram.read()
+				# figure out which head
+				head = getHead(heads, datagram.SerialNumber)
+
+				ping = cPing(datagram.NumReceiveBeams, head.installationRollAngle)
+				ping.BeamPointingAngle = datagram.BeamPointingAngle
+				ping.TwoWayTravelTime = datagram.TwoWayTravelTime
+				ping.SoundSpeedAtTransducer = datagram.SoundSpeedAtTransducer
+				ping.BeamNumber = datagram.BeamNumber
+				# now compute the approximate depth
+				ping.calcDepth()
+
+				# compute a best fit line through the ping of data so we can compute the slope and intercept
+				fit = fitLine(ping.Dy, ping.Dz)
+				if fit is not None:
+					slope, intercept, stderr = fit
+					# y = mx + c
+					head.addResiduals(ping.BeamNumber, ping.Dz - ((slope * ping.Dy) + intercept), ping.BeamPointingAngle)
+				# draw a single profile good for debugging
+				# plt.figure(figsize=(12,4))
+				# plt.title(datagram.SerialNumber)
+				# raw = plt.plot(ping.Dy, ping.Dz)
+				# plt.show(False)
+				continue
+
+			if TypeOfDatagram == 'D' or TypeOfDatagram == 'X':
+				datagram.read()
+				if len(datagram.AcrossTrackDistance) > 1:
 					# figure out which head
 					head = getHead(heads, datagram.SerialNumber)
 
-					ping = cPing(datagram.NumReceiveBeams, head.installationRollAngle)
-					ping.BeamPointingAngle = datagram.BeamPointingAngle
-					ping.TwoWayTravelTime = datagram.TwoWayTravelTime
-					ping.SoundSpeedAtTransducer = datagram.SoundSpeedAtTransducer
-					ping.BeamNumber = datagram.BeamNumber
-					# now compute the approximate depth
-					ping.calcDepth()
-
 					# compute a best fit line through the ping of data so we can compute the slope and intercept
-					slope, intercept, rvalue, pvalue, stderr = stats.linregress(ping.Dy, ping.Dz)
-					# y = mx + c
-					for idx, val in enumerate(ping.Dy):
-						# if datagram.QualityFactor[idx] > 0:
-						# 	continue #skip rejected beams
-						beamNum = ping.BeamNumber[idx]
-						if not beamNum in head.beamSum:
-							head.beamSum[beamNum] = (ping.Dz[idx] - ((slope * val) + intercept))
-							head.beamAngle[beamNum] = ping.BeamPointingAngle[idx]
-							head.beamCount[beamNum] = 1
+					fit = fitLine(datagram.AcrossTrackDistance, datagram.Depth)
+					if fit is not None:
+						slope, intercept, stderr = fit
+						acrossTrack = np.asarray(datagram.AcrossTrackDistance, dtype=np.float64)
+						depth = np.asarray(datagram.Depth, dtype=np.float64)
+						if TypeOfDatagram == 'D':
+							beamNumber = np.asarray(datagram.BeamNumber)
+							depressionAngle = np.asarray(datagram.BeamDepressionAngle)
 						else:
-							head.beamSum[beamNum] += (ping.Dz[idx] - ((slope * val) + intercept))
-							head.beamAngle[beamNum] = ping.BeamPointingAngle[idx]
-							head.beamCount[beamNum] += 1
-					# draw a single profile good for debugging
-					# plt.figure(figsize=(12,4))
-					# plt.title(datagram.SerialNumber)
-					# raw = plt.plot(ping.Dy, ping.Dz)
-					# plt.show(False)
-					continue
-
-				if TypeOfDatagram == 'D' or TypeOfDatagram == 'X':
-					datagram.read()
-					if len(datagram.AcrossTrackDistance) > 1:
-						# figure out which head
-						head = getHead(heads, datagram.SerialNumber)
-
-						# compute a best fit line through the ping of data so we can compute the slope and intercept
-						slope, intercept, rvalue, pvalue, stderr = stats.linregress(datagram.AcrossTrackDistance, datagram.Depth)
-						# y = mx + c
-						for idx, val in enumerate(datagram.AcrossTrackDistance):
-							# if datagram.QualityFactor[idx] > 0:
-							# 	continue #skip rejected beams
-							if datagram.BeamDepressionAngle[idx] < 30:
-								continue
-							if not datagram.BeamNumber[idx] in head.beamSum:
-								head.beamSum[datagram.BeamNumber[idx]] = (datagram.Depth[idx] - ((slope * val) + intercept))
-								head.beamAngle[datagram.BeamNumber[idx]] = datagram.BeamDepressionAngle[idx]
-								head.beamCount[datagram.BeamNumber[idx]] = 1
-							else:
-								head.beamSum[datagram.BeamNumber[idx]] += (datagram.Depth[idx] - ((slope * val) + intercept))
-								head.beamAngle[datagram.BeamNumber[idx]] = datagram.BeamDepressionAngle[idx]
-								head.beamCount[datagram.BeamNumber[idx]] += 1
-
-			if wobble:
-				if TypeOfDatagram == 'D' or TypeOfDatagram == 'X':
-					datagram.read()
-					# intercept is hwobble
-					# slope is rwobble
-					if len(datagram.AcrossTrackDistance) > 1:
-						# compute a best fit line through the ping of data so we can compute the slope and intercept
-						slope, intercept, rvalue, pvalue, stderr = stats.linregress(datagram.AcrossTrackDistance, datagram.Depth)
-						wobbleResults.append([pyall.to_timestamp(r.currentRecordDateTime()), intercept, slope, stderr])
-					else:
-						print (len(datagram.AcrossTrackDistance), len(datagram.Depth))
-
-				if TypeOfDatagram == 'A':
-					datagram.read()
-					for a in datagram.Attitude:
-						dateobject = pyall.to_DateTime(a[0], a[1])
-						# date, time, roll, pitch, heave, heading
-						s = ("%d,%.3f,%.3f,%.3f,%.3f,%.3f\n" % (a[0],a[1],a[3],a[4],a[5],a[6]))
-						ts = pyall.to_timestamp(pyall.to_DateTime(a[0], a[1]))
-						attitudeData.append([ts, a[3], a[4], a[5], a[6]])
-
-			if args.extractnadir:
-				if TypeOfDatagram == 'D' or  TypeOfDatagram == 'X':
-					datagram.read()
-					# find the depth nearest to Nadir
-					# https://stackoverflow.com/questions/9706041/finding-index-of-an-item-closest-to-the-value-in-a-list-thats-not-entirely-sort
-					nadirBeam = min(range(len(datagram.AcrossTrackDistance)), key=lambda i: abs(datagram.AcrossTrackDistance[i]))
-					s = "%.3f,%.3f,%.3f,%.3f,%.3f, %.3f\n" % (datagram.Depth[nadirBeam], datagram.TransducerDepth/100, currRoll, currPitch, currHeave, currHeading)
-					outNadirFilePtr.write(s)
-
-			if args.extractclock:
-				if TypeOfDatagram == 'C':
-					datagram.read()
-					# print (datagram)
-					outClockFilePtr.write(str(datagram) + "\n")
-					timestamps.append(datagram.time-datagram.ExternalTime)
-
-			if args.extractattitude:
-				if TypeOfDatagram == 'A':
-					datagram.read()
-					for a in datagram.Attitude:
-						ts = pyall.to_timestamp(pyall.to_DateTime(a[0], a[1])) #remember to add the millisecs for each sub record!
-						# timetamp, roll, pitch, heave, heading
-						s = ("%.3f,%.3f,%.3f,%.3f,%.3f\n" % (ts,a[3],a[4],a[5],a[6]))
-						outAttitudeFilePtr.write(s)
-
-			if args.extractheight:
-				if TypeOfDatagram == 'h':
-					datagram.read()
-					# dateobject = pyall.to_DateTime(a[0], a[1])
-					# date, time, height
-					ts = pyall.to_timestamp(pyall.to_DateTime(datagram.RecordDate, datagram.Time))
-					s = ("%.3f,%.3f\n" % (ts, datagram.Height))
-					# s = ("%d,%.3f,%.3f,%.3f,%.3f,%.3f\n" % (datagram.RecordDate, datagram.Time, datagram.Height, datagram.Height, datagram.Height, datagram.Height))
-					outHeightFilePtr.write(s)
-
-			if args.extractposition:
-				if TypeOfDatagram == 'P':
-					datagram.read()
-					# dateobject = pyall.to_DateTime(a[0], a[1])
-					# date, time, height
-					ts = pyall.to_timestamp(pyall.to_DateTime(datagram.RecordDate, datagram.Time))
-					s = ("%.3f,%d,%.7f,%.7f,%.3f,%.3f,%.3f,%.3f,%d,%d,%s\n" % (ts, datagram.Counter,
-						datagram.Latitude,
-						datagram.Longitude,
-						datagram.Quality,
-						datagram.SpeedOverGround,
-						datagram.CourseOverGround,
-						datagram.Heading,
-						datagram.Descriptor,
-						datagram.NBytesDatagram,
-						datagram.data.decode("utf-8").replace('\x00', '')))
-					# s = ("%d,%.3f,%.3f,%.3f,%.3f,%.3f\n" % (datagram.RecordDate, datagram.Time, datagram.Height, datagram.Height, datagram.Height, datagram.Height))
-					outPositionFilePtr.write(s)
-
-			if args.extractattitudeheight:
-				if TypeOfDatagram == 'A':
-					datagram.read()
-					for a in datagram.Attitude:
-						# dateobject = pyall.to_DateTime(a[0], a[1])
-						# date, time, roll, pitch, heave, heading
-						ts = pyall.to_timestamp(pyall.to_DateTime(a[0], a[1]))  #remember to add the millisecs for each sub record!
-						attitudeData.append([ts, a[3], a[4], a[5], a[6]])
-				if TypeOfDatagram == 'h':
-					datagram.read()
-					ts = pyall.to_timestamp(pyall.to_DateTime(datagram.RecordDate, datagram.Time))
-					heightData.append([ts, datagram.Height])
-
-			if args.extractinstall:
-				if TypeOfDatagram == 'I':
-					datagram.read()
-					row = filename
-					for i in datagram.installationParameters :
-						if len(datagram.installationParameters[i]) == 0:
-							datagram.installationParameters[i] = "0.00"
-						row = row + "," + datagram.installationParameters[i]
-						# row.replace(",,",",")
-					print (row)
-					# break
-
-			if args.extractruntime:
-				if TypeOfDatagram == 'R':
-					datagram.read()
-					# if currRuntime != datagram.parameters():
-						# print (filename, "," ,datagram)
-					outRuntimeFilePtr.write(str(datagram) + "\n")
-
-						# currRuntime = datagram.parameters()
-					# break
-			if splitt:
-					# datagram.read()
-					if pyall.to_timestamp(r.currentRecordDateTime()) > (splitfileend + splitt):
-						# write out the closing install record then close the file
-						print ("closing the file as the duration has exceeded the split time")
-						outFilePtr.write(InstallEnd)
-						outFilePtr.close()
-
-						outFileName = os.path.join(os.path.dirname(os.path.abspath(filename)), args.odir, os.path.basename(filename))
-						outFileName  = addFileNameAppendage(outFileName, args.odix)
-						outFileName  = createOutputFileName(outFileName)
-						outFilePtr = open(outFileName, 'wb')
-						print ("writing to split file: %s" % outFileName)
-						outFilePtr.write(InstallStart)
-						outFilePtr.write(rawBytes)
-						splitfileend = pyall.to_timestamp(r.currentRecordDateTime())
-			if splitd:
-				if TypeOfDatagram == 'R':
-					datagram.read()
-					if initialDepthMode is not datagram.DepthMode:
-						# write out the closing install record then close the file
-						print ("closing the file as the depth mode has changed")
-						outFilePtr.write(InstallEnd)
-						outFilePtr.close()
-
-						outFileName = os.path.join(os.path.dirname(os.path.abspath(filename)), args.odir, os.path.splitext(filename)[0] + "_" + datagram.DepthMode + "." + os.path.splitext(filename)[1],)
-						outFileName  = addFileNameAppendage(outFileName, args.odix)
-						outFileName  = createOutputFileName(outFileName)
-						outFilePtr = open(outFileName, 'wb')
-						print ("writing to split file: %s" % outFileName)
-						outFilePtr.write(InstallStart)
-						outFilePtr.write(rawBytes)
-						initialDepthMode = datagram.DepthMode #remember the new depth mode!
+							# the X datagram has the beams in order and no depression angle, so work it out from the across track distance and depth
+							beamNumber = np.arange(len(depth))
+							depressionAngle = np.degrees(np.arctan2(depth, np.abs(acrossTrack)))
+						# y = mx + c.  only the beams at least 30 degrees below the horizontal are used
+						use = depressionAngle >= 30
+						head.addResiduals(beamNumber[use], (depth - ((slope * acrossTrack) + intercept))[use], depressionAngle[use])
 
-			if args.splitf:
-				if TypeOfDatagram == 'N':
-					datagram.read()
-					if centerFrequency != datagram.CentreFrequency[0]:
-						# write out the closing install record then close the file
-						print ("closing the file as the frequency has changed")
-						outFilePtr.write(InstallEnd)
-						outFilePtr.close()
-
-						outFileName = os.path.join(os.path.dirname(os.path.abspath(filename)), args.odir, os.path.basename(filename))
-						outFileName  = addFileNameAppendage(outFileName, "_" + str(datagram.CentreFrequency[0]))
-						outFileName  = addFileNameAppendage(outFileName, args.odix)
-						outFileName  = createOutputFileName(outFileName)
-						outFilePtr = open(outFileName, 'wb')
-						print ("writing to split file: %s" % outFileName)
-						outFilePtr.write(InstallStart)
-						outFilePtr.write(rawBytes)
-						centerFrequency = datagram.CentreFrequency #remember the new centre frequency
-
-			# before we write the datagram out, we need to inject records with a smaller from_timestamp
-			if args.injectAFileName:
-				if args.injectAFileName.lower().endswith('.srh'):
-					counter, lastHeightTimeStamp = injector(outFilePtr, pyall.to_timestamp(r.currentRecordDateTime()), SRHSubset, counter)
-				if args.injectAFileName.lower().endswith('.txt'):
-					counter, lastHeightTimeStamp = injector(outFilePtr, pyall.to_timestamp(r.currentRecordDateTime()), ATTSubset, counter)
-				if TypeOfDatagram in args.exclude:
-					# dont trigger on records we are rejecting!
-					continue
-
-			if args.injectAHFileName:
-				if args.injectAHFileName.lower().endswith('.txt'):
-					counter, lastPositionTimeStamp = injector(outFilePtr, pyall.to_timestamp(r.currentRecordDateTime()), TypeOfDatagram, ATTSubset, counter, True, lastHeightTimeStamp)
-					# continue
-				if TypeOfDatagram in args.exclude:
-					# dont trigger on records we are rejecting!
-					continue
-
-			if args.injectPOSITIONFileName:
-				if args.injectPOSITIONFileName.lower().endswith('.txt'):
-					counter, lastPositionTimeStamp = injector(outFilePtr, pyall.to_timestamp(r.currentRecordDateTime()), TypeOfDatagram, POSSubset, counter, True, lastPositionTimeStamp)
-					# continue
-				if TypeOfDatagram in args.exclude:
-					# dont trigger on records we are rejecting!
-					continue
-
-			if args.extractbackscatter:
-				'''to extract backscatter angular response curve we need to keep a count and sum of all samples in a per degree sector'''
-				'''to do this, we need to take into account the take off angle of each beam'''
-				if TypeOfDatagram == 'N':
-					datagram.read()
-					beamPointingAngles = datagram.BeamPointingAngle
-					transmitSector = datagram.TransmitSectorNumber
-				if TypeOfDatagram == 'Y':
-					if len(beamPointingAngles)==0:
-						continue #we dont yet have any raw ranges so we dont have a beam pattern so skip
-					datagram.read()
-					for i in range(len(datagram.beams)):
-						arcIndex = round(beamPointingAngles[i]-startAngle) #quickly find the correct slot for the data
-						ARC[arcIndex].sampleSum = ARC[arcIndex].sampleSum + sum(datagram.beams[i].samples)
-						ARC[arcIndex].numberOfSamplesPerBeam = ARC[arcIndex].numberOfSamplesPerBeam + len(datagram.beams[i].samples)
-						ARC[arcIndex].sector = transmitSector[i]
-				continue
+		if wobble:
+			if TypeOfDatagram == 'D' or TypeOfDatagram == 'X':
+				addWobble(wobbleResults, datagram, r.currentRecordTimestamp())
 
-			if testdwrite:
-				if TypeOfDatagram == 'D':
-					datagram.read()
-					for idx, val in enumerate(datagram.QualityFactor):
-						datagram.QualityFactor[idx] = 255
-						# datagram.Depth[idx] += 100
-					bytes = datagram.encode()
-					outFilePtr.write(bytes)
-					# test to figure out how caris rejects records
-					dwrite += 1
-					if dwrite == 5:
-						break
-					continue
-					# test by rejecting all f records as well...
-				if TypeOfDatagram == 'f':
-					datagram.read()
-					for idx, val in enumerate(datagram.QualityFactor):
-						datagram.QualityFactor[idx] = 255
-					# for idx, val in enumerate(datagram.TwoWayTravelTime):
-					# 	if idx > 113 and idx < 126:
-					# 		datagram.TwoWayTravelTime[idx] *= 0.90
-					bytes = datagram.encode()
-					outFilePtr.write(bytes)
-					continue
-				if TypeOfDatagram == 'O':
-					datagram.read()
-					for idx, val in enumerate(datagram.QualityFactor):
-						datagram.QualityFactor[idx] = 255
-					bytes = datagram.encode()
-					outFilePtr.write(bytes)
-					continue
-
-			if testfwrite:
-				if TypeOfDatagram == 'f':
-					datagram.read()
-					# for idx, val in enumerate(datagram.TwoWayTravelTime):
-					# 	if idx > 113 and idx < 126:
-					# 		datagram.TwoWayTravelTime[idx] *= 0.90
-					bytes = datagram.encode()
-					outFilePtr.write(bytes)
-					continue
-
-			if args.injectbscorr:
-				if TypeOfDatagram == 'N':
-					datagram.read()
-					beamPointingAngles = datagram.BeamPointingAngle
-				if TypeOfDatagram == 'Y':
-					if len(beamPointingAngles)==0:
-						continue #we dont yet have any raw ranges so we dont have a beam pattern so skip
-					datagram.read()
-					datagram.ARC = ARC
-					datagram.BeamPointingAngle = beamPointingAngles
-					bytes = datagram.encode()
-					outFilePtr.write(bytes)
-					continue
-
-			if args.extractsvp:
-				extractProfile(datagram, TypeOfDatagram, r.currentRecordDateTime(), latitude, longitude, filename, args.odir)
-				continue
+		if args.extractnadir:
+			if TypeOfDatagram == 'D' or  TypeOfDatagram == 'X':
+				outNadirFilePtr.write(nadirRecord(datagram, currRoll, currPitch, currHeave, currHeading))
 
-			if args.extractbscorr:
-				extractBSCorrData(datagram, TypeOfDatagram, filename, args.odir)
-				continue
+		if args.extractclock:
+			if TypeOfDatagram == 'C':
+				datagram.read()
+				# print (datagram)
+				outClockFilePtr.write(str(datagram) + "\n")
+				timestamps.append(datagram.time-datagram.ExternalTime)
 
-			# the user has opted to skip this datagram, so continue
-			if TypeOfDatagram in args.exclude:
-				continue
+		if args.extractheight:
+			if TypeOfDatagram == 'h':
+				datagram.read()
+				# dateobject = pyall.to_DateTime(a[0], a[1])
+				# date, time, height
+				ts = pyall.recordTimestamp(datagram.RecordDate, datagram.Time)
+				s = ("%.3f,%.3f\n" % (ts, datagram.Height))
+				# s = ("%d,%.3f,%.3f,%.3f,%.3f,%.3f\n" % (datagram.RecordDate, datagram.Time, datagram.Height, datagram.Height, datagram.Height, datagram.Height))
+				outHeightFilePtr.write(s)
+
+		if args.extractposition:
+			if TypeOfDatagram == 'P':
+				datagram.read()
+				# dateobject = pyall.to_DateTime(a[0], a[1])
+				# date, time, height
+				ts = pyall.recordTimestamp(datagram.RecordDate, datagram.Time)
+				s = ("%.3f,%d,%.7f,%.7f,%.3f,%.3f,%.3f,%.3f,%d,%d,%s\n" % (ts, datagram.Counter,
+					datagram.Latitude,
+					datagram.Longitude,
+					datagram.Quality,
+					datagram.SpeedOverGround,
+					datagram.CourseOverGround,
+					datagram.Heading,
+					datagram.Descriptor,
+					datagram.NBytesDatagram,
+					datagram.data.decode("utf-8").replace('\x00', '')))
+				# s = ("%d,%.3f,%.3f,%.3f,%.3f,%.3f\n" % (datagram.RecordDate, datagram.Time, datagram.Height, datagram.Height, datagram.Height, datagram.Height))
+				outPositionFilePtr.write(s)
+
+		if args.extractattitudeheight:
+			if TypeOfDatagram == 'h':
+				datagram.read()
+				ts = pyall.recordTimestamp(datagram.RecordDate, datagram.Time)
+				heightData.append([ts, datagram.Height])
+
+		if args.extractinstall:
+			if TypeOfDatagram == 'I':
+				datagram.read()
+				row = filename
+				for i in datagram.installationParameters :
+					if len(datagram.installationParameters[i]) == 0:
+						datagram.installationParameters[i] = "0.00"
+					row = row + "," + datagram.installationParameters[i]
+					# row.replace(",,",",")
+				print (row)
+				# break
+
+		if args.extractruntime:
+			if TypeOfDatagram == 'R':
+				datagram.read()
+				# if currRuntime != datagram.parameters():
+					# print (filename, "," ,datagram)
+				outRuntimeFilePtr.write(str(datagram) + "\n")
+
+					# currRuntime = datagram.parameters()
+				# break
+		if splitt:
+				# datagram.read()
+				if r.currentRecordTimestamp() > (splitfileend + splitt):
+					# write out the closing install record then close the file
+					print ("closing the file as the duration has exceeded the split time")
+					outFilePtr.write(InstallEnd)
+					outFilePtr.close()
 
-			if writeConditionedFile:
-				if outFilePtr is None:
-					# create an output file based on the input
 					outFileName = os.path.join(os.path.dirname(os.path.abspath(filename)), args.odir, os.path.basename(filename))
-					# we are splitting of frequency, so the filename is a little different.
-					if args.splitf:
-						outFileName  = addFileNameAppendage(outFileName, "_" + str(centerFrequency))
 					outFileName  = addFileNameAppendage(outFileName, args.odix)
 					outFileName  = createOutputFileName(outFileName)
+					outFilePtr = pyall.ALLWriter(outFileName)
+					print ("writing to split file: %s" % outFileName)
+					outFilePtr.write(InstallStart)
+					outFilePtr.write(rawBytes)
+					splitfileend = r.currentRecordTimestamp()
+		if splitd:
+			if TypeOfDatagram == 'R':
+				datagram.read()
+				if initialDepthMode is not datagram.DepthMode:
+					# write out the closing install record then close the file
+					print ("closing the file as the depth mode has changed")
+					outFilePtr.write(InstallEnd)
+					outFilePtr.close()
+
+					outFileName = os.path.join(os.path.dirname(os.path.abspath(filename)), args.odir, os.path.splitext(filename)[0] + "_" + datagram.DepthMode + "." + os.path.splitext(filename)[1],)
+					outFileName  = addFileNameAppendage(outFileName, args.odix)
+					outFileName  = createOutputFileName(outFileName)
+					outFilePtr = pyall.ALLWriter(outFileName)
+					print ("writing to split file: %s" % outFileName)
+					outFilePtr.write(InstallStart)
+					outFilePtr.write(rawBytes)
+					initialDepthMode = datagram.DepthMode #remember the new depth mode!
+
+		if args.splitf:
+			if TypeOfDatagram == 'N':
+				datagram.readFields('CentreFrequency')
+				if centerFrequency != datagram.CentreFrequency[0]:
+					# write out the closing install record then close the file
+					print ("closing the file as the frequency has changed")
+					outFilePtr.write(InstallEnd)
+					outFilePtr.close()
 
-					outFilePtr = open(outFileName, 'wb')
-					print ("writing to conditioned file: %s" % outFileName)
+					outFileName = os.path.join(os.path.dirname(os.path.abspath(filename)), args.odir, os.path.basename(filename))
+					outFileName  = addFileNameAppendage(outFileName, "_" + str(datagram.CentreFrequency[0]))
+					outFileName  = addFileNameAppendage(outFileName, args.odix)
+					outFileName  = createOutputFileName(outFileName)
+					outFilePtr = pyall.ALLWriter(outFileName)
+					print ("writing to split file: %s" % outFileName)
+					outFilePtr.write(InstallStart)
+					outFilePtr.write(rawBytes)
+					centerFrequency = datagram.CentreFrequency[0] #remember the new centre frequency
 
-				outFilePtr.write(rawBytes)
+		if writeConditionedFile and outFilePtr is None:
+			# create an output file based on the input
+			outFileName = os.path.join(os.path.dirname(os.path.abspath(filename)), args.odir, os.path.basename(filename))
+			# we are splitting of frequency, so the filename is a little different.
+			if args.splitf:
+				outFileName  = addFileNameAppendage(outFileName, "_" + str(centerFrequency))
+			outFileName  = addFileNameAppendage(outFileName, args.odix)
+			outFileName  = createOutputFileName(outFileName)
 
-			# if r.recordCounter > 1000:
-			# 	break
-		# update_progress("Processed: %s (%d/%d)" % (filename, fileCounter, len(matches)), (fileCounter/len(matches)))
-		fileCounter +=1
-		r.close()
+			outFilePtr = pyall.ALLWriter(outFileName)
+			print ("writing to conditioned file: %s" % outFileName)
 
-		if args.extractattitudeheight:
-			# now we need to merge the heights into the attitude records using a time interpolation
-			if len(heightData) == 0:
-				print("Sorry, no height data to extract.  Please try extracting attitude data instead")
-			else:
-				ts_height = cTimeSeries(heightData)
-				for rec in attitudeData:
-					height = ts_height.getValueAt(rec[0])
-					# rec.append(height)
-					# now save to the regular file format...
-					# d = pyall.dateToKongsbergDate(from_timestamp(rec[0]))
-					# t = pyall.dateToKongsbergTime(from_timestamp(rec[0]))
-					# s = ("%s,%s,%.3f,%.3f,%.3f,%.3f,%.3f\n" % ( d, t, rec[1], rec[2], rec[3], rec[4], height))
-					s = ("%.3f,%.3f,%.3f,%.3f,%.3f,%.3f\n" % (rec[0], rec[1], rec[2], rec[3], rec[4], height))
-					outAttitudeHeightFilePtr.write(s)
+		# before we write the datagram out, we need to inject records with a smaller timestamp
+		if len(injectors) > 0:
+			currentRecordTimeStamp = r.currentRecordTimestamp()
+			for injector in injectors:
+				injector.inject(outFilePtr, currentRecordTimeStamp)
+			if TypeOfDatagram in args.exclude:
+				# dont trigger on records we are rejecting!
+				continue
+
+		if args.extractbackscatter:
+			'''to extract backscatter angular response curve we need to keep a count and sum of all samples in a per degree sector'''
+			'''to do this, we need to take into account the take off angle of each beam'''
+			if TypeOfDatagram == 'N' or TypeOfDatagram == 'Y':
+				for ping in pings.add(TypeOfDatagram, datagram):
+					addPingBackscatter(ARC, ping, startAngle)
+			continue
+
+		if testdwrite:
+			if TypeOfDatagram == 'D':
+				datagram.read()
+				datagram.QualityFactor[:] = 255
+				# datagram.Depth += 100
+				bytes = datagram.encode()
+				datagram.invalidate()
+				outFilePtr.write(bytes)
+				# test to figure out how caris rejects records
+				dwrite += 1
+				if dwrite == 5:
+					break
+				continue
+				# test by rejecting all f records as well...
+			if TypeOfDatagram == 'f':
+				datagram.read()
+				for idx, val in enumerate(datagram.QualityFactor):
+					datagram.QualityFactor[idx] = 255
+				# for idx, val in enumerate(datagram.TwoWayTravelTime):
+				# 	if idx > 113 and idx < 126:
+				# 		datagram.TwoWayTravelTime[idx] *= 0.90
+				bytes = datagram.encode()
+				datagram.invalidate()
+				outFilePtr.write(bytes)
+				continue
+			if TypeOfDatagram == 'O':
+				datagram.read()
+				for idx, val in enumerate(datagram.QualityFactor):
+					datagram.QualityFactor[idx] = 255
+				bytes = datagram.encode()
+				datagram.invalidate()
+				outFilePtr.write(bytes)
+				continue
+
+		if testfwrite:
+			if TypeOfDatagram == 'f':
+				datagram.read()
+				# for idx, val in enumerate(datagram.TwoWayTravelTime):
+				# 	if idx > 113 and idx < 126:
+				# 		datagram.TwoWayTravelTime[idx] *= 0.90
+				bytes = datagram.encode()
+				outFilePtr.write(bytes)
+				continue
+
+		if args.injectbscorr:
+			if TypeOfDatagram == 'N':
+				datagram.readFields('BeamPointingAngle')
+				beamPointingAngles = datagram.BeamPointingAngle
+			if TypeOfDatagram == 'Y':
+				if len(beamPointingAngles)==0:
+					continue #we dont yet have any raw ranges so we dont have a beam pattern so skip
+				datagram.read()
+				bytes = datagram.encode(ARC, beamPointingAngles)
+				datagram.invalidate()
+				outFilePtr.write(bytes)
+				continue
+
+		if args.extractsvp:
+			if TypeOfDatagram == 'U':
+				# we need the position of the SVP dip in the SVP file, so look up where we were when the profile was recorded
+				position = r.positionAt(r.currentRecordTimestamp())
+				if position is None:
+					position = (0, 0)
+				extractProfile(datagram, r.currentRecordDateTime(), position[0], position[1], filename, args.odir)
+			continue
+
+		if args.extractbscorr:
+			extractBSCorrData(datagram, TypeOfDatagram, filename, args.odir)
+			continue
+
+		# the user has opted to skip this datagram, so continue
+		if TypeOfDatagram in args.exclude:
+			continue
 
 		if writeConditionedFile:
-			print ("Saving conditioned file to: %s" % outFileName)
-			outFilePtr.close()
+			outFilePtr.write(rawBytes)
 
-		if args.extractclock:
-			plt.figure(figsize=(12,4))
-			# plt.axhline(0, color='black', linewidth=0.3)
-			plt.grid(linestyle='-', linewidth='0.2', color='black')
+		# if r.recordCounter > 1000:
+		# 	break
+	# update_progress("Processed: %s (%d/%d)" % (filename, fileCounter, len(matches)), (fileCounter/len(matches)))
+	if args.extractbackscatter:
+		for ping in pings.flush():
+			addPingBackscatter(ARC, ping, startAngle)
+	r.close()
+	if pyall.cDatagram.decodesAvoided > decodesAvoided:
+		print ("Repeat decodes avoided: %d" % (pyall.cDatagram.decodesAvoided - decodesAvoided))
 
-			raw = plt.plot(timestamps, color='red', linewidth=0.5, label='Clock Difference')
+	if args.extractattitudeheight:
+		# now we need to merge the heights into the attitude records using a time interpolation
+		if len(heightData) == 0:
+			print("Sorry, no height data to extract.  Please try extracting attitude data instead")
+		else:
+			ts_height = cTimeSeries(heightData)
+			height = ts_height.getValueAt(attitudeHeightData[:,0])
+			# timestamp, roll, pitch, heave, heading, height
+			np.savetxt(outAttitudeHeightFilePtr, np.column_stack((attitudeHeightData, height)), fmt='%.3f', delimiter=',')
 
-			plt.legend()
-			plt.xlabel('Sample #')
-			plt.ylabel('Record - External Clock Difference(Sec)')
-			plt.title("Clock Stability:" + os.path.basename(filename))
-			outFileName = os.path.join(os.path.dirname(os.path.abspath(filename)), args.odir, os.path.basename(filename))
-			outFileName  = createOutputFileName(outFileName)
-			plt.savefig(os.path.splitext(outFileName)[0]+'_clock.png', dpi = 300)
-			plt.close()
-			timestamps.clear()
+	if writeConditionedFile:
+		print ("Saving conditioned file to: %s" % outFileName)
+		outFilePtr.close()
+		print (outFilePtr.report(), end="")
 
-		# print out the extracted backscatter angular response curve
-		if args.extractbackscatter:
-			print("Writing backscatter angular response curve to: %s" % outFileName)
-
-			# compute the mean response across the swath
-			responseSum = 0
-			responseCount = 0
-			for beam in ARC:
-				if beam.numberOfSamplesPerBeam > 0:
-					responseSum = responseSum = (beam.sampleSum/10) #tenths of a dB
-					responseCount = responseCount = beam.numberOfSamplesPerBeam
-			responseAverage = responseSum/responseCount
-
-			with open(outFileName, 'w') as f:
-				# write out the backscatter response curve
-				f.write("TakeOffAngle(Deg), BackscatterAmplitude(dB), Sector, SampleSum, SampleCount, Correction, %s \n" % args.inputFile )
-				for beam in ARC:
-					if beam.numberOfSamplesPerBeam > 0:
-						beamARC = (beam.sampleSum/beam.numberOfSamplesPerBeam)
-						f.write("%.3f, %.3f, %d, %d, %d, %.3f\n" % (beam.takeOffAngle, beamARC, beam.sector, beam.sampleSum, beam.numberOfSamplesPerBeam , beamARC + responseAverage))
-		if wobble:
-			plt.figure(figsize=(12,4))
-			# plt.axhline(0, color='black', linewidth=0.3)
-			plt.grid(linestyle='-', linewidth='0.2', color='black')
-
-			# extract the lists of data for display
-			w = np.array(wobbleResults)
-			tWobble = w[:,0]
-			hWobble = w[:,1]
-			rWobble = w[:,2]
-			raw = plt.plot(tWobble, rWobble, color='red', linewidth=0.5, label='RWobble')
-			# plot the HWobble moving it nearer to the zero origin
-			raw = plt.plot(tWobble, hWobble - np.average(hWobble), 'ro', label='Levelled HWobble')
-			hWobble = hWobble - np.average(hWobble)
-
-			# isolate the low frequency signal in the heave(which should not exist)
-			level = 10
-			sm_hWobble = signal.savgol_filter(hWobble, 11, 1)
-			# # for i in range(level):
-			# # 	smoothedHeave = signal.savgol_filter(smoothedHeave, 11, 1)
-			# # subtract the very smoothed signal from the input signal, thereby applying a lowcut filter (AKA high band pass)
-			# diff = np.subtract(hWobble, smoothedHeave)
-
-			# raw = plt.plot(tWobble, hWobble, color='blue', linewidth=0.5, label='HWobble')
-			# raw = plt.plot(tWobble, sm_hWobble, color='gray', linewidth=1.5, label='SmoothedHeave')
-
-
-			d = np.array(attitudeData)
-			tAttitude = d[:,0]
-			roll = d[:,1] / 10
-			roll = roll - np.average(roll)
-
-			pitch = d[:,2] / 10
-			pitch = pitch - np.average(pitch)
-
-			heave = d[:,3]
-			# heave = heave - np.average(heave)
-
-			raw = plt.plot(tAttitude, roll, color='yellow', linewidth=1, label='Roll')
-			raw = plt.plot(tAttitude, pitch, color='blue', linewidth=1, label='Pitch')
-			# raw = plt.plot(tAttitude, heave, 'bo', label='Heave')
-			# raw = plt.plot(tAttitude, heave, color='green', linewidth=1, label='Heave')
-
-			#######################
-			# savgol the raw heave
-			# subtract the settled heave
-			# then plot and correlate to pitch/roll
-			level = 1000
-			sm_heave = signal.savgol_filter(heave, 101, 1)
-			for i in range(level):
-				sm_heave = signal.savgol_filter(sm_heave, 101, 1)
-			# subtract the very smoothed signal from the input signal, thereby applying a lowcut filter (AKA high band pass)
-			settledHeave = np.subtract(heave, sm_heave)
-			# raw = plt.plot(tAttitude, settledHeave, color='black', linewidth=2, label='Heave')
-			ts_heave = cTimeSeries(tAttitude, settledHeave)
-			corr_hWobble = []
-			for t, h in zip(tWobble, hWobble):
-				correction = ts_heave.getValueAt(t)
-				corr_hWobble.append(h + correction)
-			raw = plt.plot(tWobble, corr_hWobble, color='black', linewidth=1, label='HeaveCorrectedNadirDepth')
-			#######################
-
-			plt.legend()
-			plt.xlabel('Sample #')
-			plt.ylabel('Wobble')
-			plt.title("Wobble Errors:" + os.path.basename(filename))
-			outFileName = os.path.join(os.path.dirname(os.path.abspath(filename)), args.odir, os.path.basename(filename))
-			outFileName  = addFileNameAppendage(outFileName, args.odix)
-			outFileName  = createOutputFileName(outFileName)
-			plt.show()
-			plt.savefig(os.path.splitext(outFileName)[0]+'_wobble.png', dpi = 300)
-			plt.close()
-			# timestamps.clear()
+	# close the extracted files now, rather than leaving them to be flushed whenever they are garbage collected
+	for extractFilePtr in extractFilePtrs:
+		extractFilePtr.close()
 
-	if beamQC:
+	if args.extractclock:
 		plt.figure(figsize=(12,4))
 		# plt.axhline(0, color='black', linewidth=0.3)
 		plt.grid(linestyle='-', linewidth='0.2', color='black')
 
-		trace=[]
-		names =[]
-		for key, head in heads.items():
-			names.append(head.ID)
-			beamsum = head.beamSum.values()
-			count = head.beamCount.values()
-			beam = head.beamCount.keys()
-			profile = []
-			for s,c in zip(beamsum, count):
-				profile.append(s/c)
+		raw = plt.plot(timestamps, color='red', linewidth=0.5, label='Clock Difference')
 
-			trace.append(plt.bar(beam, profile))
+		plt.legend()
+		plt.xlabel('Sample #')
+		plt.ylabel('Record - External Clock Difference(Sec)')
+		plt.title("Clock Stability:" + os.path.basename(filename))
+		outFileName = os.path.join(os.path.dirname(os.path.abspath(filename)), args.odir, os.path.basename(filename))
+		outFileName  = createOutputFileName(outFileName)
+		plt.savefig(os.path.splitext(outFileName)[0]+'_clock.png', dpi = 300)
+		plt.close()
+		timestamps.clear()
 
-		plt.legend([trace[0], trace[1]], names)
-		plt.xlabel('Beam #')
-		plt.ylabel('Deviation(m)')
-		plt.title("Mean Slope Rectified Profile")
-		plt.ylim(-0.1,0.1)
+	return ARC, heads, wobbleResults, attitudeData
 
-		# plt.text(0.05, 0.95, heads[names[0]].beamCount[100], fontsize=14, verticalalignment='top')
+###############################################################################
+# PER DATAGRAM REDUCTIONS, shared by processFile and processRange
+###############################################################################
+def addWobble(wobbleResults, datagram, timestamp):
+	'''compute a best fit line through a ping of depths.  the intercept is the hwobble and the slope is the rwobble'''
+	datagram.read()
+	if len(datagram.AcrossTrackDistance) > 1:
+		# compute a best fit line through the ping of data so we can compute the slope and intercept
+		fit = fitLine(datagram.AcrossTrackDistance, datagram.Depth)
+		if fit is not None:
+			slope, intercept, stderr = fit
+			wobbleResults.append([timestamp, intercept, slope, stderr])
+	else:
+		print (len(datagram.AcrossTrackDistance), len(datagram.Depth))
+
+def fitLine(x, y):
+	'''return the slope, intercept and standard error of the slope of the least squares line through the points, the same values stats.linregress gives.  The fit comes straight from the sums of x, y, xy, x squared and y squared, so it is a few numpy calls over the beam arrays.  Returns None if all the x values are the same'''
+	x = np.asarray(x, dtype=np.float64)
+	y = np.asarray(y, dtype=np.float64)
+	n = len(x)
+	sumX = x.sum()
+	sumY = y.sum()
+	sxx = np.dot(x, x) - sumX * sumX / n
+	sxy = np.dot(x, y) - sumX * sumY / n
+	syy = np.dot(y, y) - sumY * sumY / n
+	if not sxx > 0:
+		return None
+	slope = sxy / sxx
+	intercept = (sumY - slope * sumX) / n
+	stderr = 0.0
+	if n > 2:
+		stderr = math.sqrt(max(syy - slope * sxy, 0.0) / (n - 2) / sxx)
+	return slope, intercept, stderr
+
+def attitudeRows(attitude):
+	'''return the timestamp, roll, pitch, heave and heading of each record from ALLReader.loadAttitude() as the rows of a 2D array'''
+	return np.column_stack((attitude['time'], attitude['roll'], attitude['pitch'], attitude['heave'], attitude['heading']))
+
+def nadirRecord(datagram, currRoll, currPitch, currHeave, currHeading):
+	'''return the CSV record for the depth nearest to nadir'''
+	datagram.read()
+	nadirBeam = int(np.argmin(np.abs(datagram.AcrossTrackDistance)))
+	return "%.3f,%.3f,%.3f,%.3f,%.3f, %.3f\n" % (datagram.Depth[nadirBeam], datagram.TransducerDepth/100, currRoll, currPitch, currHeave, currHeading)
+
+def addPingBackscatter(ARC, ping, startAngle):
+	'''sum the seabed image of a ping into the angular response curve, using the beam pointing angles of the raw range datagram from the same ping.  Pings without both are skipped'''
+	if 'N' not in ping.datagrams or 'Y' not in ping.datagrams:
+		return
+	rawRange = ping.datagrams['N']
+	rawRange.readFields('BeamPointingAngle', 'TransmitSectorNumber')
+	addBackscatter(ARC, ping.datagrams['Y'], rawRange.BeamPointingAngle, rawRange.TransmitSectorNumber, startAngle)
+
+def addBackscatter(ARC, datagram, beamPointingAngles, transmitSector, startAngle):
+	'''sum the samples of a seabed image datagram into the per degree sectors of the angular response curve, using the beam pointing angles of the latest raw range datagram'''
+	datagram.read()
+	sampleSums = datagram.beamSampleSums()
+	for i in range(datagram.NumBeams):
+		arcIndex = round(beamPointingAngles[i]-startAngle) #quickly find the correct slot for the data
+		ARC[arcIndex].sampleSum = ARC[arcIndex].sampleSum + int(sampleSums[i])
+		ARC[arcIndex].numberOfSamplesPerBeam = ARC[arcIndex].numberOfSamplesPerBeam + int(datagram.numberOfSamplesPerBeam[i])
+		ARC[arcIndex].sector = int(transmitSector[i])
 
+###############################################################################
+def processFileInChunks(filename, args, pool, jobs):
+	'''cut a single file into byte ranges on datagram boundaries and reduce the ranges in parallel for -extractbackscatter, -extractnadir and -wobble.  The partial results are merged in file order, so the output is the same as processFile'''
+	r = pyall.ALLReader(filename, args.mmap)
+	# build the index once here, before the workers start.  They use it to find the beam pattern in force at the start of their range for -extractbackscatter, and loadAttitude() uses it for -wobble, so they must not each build their own
+	r.loadIndex()
+	ranges = r.chunkRanges(jobs)
+	r.close()
+	print ("Decoding %s as %d parallel ranges" % (filename, len(ranges)))
+
+	ARC = createAngularResponseCurve()
+	nadirRecords = []
+	wobbleResults = []
+	attitudeData = []
+	for rangeARC, rangeNadirRecords, rangeWobbleResults, rangeAttitudeData in pool.starmap(processRange, [(filename, start, stop, args) for start, stop in ranges]):
+		mergeAngularResponseCurve(ARC, rangeARC)
+		nadirRecords += rangeNadirRecords
+		wobbleResults += rangeWobbleResults
+		attitudeData += rangeAttitudeData
 
+	if args.extractnadir:
+		# create an output file based on the input
 		outFileName = os.path.join(os.path.dirname(os.path.abspath(filename)), args.odir, os.path.basename(filename))
+		outFileName = os.path.splitext(outFileName)[0]+'_NADIR.txt'
 		outFileName  = createOutputFileName(outFileName)
-		plt.savefig(os.path.splitext(outFileName)[0]+'_BeamQC.png', dpi = 300)
-		plt.show()
-		plt.close()
+		print ("writing NADIR to file: %s" % outFileName)
+		with open(outFileName, 'w') as outNadirFilePtr:
+			outNadirFilePtr.write("NadirDepth, TransducerDepth, currentRoll, currentPitch, currentHeave, currentHeading\n")
+			outNadirFilePtr.writelines(nadirRecords)
+
+	return ARC, {}, wobbleResults, attitudeData
+
+def processRange(filename, start, stop, args):
+	'''reduce the datagrams in the byte range start:stop of a file for -extractbackscatter, -extractnadir and -wobble.  This runs in a worker process'''
+	r = pyall.ALLReader(filename, args.mmap)
+	startAngle = -90
+	ARC = createAngularResponseCurve(startAngle)
+	nadirRecords = []
+	wobbleResults = []
+	attitudeData = []
+	if args.wobble:
+		attitudeData = attitudeRows(r.loadAttitude('A', start, stop)).tolist()
+	if args.extractbackscatter:
+		# a ping is summed by the range holding its last datagram.  The first datagrams in the range may pair with raw range or seabed image datagrams just before it, in either order, so start with those.  Pings finished before the range starts belong to the previous range, so skip them
+		pings = pyall.cPingAssembler('NY')
+		for TypeOfDatagram, datagram in r.datagramsBefore('NY', start, 2 * pings.lookAhead):
+			pings.add(TypeOfDatagram, datagram)
 
-	# update_progress("Process Complete: ", (fileCounter/len(matches)))
+	for TypeOfDatagram, datagram in r.iterRange(start, stop, 'DXNY'):
+		if args.wobble:
+			if TypeOfDatagram == 'D' or TypeOfDatagram == 'X':
+				addWobble(wobbleResults, datagram, r.currentRecordTimestamp())
+
+		if args.extractnadir:
+			if TypeOfDatagram == 'D' or TypeOfDatagram == 'X':
+				nadirRecords.append(nadirRecord(datagram, 0, 0, 0, 0))
+
+		if args.extractbackscatter:
+			if TypeOfDatagram == 'N' or TypeOfDatagram == 'Y':
+				for ping in pings.add(TypeOfDatagram, datagram):
+					addPingBackscatter(ARC, ping, startAngle)
+	if args.extractbackscatter:
+		for ping in pings.flush():
+			addPingBackscatter(ARC, ping, startAngle)
+	r.close()
+	return ARC, nadirRecords, wobbleResults, attitudeData
+
+###############################################################################
+def excludeFile(filename, args, settings):
+	'''the fast path for conditioning a file when we only exclude datagrams.  The datagram index tells us where each run of datagrams we keep starts and ends, and each run is copied straight into the conditioned file, so no datagram is decoded.  Returns the same results as processFile'''
+	start_time = time.time()
+	r = pyall.ALLReader(filename, args.mmap)
+	outFileName = os.path.join(os.path.dirname(os.path.abspath(filename)), args.odir, os.path.basename(filename))
+	outFileName  = addFileNameAppendage(outFileName, args.odix)
+	outFileName  = createOutputFileName(outFileName)
+	outFilePtr = pyall.ALLWriter(outFileName)
+	print ("writing to conditioned file: %s" % outFileName)
+	outFilePtr.copyDatagrams(r, args.exclude)
+	r.close()
+
+	print ("Saving conditioned file to: %s" % outFileName)
+	outFilePtr.close()
+	print (outFilePtr.report(), end="")
+	duration = max(time.time() - start_time, 1e-6)
+	print ("Conditioned %.1f MB in %.3f seconds, %.1f MB/s" % (r.fileSize / 1e6, duration, r.fileSize / 1e6 / duration))
+	return settings.ARC, copy.deepcopy(settings.heads), [], []
+
+###############################################################################
+def runFiles(matches, args, settings):
+	'''process each file in turn, yielding the filename and the results from processFile in file order.  With -jobs the files are spread over a pool of worker processes.  Everything a worker prints is captured and printed as one block when its turn comes, so the log reads the same as a single process run'''
+	jobs = int(args.jobs)
+	if jobs > 1 and settings.chunkFiles:
+		# each file is cut into byte ranges, so all the workers help even when there is only one file
+		with multiprocessing.Pool(jobs) as pool:
+			for filename in matches:
+				yield filename, processFileInChunks(filename, args, pool, jobs)
+		return
+
+	jobs = min(jobs, len(matches))
+	if jobs <= 1:
+		for filename in matches:
+			yield filename, processFile(filename, args, settings)
+		return
+
+	print ("Processing %d files using %d worker processes" % (len(matches), jobs))
+	with multiprocessing.Pool(jobs, initializer=initWorker, initargs=(args, settings)) as pool:
+		for filename, log, results in pool.imap(processFileWorker, matches):
+			print (log, end="")
+			if results is None:
+				# the worker failed and its log holds the traceback.  stop, just like a single process run would
+				sys.exit(1)
+			yield filename, results
+
+###############################################################################
+# the arguments and settings for worker processes.  These are sent to each worker once when the pool starts
+workerArgs = None
+workerSettings = None
+
+def initWorker(args, settings):
+	global workerArgs, workerSettings
+	workerArgs = args
+	workerSettings = settings
+
+def processFileWorker(filename):
+	'''process a file in a worker process, capturing the log so the parent can print it in file order'''
+	log = io.StringIO()
+	results = None
+	with contextlib.redirect_stdout(log):
+		try:
+			results = processFile(filename, workerArgs, workerSettings)
+		except Exception:
+			traceback.print_exc(file=log)
+	return filename, log.getvalue(), results
+
+###############################################################################
+def createAngularResponseCurve(startAngle=-90):
+	'''a generic set of beams, one per degree, into which we can sum individual ping data.  This will be the angular response curve'''
+	beamdetail = [0,0,0,0]
+	return [pyall.cBeam(beamdetail, i) for i in range(startAngle, -startAngle)]
+
+def mergeAngularResponseCurve(ARC, fileARC):
+	'''add the sums from a single file into the overall angular response curve'''
+	for beam, fileBeam in zip(ARC, fileARC):
+		if fileBeam.numberOfSamplesPerBeam > 0:
+			beam.sampleSum += fileBeam.sampleSum
+			beam.numberOfSamplesPerBeam += fileBeam.numberOfSamplesPerBeam
+			beam.sector = fileBeam.sector
+
+def writeAngularResponseCurve(ARC, arcFileName, inputFile):
+	print("Writing backscatter angular response curve to: %s" % arcFileName)
+
+	# compute the mean response across the swath
+	responseSum = 0
+	responseCount = 0
+	for beam in ARC:
+		if beam.numberOfSamplesPerBeam > 0:
+			responseSum = responseSum = (beam.sampleSum/10) #tenths of a dB
+			responseCount = responseCount = beam.numberOfSamplesPerBeam
+	responseAverage = responseSum/responseCount
+
+	with open(arcFileName, 'w') as f:
+		# write out the backscatter response curve
+		f.write("TakeOffAngle(Deg), BackscatterAmplitude(dB), Sector, SampleSum, SampleCount, Correction, %s \n" % inputFile )
+		for beam in ARC:
+			if beam.numberOfSamplesPerBeam > 0:
+				beamARC = (beam.sampleSum/beam.numberOfSamplesPerBeam)
+				f.write("%.3f, %.3f, %d, %d, %d, %.3f\n" % (beam.takeOffAngle, beamARC, beam.sector, beam.sampleSum, beam.numberOfSamplesPerBeam , beamARC + responseAverage))
+
+###############################################################################
+def mergeHeads(heads, fileHeads):
+	'''add the per beam deviation sums from a single file into the overall beamqc statistics for each head'''
+	for serialNumber, fileHead in fileHeads.items():
+		head = getHead(heads, serialNumber)
+		head.resize(len(fileHead.beamCount))
+		beams = np.flatnonzero(fileHead.beamCount)
+		head.beamSum[beams] += fileHead.beamSum[beams]
+		head.beamCount[beams] += fileHead.beamCount[beams]
+		head.beamAngle[beams] = fileHead.beamAngle[beams]
+
+###############################################################################
+def plotWobble(wobbleResults, attitudeData, filename, args):
+	'''plot the heave and roll wobble results for the files processed so far'''
+	plt.figure(figsize=(12,4))
+	# plt.axhline(0, color='black', linewidth=0.3)
+	plt.grid(linestyle='-', linewidth='0.2', color='black')
+
+	# extract the lists of data for display
+	w = np.array(wobbleResults)
+	tWobble = w[:,0]
+	hWobble = w[:,1]
+	rWobble = w[:,2]
+	raw = plt.plot(tWobble, rWobble, color='red', linewidth=0.5, label='RWobble')
+	# plot the HWobble moving it nearer to the zero origin
+	raw = plt.plot(tWobble, hWobble - np.average(hWobble), 'ro', label='Levelled HWobble')
+	hWobble = hWobble - np.average(hWobble)
+
+	# isolate the low frequency signal in the heave(which should not exist)
+	level = 10
+	sm_hWobble = signal.savgol_filter(hWobble, 11, 1)
+	# # for i in range(level):
+	# # 	smoothedHeave = signal.savgol_filter(smoothedHeave, 11, 1)
+	# # subtract the very smoothed signal from the input signal, thereby applying a lowcut filter (AKA high band pass)
+	# diff = np.subtract(hWobble, smoothedHeave)
+
+	# raw = plt.plot(tWobble, hWobble, color='blue', linewidth=0.5, label='HWobble')
+	# raw = plt.plot(tWobble, sm_hWobble, color='gray', linewidth=1.5, label='SmoothedHeave')
+
+
+	d = np.array(attitudeData)
+	tAttitude = d[:,0]
+	roll = d[:,1] / 10
+	roll = roll - np.average(roll)
+
+	pitch = d[:,2] / 10
+	pitch = pitch - np.average(pitch)
+
+	heave = d[:,3]
+	# heave = heave - np.average(heave)
+
+	raw = plt.plot(tAttitude, roll, color='yellow', linewidth=1, label='Roll')
+	raw = plt.plot(tAttitude, pitch, color='blue', linewidth=1, label='Pitch')
+	# raw = plt.plot(tAttitude, heave, 'bo', label='Heave')
+	# raw = plt.plot(tAttitude, heave, color='green', linewidth=1, label='Heave')
+
+	#######################
+	# savgol the raw heave
+	# subtract the settled heave
+	# then plot and correlate to pitch/roll
+	level = 1000
+	sm_heave = signal.savgol_filter(heave, 101, 1)
+	for i in range(level):
+		sm_heave = signal.savgol_filter(sm_heave, 101, 1)
+	# subtract the very smoothed signal from the input signal, thereby applying a lowcut filter (AKA high band pass)
+	settledHeave = np.subtract(heave, sm_heave)
+	# raw = plt.plot(tAttitude, settledHeave, color='black', linewidth=2, label='Heave')
+	ts_heave = cTimeSeries(tAttitude, settledHeave)
+	corr_hWobble = []
+	for t, h in zip(tWobble, hWobble):
+		correction = ts_heave.getValueAt(t)
+		corr_hWobble.append(h + correction)
+	raw = plt.plot(tWobble, corr_hWobble, color='black', linewidth=1, label='HeaveCorrectedNadirDepth')
+	#######################
+
+	plt.legend()
+	plt.xlabel('Sample #')
+	plt.ylabel('Wobble')
+	plt.title("Wobble Errors:" + os.path.basename(filename))
+	outFileName = os.path.join(os.path.dirname(os.path.abspath(filename)), args.odir, os.path.basename(filename))
+	outFileName  = addFileNameAppendage(outFileName, args.odix)
+	outFileName  = createOutputFileName(outFileName)
+	plt.show()
+	plt.savefig(os.path.splitext(outFileName)[0]+'_wobble.png', dpi = 300)
+	plt.close()
+	# timestamps.clear()
 
 def getHead(heads, serialNumber):
 	if not serialNumber in heads:
@@ -1086,31 +1302,24 @@ def loadARC(injectbscorr):
 	return ARC
 
 ###############################################################################
-def extractProfile(datagram, TypeOfDatagram, currentRecordDateTime, latitude, longitude, filename, odir):
-	'''extract the SVP profile and save it to a file for use with CARIS'''
-	if (TypeOfDatagram == 'P'):
-		datagram.read()
-		# remember the current position, so we can use it for the SVP extraction
-		latitude = datagram.Latitude
-		longitude = datagram.Longitude
-
-	if TypeOfDatagram == 'U':
-		datagram.read()
-		outfile = os.path.join(os.path.dirname(os.path.abspath(filename)), os.path.splitext(filename)[0] + "_SVP.svp")
-		# outFileName  = addFileNameAppendage(outFileName, args.odix)
-		outfile = createOutputFileName(outfile)
-		print("Writing SVP Profile : %s" % outfile)
-		with open(outfile, 'w') as f:
-			f.write("[SVP_Version_2]\n")
-			f.write("%s\n" % outfile)
-
-			day_of_year = (currentRecordDateTime - datetime(currentRecordDateTime.year, 1, 1)).days
-			lat = decdeg2dms(latitude)
-			lon = decdeg2dms(longitude)
-			f.write("Section %s-%s %s:%s:%s %s:%s:%.3f %s:%s:%.3f\n" % (currentRecordDateTime.year, day_of_year, currentRecordDateTime.strftime("%H"), currentRecordDateTime.strftime("%M"), currentRecordDateTime.strftime("%S"), int(lat[0]), int(lat[1]), lat[2], int(lon[0]), int(lon[1]), lon[2] ))
-			for row in datagram.data:
-				f.write("%.3f %.3f \n" % (row[0], row[1]))
-			f.close()
+def extractProfile(datagram, currentRecordDateTime, latitude, longitude, filename, odir):
+	'''extract the SVP profile from a 'U' datagram and save it to a file for use with CARIS'''
+	datagram.read()
+	outfile = os.path.join(os.path.dirname(os.path.abspath(filename)), os.path.splitext(filename)[0] + "_SVP.svp")
+	# outFileName  = addFileNameAppendage(outFileName, args.odix)
+	outfile = createOutputFileName(outfile)
+	print("Writing SVP Profile : %s" % outfile)
+	with open(outfile, 'w') as f:
+		f.write("[SVP_Version_2]\n")
+		f.write("%s\n" % outfile)
+
+		day_of_year = (currentRecordDateTime - datetime(currentRecordDateTime.year, 1, 1)).days
+		lat = decdeg2dms(latitude)
+		lon = decdeg2dms(longitude)
+		f.write("Section %s-%s %s:%s:%s %s:%s:%.3f %s:%s:%.3f\n" % (currentRecordDateTime.year, day_of_year, currentRecordDateTime.strftime("%H"), currentRecordDateTime.strftime("%M"), currentRecordDateTime.strftime("%S"), int(lat[0]), int(lat[1]), lat[2], int(lon[0]), int(lon[1]), lon[2] ))
+		for row in datagram.data:
+			f.write("%.3f %.3f \n" % (row[0], row[1]))
+		f.close()
 	return
 
 ###############################################################################
@@ -1129,85 +1338,6 @@ def extractBSCorrData(datagram, TypeOfDatagram, filename, odir):
 				f.close()
 	return
 
-###############################################################################
-def trimInjectionData(recordTimestamp, SRHData):
-	print ("Trimming unwanted records up to 1 second before start of .all first record timestamp..." )
-	i=0
-	while ((len(SRHData) > 0) and (recordTimestamp - SRHData[0][0]) > 1.0):
-		SRHData.popleft()
-		i=i+1
-
-	print ("Records trimmed:%d" % i )
-	return SRHData
-
-###############################################################################
-def injector(outFilePtr, currentRecordTimeStamp, TypeOfDatagram, injectionData, counter, injectHeight=False, lastHeightTimeStamp=0):
-	'''inject data into the output file and pop the record from the injector'''
-	if len(injectionData) == 0:
-		return counter, lastHeightTimeStamp
-	recordsToAdd = []
-	while ((len(injectionData) > 0) and (float(injectionData[0][0]) <= currentRecordTimeStamp)):
-		# limit the data to be injected to within 2 seconds of the current record.  If not we can get thousands of records at start of file.
-		if (currentRecordTimeStamp - float(injectionData[0][0])) < 2:
-			recordsToAdd.append(injectionData.popleft())
-		else:
-			injectionData.popleft()
-
-	if TypeOfDatagram == 'P':
-		if len(recordsToAdd) > 0:
-			# counter = counter + 1
-			for record in recordsToAdd:
-				recordDate = from_timestamp(record[0])
-				recordTime = int(pyall.dateToSecondsSinceMidnight(recordDate)*1000)
-				recordDate = int(pyall.dateToKongsbergDate(recordDate))
-
-				# firstRecordTimestamp = float(recordsToAdd[0][0]) #we need to know the first record timestamp as all observations are milliseconds from that time
-				# firstRecordDate = from_timestamp(firstRecordTimestamp)
-				# recordDate = int(dateToKongsbergDate(firstRecordDate))
-				# recordTime = int(dateToSecondsSinceMidnight(firstRecordDate)*1000)
-
-				counter = record[1]
-				latitude = record[2]
-				longitude = record[3]
-				quality = record[4]
-				speedOverGround = record[5]
-				courseOverGround = record[6]
-				heading = record[7]
-				descriptor = record[8]
-				nBytesDatagram = record[9]
-				data = record[10]
-				pos = pyall.P_POSITION_ENCODER()
-				datagram = pos.encode(recordDate, recordTime, counter, latitude, longitude, quality, speedOverGround, courseOverGround, heading, descriptor, nBytesDatagram, data)
-
-				outFilePtr.write(datagram)
-
-	if TypeOfDatagram == 'A':
-		if len(recordsToAdd) > 0:
-			# counter = counter + 1
-			a = pyall.A_ATTITUDE_ENCODER()
-			datagram = a.encode(recordsToAdd, counter)
-			outFilePtr.write(datagram)
-
-			if injectHeight:
-				# lastTimeStamp = 0
-				h = pyall.h_HEIGHT_ENCODER()
-				for rec in recordsToAdd:
-					ts = float(rec[0])
-					if (ts - lastHeightTimeStamp) > 1.0: #only write 1 height record per 1 seconds second to save space.
-						firstRecordDate = from_timestamp(ts)
-						recordDate = int(pyall.dateToKongsbergDate(firstRecordDate))
-						recordTime = int(pyall.dateToSecondsSinceMidnight(firstRecordDate)*1000)
-						height = float(rec[5])
-
-						datagram = h.encode(height, recordDate, recordTime, counter)
-						outFilePtr.write(datagram)
-						counter = counter + 1
-						lastHeightTimeStamp = ts
-	# resent the counter so it never overflowa the 16 bit number in the .all datagram field
-	if counter > 65536:
-		counter = 0
-	return counter, lastHeightTimeStamp
-
 # ###############################################################################
 # def loadSRHFile(fileName):
 #	 '''the SRH file format is the KOngsberg PFreeHeave binary file format'''
@@ -1302,46 +1432,59 @@ def createOutputFileName(path, ext=""):
 
 	return os.path.join(dir, candidate)
 
+###############################################################################
+class cSettings:
+	'''the settings and loaded injection data shared by every file we process, so they can be handed to the worker processes in one go'''
+	def __init__(self, **settings):
+		self.__dict__.update(settings)
+
 ###############################################################################
 class cMBESHead:
 	def __init__(self, ID):
 		self.ID = ID
-		self.beamSum = {}
-		self.beamCount = {}
-		self.beamAngle = {}
+		# the sum and count of the deviations from the best fit line, and the latest angle, indexed by beam number
+		self.beamSum = np.zeros(0)
+		self.beamCount = np.zeros(0, dtype=np.int64)
+		self.beamAngle = np.zeros(0)
 		self.installationParameters = ''
 		self.installationRollAngle = 0
 
+	def resize(self, numberOfBeams):
+		'''make sure the per beam arrays have room for numberOfBeams beams'''
+		extra = numberOfBeams - len(self.beamCount)
+		if extra > 0:
+			self.beamSum = np.concatenate((self.beamSum, np.zeros(extra)))
+			self.beamCount = np.concatenate((self.beamCount, np.zeros(extra, dtype=np.int64)))
+			self.beamAngle = np.concatenate((self.beamAngle, np.zeros(extra)))
+
+	def addResiduals(self, beamNumber, residual, beamAngle):
+		'''add the deviation of each beam in a ping from the best fit line into the per beam sums'''
+		beamNumber = np.asarray(beamNumber, dtype=np.int64)
+		if len(beamNumber) == 0:
+			return
+		self.resize(int(beamNumber.max()) + 1)
+		self.beamSum += np.bincount(beamNumber, weights=residual, minlength=len(self.beamSum))
+		self.beamCount += np.bincount(beamNumber, minlength=len(self.beamCount))
+		self.beamAngle[beamNumber] = beamAngle
+
 ###############################################################################
 class cPing:
 	def __init__(self, NumBeams, installationRollAngle=0):
 		self.NumReceiveBeams = NumBeams
 		self.installationRollAngle = installationRollAngle
 		self.SoundSpeedAtTransducer = 1500
-		self.BeamNumber						= [0 for i in range(self.NumReceiveBeams)]
-		self.BeamPointingAngle				= [0 for i in range(self.NumReceiveBeams)]
-		self.TransmitSectorNumber			= [0 for i in range(self.NumReceiveBeams)]
-		self.DetectionInfo					= [0 for i in range(self.NumReceiveBeams)]
-		self.DetectionWindow				= [0 for i in range(self.NumReceiveBeams)]
-		self.QualityFactor					= [0 for i in range(self.NumReceiveBeams)]
-		self.TwoWayTravelTime				= [0 for i in range(self.NumReceiveBeams)]
-		self.SlantRange						= [0 for i in range(self.NumReceiveBeams)]
-		self.Reflectivity					= [0 for i in range(self.NumReceiveBeams)]
-		self.RealtimeCleaningInformation	= [0 for i in range(self.NumReceiveBeams)]
-		self.Dx								= [0 for i in range(self.NumReceiveBeams)]
-		self.Dy								= [0 for i in range(self.NumReceiveBeams)]
-		self.Dz								= [0 for i in range(self.NumReceiveBeams)]
+		# the caller sets the beam arrays from the datagram, and calcDepth() adds the SlantRange, Dy and Dz arrays
+		self.BeamNumber = None
+		self.BeamPointingAngle = None
+		self.TwoWayTravelTime = None
 
 	def calcDepth(self):
-		for i in range(self.NumReceiveBeams):
-			try:
-				self.SlantRange[i] = self.TwoWayTravelTime[i] * 0.5 * (self.SoundSpeedAtTransducer -20)
-				# radAngle=math.radians(self.installationRollAngle - self.BeamPointingAngle[i] - self.installationRollAngle)
-				radAngle=math.radians(90 - self.installationRollAngle - self.BeamPointingAngle[i])
-				self.Dy[i] = math.cos(radAngle) * self.SlantRange[i]
-				self.Dz[i] = math.sin(radAngle) * self.SlantRange[i]
-			except:
-				print("ffF")
+		'''compute the across track distance and depth of every beam in one go'''
+		self.SlantRange = np.asarray(self.TwoWayTravelTime, dtype=np.float64) * 0.5 * (self.SoundSpeedAtTransducer -20)
+		# radAngle=math.radians(self.installationRollAngle - self.BeamPointingAngle[i] - self.installationRollAngle)
+		radAngle = np.radians(90 - self.installationRollAngle - np.asarray(self.BeamPointingAngle, dtype=np.float64))
+		self.Dy = np.cos(radAngle) * self.SlantRange
+		self.Dz = np.sin(radAngle) * self.SlantRange
 ###############################################################################
 class cWobble:
 	def __init__(self):
@@ -1380,14 +1523,199 @@ class cTimeSeries:
 	def getValueAt(self, timestamp):
 		return np.interp(timestamp, self.times, self.values, left=None, right=None)
 
+###############################################################################
+class cInjector:
+	'''inject the time stamped records from the ASCII or SRH files into the conditioned file as 'A' attitude datagrams (optionally with 'h' height datagrams) or 'P' position datagrams.  The records are sorted once into a numpy array of timestamps, so finding the records which belong before each .all datagram is a binary search, and each batch of attitude is encoded in one go'''
+	def __init__(self, typeOfDatagram, records, injectHeight=False, strings=None):
+		self.typeOfDatagram = typeOfDatagram
+		self.injectHeight = injectHeight
+		# the readers give us an array with a row per record and the timestamp in the first column
+		records = np.asarray(records, dtype=np.float64)
+		order = np.argsort(records[:, 0], kind='stable')
+		self.records = records[order]
+		self.timestamps = self.records[:, 0]
+		self.recordDates, self.recordTimes = pyall.to_KongsbergDateTimes(self.timestamps)
+		self.strings = None if strings is None else [strings[i] for i in order]
+		self.rewind()
+
+	def rewind(self, timestamp=None):
+		'''start injecting from the first record, or from 1 second before the timestamp, e.g. the first datagram in the .all file'''
+		self.position = 0
+		self.counter = 0
+		self.lastHeightTimeStamp = 0
+		if timestamp is not None:
+			print ("Trimming unwanted records up to 1 second before start of .all first record timestamp..." )
+			self.position = int(np.searchsorted(self.timestamps, timestamp - 1.0, side='left'))
+			print ("Records trimmed:%d" % self.position)
+		self.setNextTimestamp()
+
+	def setNextTimestamp(self):
+		# most .all datagrams have nothing to inject before them, so keep the next timestamp handy as a plain float
+		if self.position < len(self.timestamps):
+			self.nextTimestamp = float(self.timestamps[self.position])
+		else:
+			self.nextTimestamp = math.inf
+
+	def inject(self, outFilePtr, currentRecordTimeStamp):
+		'''write out the records up to and including the timestamp of the current .all datagram.  returns the number of records injected'''
+		if self.nextTimestamp > currentRecordTimeStamp:
+			return 0
+		end = int(np.searchsorted(self.timestamps, currentRecordTimeStamp, side='right'))
+		# limit the data to be injected to within 2 seconds of the current record.  If not we can get thousands of records at start of file.
+		start = max(self.position, int(np.searchsorted(self.timestamps, currentRecordTimeStamp - 2, side='right')))
+		self.position = end
+		self.setNextTimestamp()
+		if start >= end:
+			return 0
+
+		if self.typeOfDatagram == 'A':
+			self.injectAttitude(outFilePtr, start, end)
+		if self.typeOfDatagram == 'P':
+			self.injectPosition(outFilePtr, start, end)
+
+		# reset the counter so it never overflows the 16 bit number in the .all datagram field
+		if self.counter > 65536:
+			self.counter = 0
+		return end - start
+
+	def injectAttitude(self, outFilePtr, start, end):
+		a = pyall.A_ATTITUDE_ENCODER()
+		outFilePtr.write(a.encode(self.records[start:end], self.counter))
+
+		if self.injectHeight:
+			# only write 1 height record per second to save space.  jump straight to the next record more than a second after the last height
+			h = pyall.h_HEIGHT_ENCODER()
+			i = start
+			while True:
+				i = max(i, int(np.searchsorted(self.timestamps, self.lastHeightTimeStamp + 1.0, side='right')))
+				if i >= end:
+					break
+				outFilePtr.write(h.encode(self.records[i, 5], self.recordDates[i], self.recordTimes[i], self.counter))
+				self.counter = self.counter + 1
+				self.lastHeightTimeStamp = float(self.timestamps[i])
+				i += 1
+
+	def injectPosition(self, outFilePtr, start, end):
+		pos = pyall.P_POSITION_ENCODER()
+		for i in range(start, end):
+			# timestamp, counter, latitude, longitude, quality, speedOverGround, courseOverGround, heading, descriptor, nBytesDatagram, data
+			record = self.records[i]
+			self.counter = int(record[1])
+			data = "" if self.strings is None else self.strings[i]
+			outFilePtr.write(pos.encode(self.recordDates[i], self.recordTimes[i], self.counter, *record[2:8], int(record[8]), int(record[9]), data))
+
+###############################################################################
+def injectionWindow(fileNames, memoryMap=False, margin=10.0):
+	'''the time span covered by the .all files, from their datagram indexes, plus a margin either side.  only the injection records inside this window can ever be injected'''
+	first = math.inf
+	last = -math.inf
+	for fileName in fileNames:
+		r = pyall.ALLReader(fileName, memoryMap)
+		r.loadIndex()
+		if len(r.indexTimestamps) > 0:
+			first = min(first, float(r.indexTimestamps.min()))
+			last = max(last, float(r.indexTimestamps.max()))
+		r.close()
+	if first > last:
+		return None
+	print ("Injection window: %s to %s" % (pyall.from_timestamp(first - margin), pyall.from_timestamp(last + margin)))
+	return (first - margin, last + margin)
+
+def windowRows(timestamps, window=None):
+	'''the slice of the time ordered records which fall inside the window'''
+	if window is None:
+		return slice(0, len(timestamps))
+	return slice(int(np.searchsorted(timestamps, window[0], side='left')), int(np.searchsorted(timestamps, window[1], side='right')))
+
+def lineAt(f, position, dataStart):
+	'''the offset and timestamp of the first line in a CSV file starting at or after the position.  the end of the file and blank lines sort after everything'''
+	if position > dataStart:
+		f.seek(position - 1)
+		f.readline()
+	else:
+		f.seek(position)
+	offset = f.tell()
+	line = f.readline()
+	if len(line.strip()) == 0:
+		return offset, math.inf
+	return offset, float(line.split(b',', 1)[0])
+
+def findLine(f, timestamp, lo, hi, side='left'):
+	'''binary search the bytes of a time ordered CSV file for the offset of the first line at or after the timestamp (side='left'), or after it (side='right')'''
+	dataStart = lo
+	while lo < hi:
+		mid = (lo + hi) // 2
+		offset, lineTime = lineAt(f, mid, dataStart)
+		if lineTime > timestamp or (side == 'left' and lineTime == timestamp):
+			hi = mid
+		else:
+			lo = mid + 1
+	return lineAt(f, lo, dataStart)[0]
+
+def readWindow(filename, window=None):
+	'''read the data lines of a time ordered CSV file which fall inside the window, so a file covering days we are not conditioning costs a handful of seeks'''
+	with open(filename, 'rb') as f:
+		f.readline() # skip the header
+		dataStart = f.tell()
+		fileSize = os.fstat(f.fileno()).st_size
+		start = dataStart
+		end = fileSize
+		if window is not None:
+			start = findLine(f, window[0], dataStart, fileSize, 'left')
+			end = findLine(f, window[1], start, fileSize, 'right')
+		f.seek(start)
+		lines = f.read(end - start).decode().splitlines()
+	return lines
+
+def loadCachedFile(filename, parse, window=None):
+	'''parse an injection file into numpy arrays, or load the arrays from the .npz sidecar if the file has not changed since we last parsed it.  the sidecar holds the whole file, so it serves whatever window the next run asks for.  the caller picks the rows inside the window'''
+	cacheFileName = filename + ".npz"
+	arrays = pyall.loadCache(cacheFileName, filename)
+	if arrays is None:
+		if os.access(os.path.dirname(os.path.abspath(cacheFileName)), os.W_OK):
+			arrays = parse(readWindow(filename))
+			pyall.saveCache(cacheFileName, filename, **arrays)
+		else:
+			# read only media, so there is nowhere to keep a sidecar.  only read the lines inside the window
+			arrays = parse(readWindow(filename, window))
+	return arrays
+
+###############################################################################
+def mergeOrder(timestamps, fileIds, overlap="all", descriptors=None):
+	'''the order in which to read the records loaded from several files so they come out in time order.  this is an eager sort of every record already loaded into memory, not a streaming merge; the injector needs the whole array to search anyway.  the sort is stable, so records with the same timestamp stay in file order.  with overlap 'first' or 'last', where records from different files share a timestamp (and descriptor, for positions) only those from the first or last of the files are kept, so where two files overlap the earlier or later file wins.  repeated timestamps within one file are never dropped'''
+	order = np.argsort(timestamps, kind='stable')
+	if overlap == "all" or len(order) == 0:
+		return order
+	# group the records by timestamp and descriptor.  lexsort is stable too, so each group is in file order
+	if descriptors is None:
+		groupOrder = order
+		newGroup = timestamps[groupOrder][1:] != timestamps[groupOrder][:-1]
+	else:
+		groupOrder = np.lexsort((descriptors, timestamps))
+		newGroup = (timestamps[groupOrder][1:] != timestamps[groupOrder][:-1]) | (descriptors[groupOrder][1:] != descriptors[groupOrder][:-1])
+	starts = np.flatnonzero(np.concatenate(([True], newGroup)))
+	groups = np.cumsum(np.concatenate(([True], newGroup))) - 1
+	groupFileIds = fileIds[groupOrder]
+	if overlap == "first":
+		keptFileIds = groupFileIds[starts]
+	else:
+		keptFileIds = groupFileIds[np.append(starts[1:] - 1, len(groupOrder) - 1)]
+	keep = np.zeros(len(order), dtype=bool)
+	keep[groupOrder[groupFileIds == keptFileIds[groups]]] = True
+	if not keep.all():
+		print ("Overlapping records removed: %d" % (len(keep) - np.count_nonzero(keep)))
+	return order[keep[order]]
+
 ###############################################################################
 class POSITIONReader:
 	'''class to read a Guardian Position file'''
-	'''This class may need to read multiple txt files, merge them, sort and provide rapid access using the bisect tools in python'''
+	'''This class may need to read multiple txt files, merge them and sort them.  The numbers are held in one array with a row per record, the raw position strings alongside'''
 	def __init__(self):
-		self.PositionData = deque()
+		# timestamp, counter, latitude, longitude, quality, speedOverGround, courseOverGround, heading, descriptor, nBytes
+		self.PositionData = np.empty((0, 10), dtype=np.float64)
+		self.PositionStrings = np.empty(0, dtype=str)
 
-	def loadFiles(self, filename):
+	def loadFiles(self, filename, overlap="all", window=None):
 		matches = []
 		if os.path.exists(filename):
 			matches.append (os.path.abspath(filename))
@@ -1400,43 +1728,43 @@ class POSITIONReader:
 			print ("Nothing found in %s to condition, quitting" % filename)
 			exit()
 		print ("Loading Position Files:")
+		# the number of records from each file, so the merge knows which file each record came from
+		counts = []
 		for f in matches:
-			self.loadfile(f)
+			rows = len(self.PositionData)
+			self.loadfile(f, window)
+			counts.append(len(self.PositionData) - rows)
+		fileIds = np.repeat(np.arange(len(counts)), counts)
+		order = mergeOrder(self.PositionData[:, 0], fileIds, overlap, descriptors=self.PositionData[:, 8])
+		self.PositionData = self.PositionData[order]
+		self.PositionStrings = self.PositionStrings[order]
 		return
 
-	def loadfile(self, filename):
+	def loadfile(self, filename, window=None):
 		if not os.path.isfile(filename):
 			print ("Position file not found:", filename)
 			return
 		print (filename)
-		with open(filename, 'r') as csvfile:
-				reader = csv.reader(csvfile, delimiter=',', quotechar='|')
-				header = next(reader)
-				for row in reader:
-					# convert the caris generic data parser format into a regular timestamp
-					# d = pyall.to_DateTime(row[0], float(row[1]))
-					# timestamp = pyall.to_timestamp(d)
-					timestamp 		= float(row[0])
-					counter			= int(row[1])
-					latitude		= float(row[2])
-					longitude		= float(row[3])
-					quality 		= float(row[4])
-					speedOverGround = float(row[5])
-					courseOverGround= float(row[6])
-					heading 		= float(row[7])
-					descriptor 		= int(row[8])
-					nBytes 			= int(row[9])
-					data 			= ','.join(row[10:]) #read & join to end of line
-					self.PositionData.append([timestamp, counter, latitude, longitude, quality, speedOverGround, courseOverGround, heading, descriptor, nBytes, data])
+		arrays = loadCachedFile(filename, self.parse, window)
+		rows = windowRows(arrays['PositionData'][:, 0], window)
+		self.PositionData = np.concatenate((self.PositionData, arrays['PositionData'][rows]))
+		self.PositionStrings = np.concatenate((self.PositionStrings, arrays['PositionStrings'][rows]))
+
+	def parse(self, lines):
+		'''parse the numeric columns in one go.  the raw datagram at the end of each line has commas of its own, so split it off separately'''
+		data = np.loadtxt(lines, delimiter=',', usecols=range(10), ndmin=2, comments=None) if len(lines) > 0 else np.empty((0, 10))
+		strings = [line.split(',', 10)[10] if line.count(',') >= 10 else "" for line in lines if line.strip()]
+		return {'PositionData': data, 'PositionStrings': np.array(strings, dtype=str)}
 
 ###############################################################################
 class ATTReader:
 	'''class to read a Guardian Attitude file'''
-	'''This class may need to read multiple txt files, merge them, sort and provide rapid access using the bisect tools in python'''
+	'''This class may need to read multiple txt files, merge them and sort them.  The records are held in one array with a row per record'''
 	def __init__(self):
-		self.ATTData = deque()
+		# timestamp, roll, pitch, heave, heading, height
+		self.ATTData = np.empty((0, 6), dtype=np.float64)
 
-	def loadFiles(self, filename):
+	def loadFiles(self, filename, overlap="all", window=None):
 		matches = []
 		if os.path.exists(filename):
 			matches.append (os.path.abspath(filename))
@@ -1449,64 +1777,46 @@ class ATTReader:
 			print ("Nothing found in %s to condition, quitting" % filename)
 			exit()
 		print ("Loading Attitude Files:")
+		# the number of records from each file, so the merge knows which file each record came from
+		counts = []
 		for f in matches:
-			self.loadfile(f)
+			rows = len(self.ATTData)
+			self.loadfile(f, window)
+			counts.append(len(self.ATTData) - rows)
+		fileIds = np.repeat(np.arange(len(counts)), counts)
+		order = mergeOrder(self.ATTData[:, 0], fileIds, overlap)
+		self.ATTData = self.ATTData[order]
 		return
 
-	def loadfile(self, filename):
+	def loadfile(self, filename, window=None):
 		if not os.path.isfile(filename):
 			print ("Attitude file not found:", filename)
 			return
 		print (filename)
-		with open(filename, 'r') as csvfile:
-				reader = csv.reader(csvfile, delimiter=',', quotechar='|')
-				header = next(reader)
-				for row in reader:
-					# convert the caris generic data parser format into a regular timestamp
-					# d = pyall.to_DateTime(row[0], float(row[1]))
-					# timestamp = pyall.to_timestamp(d)
-					timestamp = float(row[0])
-					roll	= float(row[1])
-					pitch	= float(row[2])
-					heave	= float(row[3])
-					heading = float(row[4])
-					if len(row) > 4:
-						height = float(row[5])
-						self.ATTData.append([timestamp, roll, pitch, heave, heading, height])
-					else:
-						self.ATTData.append([timestamp, roll, pitch, heave, heading, 0.000])
-
-					# roll	= float(row[2])
-					# pitch	= float(row[3])
-					# heave	= float(row[4])
-					# heading = float(row[5])
-					# self.ATTData.append([timestamp, roll, pitch, heave, heading])
-
-		# fileptr = open(filename, 'r')
-		# fileSize = os.path.getsize(filename)
-		# try:
-		# 	while True:
-		# 		data = fileptr.read(self.SRHPacket_len)
-		# 		if not data: break
-		# 		s = self.SRHPacket_unpack(data)
-		# 		timestamp = float(s[3]) + (s[4] * 0.0001)
-		# 		heave = float(s[5]) * 0.01
-		# 		self.SRHData.append([timestamp, heave])
-		# 		# print (from_timestamp(timestamp), heave)
-		# except struct.error:
-		# 	print ("Exception loading Attitude file.  Will process as much as can be read")
+		arrays = loadCachedFile(filename, self.parse, window)
+		rows = windowRows(arrays['ATTData'][:, 0], window)
+		self.ATTData = np.concatenate((self.ATTData, arrays['ATTData'][rows]))
+
+	def parse(self, lines):
+		'''parse the CSV lines in one go.  files without the height column get a height of zero'''
+		data = np.loadtxt(lines, delimiter=',', ndmin=2, comments=None) if len(lines) > 0 else np.empty((0, 6))
+		ATTData = np.zeros((len(data), 6), dtype=np.float64)
+		columns = min(data.shape[1], 6)
+		ATTData[:, :columns] = data[:, :columns]
+		return {'ATTData': ATTData}
 
 ###############################################################################
 class SRHReader:
 	'''class to read a Kongsberg SRH PFreeHeave file'''
-	'''This class may need to read multiple SRH files, merge them, sort and provide rapid access using the bisect tools in python'''
+	'''This class may need to read multiple SRH files, merge them and sort them.  The records are held in one array with a row per record'''
+	# pfreeheave is big endian format, '>HBBLHhBH'
+	SRHPacket_dtype = np.dtype([('Header', '>u2'), ('Status', 'u1'), ('Spare', 'u1'), ('Seconds', '>u4'), ('TenthMilliseconds', '>u2'), ('Heave', '>i2'), ('Quality', 'u1'), ('Checksum', '>u2')])
+
 	def __init__(self):
-		self.SRHPacket_fmt = '>HBBLHhBH'  #pfreeheave is big endian format
-		self.SRHPacket_len = struct.calcsize(self.SRHPacket_fmt)
-		self.SRHPacket_unpack = struct.Struct(self.SRHPacket_fmt).unpack_from
-		self.SRHData = deque()
+		# timestamp, pitch, roll, heave, heading
+		self.SRHData = np.empty((0, 5), dtype=np.float64)
 
-	def loadFiles(self, filename):
+	def loadFiles(self, filename, overlap="all", window=None):
 		matches = []
 		if os.path.exists(filename):
 			matches.append (os.path.abspath(filename))
@@ -1519,31 +1829,55 @@ class SRHReader:
 			print ("Nothing found in %s to condition, quitting" % filename)
 			exit()
 		print ("Loading SRH Files:")
+		# the number of records from each file, so the merge knows which file each record came from
+		counts = []
 		for f in matches:
-			self.loadfile(f)
+			rows = len(self.SRHData)
+			self.loadfile(f, window)
+			counts.append(len(self.SRHData) - rows)
+		fileIds = np.repeat(np.arange(len(counts)), counts)
+		order = mergeOrder(self.SRHData[:, 0], fileIds, overlap)
+		self.SRHData = self.SRHData[order]
 		return
 
-	def loadfile(self, filename):
+	def loadfile(self, filename, window=None):
+		'''decode the packets inside the window with one read.  the file is mapped as an array of packets, so the window is found with a binary search that reads one packet at a time.  the binary file is as quick to read as a cache would be, so there is no sidecar for SRH'''
 		if not os.path.isfile(filename):
 			print ("SRH file not found:", filename)
 			return
-		fileptr = open(filename, 'rb')
-		fileSize = os.path.getsize(filename)
 		print (filename)
-		roll=0.0
-		pitch=0.0
-		heading=0.0
-		try:
-			while True:
-				data = fileptr.read(self.SRHPacket_len)
-				if not data: break
-				s = self.SRHPacket_unpack(data)
-				timestamp = float(s[3]) + (s[4] * 0.0001)
-				heave = float(s[5]) * 0.01 #heave in metres
-				self.SRHData.append([timestamp, pitch, roll, heave, heading]) #for consistency send all attitude values even if they are empty
-				# print (from_timestamp(timestamp), heave)
-		except struct.error:
+		count = os.path.getsize(filename) // self.SRHPacket_dtype.itemsize
+		if count * self.SRHPacket_dtype.itemsize != os.path.getsize(filename):
 			print ("Exception loading SRH file.  Will process as much as can be read")
+		if count == 0:
+			return
+		packets = np.memmap(filename, dtype=self.SRHPacket_dtype, mode='r', shape=(count,))
+		if window is not None:
+			first = self.searchPackets(packets, window[0], 'left')
+			last = self.searchPackets(packets, window[1], 'right', first)
+			packets = packets[first:last]
+		packets = np.array(packets)
+		#for consistency send all attitude values even if they are empty
+		SRHData = np.zeros((len(packets), 5), dtype=np.float64)
+		SRHData[:, 0] = self.packetTimes(packets)
+		SRHData[:, 3] = packets['Heave'] * 0.01 #heave in metres
+		self.SRHData = np.concatenate((self.SRHData, SRHData))
+
+	def packetTimes(self, packets):
+		'''the time of each packet in seconds'''
+		return packets['Seconds'] + (packets['TenthMilliseconds'] * 0.0001)
+
+	def searchPackets(self, packets, timestamp, side, lo=0):
+		'''where the timestamp goes in the time ordered packets, like np.searchsorted.  only the packets the binary search visits are read from the file, so a small window of a big file stays cheap'''
+		hi = len(packets)
+		while lo < hi:
+			mid = (lo + hi) // 2
+			packetTime = self.packetTimes(packets[mid:mid+1])[0]
+			if packetTime < timestamp or (side == 'right' and packetTime == timestamp):
+				lo = mid + 1
+			else:
+				hi = mid
+		return lo
 
 ###############################################################################
 if __name__ == "__main__":